@@ -1,26 +1,47 @@
 from sqlalchemy import create_engine
+from sqlalchemy.ext.asyncio import create_async_engine, async_sessionmaker
 from sqlalchemy.orm import declarative_base, sessionmaker
-import os
-from dotenv import load_dotenv
+from app.utils import db_pool
+from app.config.settings import get_settings
 
-load_dotenv()  # Load environment variables from a .env file if present
 
-# Database configuration
-driver = os.getenv("DB_DRIVER")
-host = os.getenv("DB_HOST")
-username = os.getenv("DB_USERNAME")
-password = os.getenv("DB_PASSWORD")
-port = os.getenv("DB_PORT")
-database_name = os.getenv("DB_NAME")
+# Function to build the pool related engine arguments from the settings
+def engine_options(is_async: bool = False):
+    settings = get_settings()
+    if settings.db_pool_mode == "pgbouncer":
+        options = {
+            "poolclass": db_pool.InstrumentedAsyncNullPool if is_async else db_pool.InstrumentedNullPool,
+            "pool_pre_ping": settings.db_pool_pre_ping,
+        }
+        if is_async:
+            # asyncpg prepares statements per connection, which breaks under transaction pooling
+            options["connect_args"] = {"statement_cache_size": 0, "prepared_statement_cache_size": 0}
+        return options
+    return {
+        "poolclass": db_pool.InstrumentedAsyncAdaptedQueuePool if is_async else db_pool.InstrumentedQueuePool,
+        "pool_size": settings.db_pool_size,
+        "max_overflow": settings.db_pool_max_overflow,
+        "pool_timeout": settings.db_pool_timeout,
+        "pool_recycle": settings.db_pool_recycle,
+        "pool_pre_ping": settings.db_pool_pre_ping,
+    }
 
-# Database URL
-SQLALCHEMY_DATABASE_URL = f"{driver}://{username}:{password}@{host}:{port}/{database_name}"
 
 # Create SQLAlchemy engine to connect to pgsql
-engine = create_engine(SQLALCHEMY_DATABASE_URL)
+engine = create_engine(get_settings().database_url, **engine_options())
+
+# Create async SQLAlchemy engine to connect to pgsql without blocking the event loop
+async_engine = create_async_engine(get_settings().async_database_url, **engine_options(is_async=True))
 
 # Session factory
-SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
+# expire_on_commit is disabled, a request session ends shortly after its commit and reloading every object it
+# touched on next access costs a SELECT each. Server generated values (ids, defaults) are fetched by the INSERT
+# itself through RETURNING; code that needs the state of a row after a concurrent change must query it again.
+SessionLocal = sessionmaker(autocommit=False, autoflush=False, expire_on_commit=False, bind=engine)
+
+# Async session factory
+# expire_on_commit is disabled because expired attributes cannot be lazily reloaded inside a coroutine
+AsyncSessionLocal = async_sessionmaker(autoflush=False, expire_on_commit=False, bind=async_engine)
 
 # Base class for our application's models
 Base = declarative_base()
@@ -34,3 +55,11 @@ def get_db():
         yield db
     finally:
         db.close()
+
+
+# Function to get async session to the database
+
+
+async def get_async_db():
+    async with AsyncSessionLocal() as db:
+        yield db
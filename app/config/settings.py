@@ -0,0 +1,317 @@
+"""Application settings, read once from the environment and the .env file at the root of the project
+(environment variables win).
+
+Fields are named after their environment variable (lower case) and validated on load, a missing or malformed
+value fails at startup rather than on first use. Code reads them with get_settings().<field> when it needs
+them, routes can take them as a dependency, `settings: Settings = Depends(get_settings)`. Values read at
+import time (engine, pool and cache sizes, routers, rate limits) only take effect on the next start.
+
+Tests override them without reimporting anything:
+
+    with override_settings(force_email_verification=False):
+        ...
+"""
+from contextlib import contextmanager
+from pathlib import Path
+from typing import Annotated, Optional
+import math
+import os
+from pydantic import field_validator, model_validator
+from pydantic_settings import BaseSettings, NoDecode, SettingsConfigDict
+
+
+ENV_FILE = Path(__file__).resolve().parents[2] / ".env"
+
+
+# CPUs this process may use: the affinity mask, capped by the cgroup CPU quota of the container (v2, then v1)
+def cpu_limit():
+    cpus = len(os.sched_getaffinity(0)) if hasattr(os, "sched_getaffinity") else os.cpu_count() or 1
+    quota = None
+    try:
+        with open("/sys/fs/cgroup/cpu.max") as cpu_max:
+            limit, period = cpu_max.read().split()
+            if limit != "max":
+                quota = int(limit) / int(period)
+    except (OSError, ValueError):
+        try:
+            with open("/sys/fs/cgroup/cpu/cpu.cfs_quota_us") as limit, open("/sys/fs/cgroup/cpu/cpu.cfs_period_us") as period:
+                limit, period = int(limit.read()), int(period.read())
+                if limit > 0:
+                    quota = limit / period
+        except (OSError, ValueError):
+            pass
+    return min(cpus, max(1, math.ceil(quota))) if quota else cpus
+
+
+class Settings(BaseSettings):
+    model_config = SettingsConfigDict(env_file=ENV_FILE, env_file_encoding="utf-8", extra="ignore")
+
+    # Application configuration
+    api_name: Optional[str] = None
+    force_email_verification: bool = True
+    force_https: bool = False
+    base_url: str = "http://localhost:8000"
+    allowed_hosts: Annotated[list[str], NoDecode] = ["*"]
+
+    # Database configuration
+    db_driver: str
+    db_host: str
+    db_username: str
+    db_password: str
+    db_port: str
+    db_name: str
+    # Set DB_ASYNC_MODE=True to serve the auth and user routes with the async engine
+    db_async_driver: str = "postgresql+asyncpg"
+    db_async_mode: bool = False
+
+    # Connection pool configuration
+    # DB_POOL_MODE=queue keeps a pool of connections per process,
+    # DB_POOL_MODE=pgbouncer disables local pooling (NullPool) and prepared statement caches
+    # so that connections can be multiplexed by PgBouncer in transaction pooling mode
+    db_pool_mode: str = "queue"
+    db_pool_size: int = 5
+    db_pool_max_overflow: int = 10
+    db_pool_timeout: float = 30
+    db_pool_recycle: int = 1800
+    db_pool_pre_ping: bool = True
+
+    # LISTEN / NOTIFY needs a session level connection, which PgBouncer in transaction pooling mode cannot provide.
+    # Point DB_LISTEN_HOST / DB_LISTEN_PORT at Postgres itself when DB_HOST is a PgBouncer (default to DB_HOST / DB_PORT).
+    db_listen_host: Optional[str] = None
+    db_listen_port: Optional[str] = None
+
+    # OAuth2 configuration
+    oauth2_secret_key: str
+    oauth2_algorithm: str
+    oauth2_access_token_expire_minutes: int
+    # Active sessions kept per user, the oldest ones are evicted on login (0 disables the cap)
+    max_sessions_per_user: int = 10
+    # Seconds after a rotation during which presenting the rotated refresh token again is refused without revoking
+    # its family: clients refreshing from several tabs at once would otherwise log themselves out
+    refresh_token_reuse_grace_seconds: int = 30
+
+    # Password hashing configuration
+    # Raising BCRYPT_ROUNDS takes effect on the next successful login of each user, stored hashes are upgraded transparently
+    bcrypt_rounds: int = 12
+    # Number of processes dedicated to hashing in each server worker, 0 hashes inline in the calling thread.
+    # Defaults to the available CPUs shared among the server workers, so that the pools of all the workers
+    # together do not oversubscribe the container.
+    hashing_workers: Optional[int] = None
+    # Maximum number of hashing operations queued or running in each server worker before its requests are
+    # rejected with 503 (the instance as a whole accepts server_workers times as many)
+    hashing_max_queue: int = 64
+
+    # Cache configuration
+    # REDIS_URL enables the shared cache tier, "memory://" uses an in-process fake (handy for tests)
+    redis_url: Optional[str] = None
+    user_cache_enabled: bool = True
+    # Keep the TTL short, other processes only drop their in-process entry once it expires
+    user_cache_ttl: int = 60
+    user_cache_max_size: int = 10000
+    # GET /plans is served from an in-process copy of the active plans, reloaded when the plans table changes.
+    # PLANS_CACHE_REFRESH_SECONDS bounds its staleness should a change notification be missed.
+    plans_cache_refresh_seconds: int = 300
+    # max-age of the Cache-Control header of GET /plans, clients revalidate with If-None-Match afterwards
+    plans_cache_max_age_seconds: int = 60
+    # Entitlements (subscribed plan) resolved by require_feature / require_plan, keyed by user id.
+    # Subscription changes invalidate the entries of every process, the TTL only bounds missed invalidations.
+    entitlement_cache_enabled: bool = True
+    entitlement_cache_ttl: int = 300
+    entitlement_cache_max_size: int = 10000
+
+    # Email configuration
+    email_api_host: Optional[str] = None
+    email_api_key: Optional[str] = None
+    # Both endpoints can be pointed at a local stub of the provider (see scripts/email_api_stub.py)
+    email_api_endpoint: Optional[str] = None
+    email_api_batch_endpoint: Optional[str] = None
+    email_from: Optional[str] = None
+    email_from_name: Optional[str] = None
+    # Default to EMAIL_FROM / EMAIL_FROM_NAME
+    email_reply_to: Optional[str] = None
+    email_reply_to_name: Optional[str] = None
+
+    # Outbox dispatcher configuration
+    # Run the dispatcher inside the API process, otherwise run `python -m app.tasks.email_dispatcher`
+    email_dispatcher_enabled: bool = False
+    email_dispatch_interval_seconds: float = 2
+    # Emails sent per provider batch request
+    email_dispatch_batch_size: int = 100
+    # Seconds a claimed email stays invisible to other dispatchers, a crashed dispatcher's emails are retried after it
+    email_dispatch_lease_seconds: int = 60
+    # Delivery attempts before an email is moved to the dead letter jobs
+    email_max_attempts: int = 5
+    # Delay before the first retry, doubled on every further attempt up to EMAIL_RETRY_MAX_BACKOFF_SECONDS
+    email_retry_backoff_seconds: int = 30
+    email_retry_max_backoff_seconds: int = 3600
+    email_http_timeout_seconds: float = 10
+    email_http_max_connections: int = 10
+
+    # Job queue configuration, workers are started with `python -m app.tasks.jobs worker`
+    job_queues: Annotated[list[str], NoDecode] = ["default", "email"]
+    # Defaults to the CPUs available to the container
+    job_worker_processes: Optional[int] = None
+    # Jobs claimed per worker in a single statement
+    job_batch_size: int = 10
+    # Seconds a claimed job stays invisible to other workers, the job is retried after it if its worker crashed
+    job_visibility_timeout_seconds: int = 300
+    # Idle workers wait for a NOTIFY, this is only the fallback poll for jobs whose run_at has come
+    job_poll_interval_seconds: float = 5
+    # Delay before the first retry, doubled on every further attempt up to JOB_RETRY_MAX_BACKOFF_SECONDS
+    job_retry_backoff_seconds: int = 10
+    job_retry_max_backoff_seconds: int = 3600
+
+    # Retention configuration for expired sessions, verification tokens and delivered emails
+    # Run the reaper periodically inside the API process, it can also be run as `python -m app.tasks.reaper`
+    reaper_enabled: bool = False
+    reaper_interval_seconds: int = 300
+    reaper_batch_size: int = 5000
+    # Upper bound of batches deleted per table in one run, keeps a single run from monopolizing the database
+    reaper_max_batches: int = 100
+    # Hours an expired or invalidated session / verification token is kept before being deleted
+    session_retention_hours: int = 24
+    verification_token_retention_hours: int = 24
+    # Hours a sent or dead lettered email is kept, its body holds verification and password reset links
+    email_outbox_retention_hours: int = 24
+
+    # Notification stream configuration, see GET /user/notifications/stream
+    # Seconds between comment lines sent on idle streams, keeps proxies from closing them and detects dead clients
+    notification_stream_heartbeat_seconds: float = 15
+    # Events buffered per stream, a client falling further behind is disconnected and resumes with Last-Event-ID
+    notification_stream_queue_size: int = 100
+    # Notifications replayed when resuming, a larger gap sends a reset event and the client reloads the list
+    notification_stream_resume_limit: int = 100
+    # Milliseconds an EventSource waits before reconnecting
+    notification_stream_retry_ms: int = 3000
+
+    # Rate limiting of the credential endpoints (login, registration, password reset)
+    rate_limit_enabled: bool = True
+    # "memory" counts in-process (single node), "redis" shares the counters of every node through REDIS_URL.
+    # In-process counters are per server worker too: with several workers (WEB_CONCURRENCY) a client may get up
+    # to that many times the limit, a warning is logged at startup. Use "redis" for anything but a single worker.
+    rate_limit_storage: str = "memory"
+    # Reverse proxies in front of the API appending to X-Forwarded-For, 0 uses the address of the peer
+    rate_limit_trusted_proxies: int = 0
+    # Limits as "<requests>/<seconds>" per client IP and per email address, an empty value disables the limit
+    rate_limit_login_ip: str = "30/60"
+    rate_limit_login_email: str = "10/300"
+    rate_limit_register_ip: str = "10/3600"
+    rate_limit_register_email: str = "3/3600"
+    rate_limit_forget_password_ip: str = "10/900"
+    rate_limit_forget_password_email: str = "3/900"
+
+    # Query inspector, records the statements of every request to flag N+1 patterns and slow requests (development)
+    query_inspector_enabled: bool = False
+    # Budget of routes not declaring one with @query_budget
+    query_inspector_max_queries: int = 10
+    # Requests taking longer are flagged along with their statements
+    query_inspector_max_request_seconds: float = 0.5
+    query_inspector_slow_query_seconds: float = 0.1
+    # A statement run this many times by one request (parameters aside) is reported as a suspected N+1
+    query_inspector_repeat_threshold: int = 3
+
+    # Production server configuration (gunicorn.conf.py)
+    server_bind: str = "0.0.0.0:8000"
+    # Gunicorn worker processes, 0 derives them from the CPUs available to the container (cgroup quota and affinity)
+    web_concurrency: int = 0
+    server_workers_per_cpu: float = 1
+    # Workers are recycled after that many requests, plus a random jitter so that they do not restart together
+    server_max_requests: int = 10000
+    server_max_requests_jitter: int = 1000
+    # Seconds a stopping worker keeps serving with GET /health/ready failing, for the load balancer to notice
+    server_drain_seconds: float = 5
+    # Seconds a stopping worker has in total (drain included) before it is killed
+    server_graceful_timeout: int = 30
+    # Seconds without heartbeat after which a stuck worker is killed and replaced
+    server_timeout: int = 60
+    server_keepalive: int = 5
+    # Directory where the server workers share their metrics, so that GET /metrics reports those of all the workers.
+    # gunicorn.conf.py uses a temporary directory when unset, a plain uvicorn process reports its own metrics.
+    metrics_dir: Optional[str] = None
+    # Seconds between two snapshots of the metrics of a worker to METRICS_DIR
+    metrics_snapshot_interval_seconds: float = 5
+
+    # Comma separated lists
+    @field_validator("allowed_hosts", "job_queues", mode="before")
+    @classmethod
+    def split_list(cls, value):
+        if isinstance(value, str):
+            return [item.strip() for item in value.split(",") if item.strip()]
+        return value
+
+    @field_validator("db_pool_mode", mode="before")
+    @classmethod
+    def lower_case(cls, value):
+        return value.lower() if isinstance(value, str) else value
+
+    # Defaults derived from other settings
+    @model_validator(mode="after")
+    def derive_defaults(self):
+        if self.db_listen_host is None:
+            self.db_listen_host = self.db_host
+        if self.db_listen_port is None:
+            self.db_listen_port = self.db_port
+        if self.email_api_endpoint is None:
+            self.email_api_endpoint = f"https://{self.email_api_host}/api/send/4030462"
+        if self.email_api_batch_endpoint is None:
+            self.email_api_batch_endpoint = f"https://{self.email_api_host}/api/batch/4030462"
+        if self.email_reply_to is None:
+            self.email_reply_to = self.email_from
+        if self.email_reply_to_name is None:
+            self.email_reply_to_name = self.email_from_name
+        if self.hashing_workers is None:
+            self.hashing_workers = max(1, cpu_limit() // self.server_workers)
+        if self.job_worker_processes is None:
+            self.job_worker_processes = cpu_limit()
+        return self
+
+    # Server worker processes of this instance: the ones gunicorn.conf.py started (it exports WEB_CONCURRENCY),
+    # otherwise the single process of a plain uvicorn
+    @property
+    def server_workers(self):
+        return self.web_concurrency or 1
+
+    @property
+    def database_url(self):
+        return f"{self.db_driver}://{self.db_username}:{self.db_password}@{self.db_host}:{self.db_port}/{self.db_name}"
+
+    @property
+    def async_database_url(self):
+        return (f"{self.db_async_driver}://{self.db_username}:{self.db_password}@{self.db_host}:{self.db_port}/"
+                f"{self.db_name}")
+
+    # libpq connection string of the dedicated LISTEN connections
+    @property
+    def listen_dsn(self):
+        return (f"postgresql://{self.db_username}:{self.db_password}@{self.db_listen_host}:{self.db_listen_port}/"
+                f"{self.db_name}")
+
+
+_settings: Optional[Settings] = None
+
+
+# The settings of the process, loaded on first use
+def get_settings() -> Settings:
+    global _settings
+    if _settings is None:
+        _settings = Settings()
+    return _settings
+
+
+# Loads the settings again from the environment, for a process that changed it after they were first loaded
+def reload_settings() -> Settings:
+    global _settings
+    _settings = Settings()
+    return _settings
+
+
+# Replaces settings for the duration of the block (validated like the environment), e.g. in tests
+@contextmanager
+def override_settings(**values):
+    global _settings
+    previous = get_settings()
+    _settings = Settings.model_validate({**previous.model_dump(), **values})
+    try:
+        yield _settings
+    finally:
+        _settings = previous
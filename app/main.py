@@ -1,10 +1,72 @@
-from fastapi import FastAPI, status
+from fastapi import Depends, FastAPI, status
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.responses import ORJSONResponse
+from contextlib import asynccontextmanager
 from app.routes import auth
-from app.config import api
-from app.config.api import api_name
+from app.config import database
+from app.config.settings import Settings, get_settings
 from app.routes import user
-app = FastAPI()
+from app.routes import async_auth, async_user
+from app.routes import metrics
+from app.routes import notification_stream
+from app.routes import plans
+from app.routes import entitlements
+from app.routes import health
+from app.utils.hashing import hashing_service
+from app.tasks.reaper import reaper_loop
+from app.tasks.email_dispatcher import dispatcher_loop
+from app.utils.notification_stream import notification_hub
+from app.utils.plan_catalog import plan_catalog
+from app.utils.pg_listener import pg_listener
+from app.utils.request_metrics import MetricsMiddleware, instrument_engine
+from app.utils.metrics import registry, snapshot_loop, write_snapshot
+from app.utils.query_inspector import QueryInspectorMiddleware
+import asyncio
+import logging
+
+
+logger = logging.getLogger(__name__)
+
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    settings = get_settings()
+    # Only when served by several processes: gunicorn exports its worker count as WEB_CONCURRENCY, which
+    # uvicorn --workers follows too, a single uvicorn process does not split the counters
+    if settings.rate_limit_enabled and settings.rate_limit_storage == "memory" and settings.server_workers > 1:
+        logger.warning("RATE_LIMIT_STORAGE=memory counts requests per process, the %d server workers each allow the "
+                       "full limit: set RATE_LIMIT_STORAGE=redis to share the counters", settings.server_workers)
+    await plan_catalog.start()
+    reaper_task = None
+    if settings.reaper_enabled:
+        reaper_task = asyncio.create_task(reaper_loop(settings.reaper_interval_seconds))
+    dispatcher_task = None
+    if settings.email_dispatcher_enabled:
+        dispatcher_task = asyncio.create_task(dispatcher_loop(settings.email_dispatch_interval_seconds))
+    metrics_task = None
+    if settings.metrics_dir:
+        metrics_task = asyncio.create_task(
+            snapshot_loop(settings.metrics_dir, settings.metrics_snapshot_interval_seconds))
+    yield
+    if reaper_task:
+        reaper_task.cancel()
+    if dispatcher_task:
+        dispatcher_task.cancel()
+    if metrics_task:
+        metrics_task.cancel()
+        # The requests served since the last snapshot
+        write_snapshot(settings.metrics_dir, registry.collect())
+    # End the open notification streams and the LISTEN connection
+    notification_hub.close()
+    await pg_listener.stop()
+    # Stop the password hashing worker processes
+    hashing_service.shutdown()
+    # Close the pooled database connections
+    database.engine.dispose()
+    await database.async_engine.dispose()
+
+
+app = FastAPI(lifespan=lifespan, default_response_class=ORJSONResponse)
 
 
 app.add_middleware(
@@ -14,14 +76,31 @@ app.add_middleware(
     allow_methods=["*"],
     allow_headers=["*"],
 )
+# Development aid logging the requests that go over their query budget or repeat statements (suspected N+1)
+if get_settings().query_inspector_enabled:
+    app.add_middleware(QueryInspectorMiddleware)
+# Added last so that it is the outermost middleware and times the whole request
+app.add_middleware(MetricsMiddleware)
+instrument_engine(database.engine)
+instrument_engine(database.async_engine.sync_engine)
 
-app.include_router(auth.router)
-app.include_router(user.router)
+# DB_ASYNC_MODE switches between the threadpool-bound sync routers and their async counterparts
+if get_settings().db_async_mode:
+    app.include_router(async_auth.router)
+    app.include_router(async_user.router)
+else:
+    app.include_router(auth.router)
+    app.include_router(user.router)
+app.include_router(notification_stream.router)
+app.include_router(plans.router)
+app.include_router(entitlements.router)
+app.include_router(metrics.router)
+app.include_router(health.router)
 
 
 @app.get('/', status_code=status.HTTP_200_OK)
-def read_root():
+def read_root(settings: Settings = Depends(get_settings)):
     return {
-        "message": f"Welcome to {api_name} API.",
+        "message": f"Welcome to {settings.api_name} API.",
         "docs": "/docs",
     }
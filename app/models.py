@@ -1,5 +1,5 @@
 from app.config.database import Base
-from sqlalchemy import Column, INTEGER, VARCHAR, TEXT, BOOLEAN, TIMESTAMP, ForeignKey, Enum, JSON, NUMERIC
+from sqlalchemy import Column, INTEGER, VARCHAR, TEXT, BOOLEAN, TIMESTAMP, ForeignKey, Enum, JSON, NUMERIC, LargeBinary, Index, text
 from sqlalchemy.orm import relationship
 from datetime import datetime, timezone
 
@@ -11,8 +11,10 @@ class User(Base):
     password = Column(VARCHAR(255), nullable=False)
     role = Column(VARCHAR(50), Enum('member', 'admin', name='user_role_enum'), nullable=False, server_default='member')
     is_verified = Column(BOOLEAN, nullable=False, server_default='false')
+    # Embedded in every token, incrementing it revokes all tokens issued to the user so far
+    token_version = Column(INTEGER, nullable=False, server_default='0')
     last_login_at = Column(TIMESTAMP(timezone=True), nullable=True)
-    created_at = Column(TIMESTAMP(timezone=True), nullable=False, server_default='now()')
+    created_at = Column(TIMESTAMP(timezone=True), nullable=False, server_default=text('now()'))
     updated_at = Column(TIMESTAMP(timezone=True), nullable=True)
 
     profile = relationship('UserProfile', uselist=False, backref='user', cascade='all, delete-orphan')
@@ -26,17 +28,36 @@ class User(Base):
 
 class UserSession(Base):
     __tablename__ = 'user_sessions'
+    __table_args__ = (
+        # /auth/refresh looks sessions up by token digest, invalidated sessions have no digest and are left out
+        Index('ix_user_sessions_refresh_token_hash', 'refresh_token_hash', unique=True,
+              postgresql_where=text('refresh_token_hash IS NOT NULL')),
+        # Used by the session reaper to find expired and invalidated sessions
+        Index('ix_user_sessions_refresh_token_expiry', 'refresh_token_expiry'),
+        Index('ix_user_sessions_invalidated_created_at', 'created_at', postgresql_where=text('refresh_token_hash IS NULL')),
+        # /auth/refresh looks rotated sessions up by the digest they were rotated away from, to detect token reuse
+        Index('ix_user_sessions_rotated_token_hash', 'rotated_token_hash', unique=True,
+              postgresql_where=text('rotated_token_hash IS NOT NULL')),
+    )
     id = Column(INTEGER, nullable=False, primary_key=True)
-    user_id = Column(INTEGER, ForeignKey('users.id', ondelete='CASCADE'), nullable=False)
-    refresh_token = Column(VARCHAR(255), nullable=True)
+    user_id = Column(INTEGER, ForeignKey('users.id', ondelete='CASCADE'), nullable=False, index=True)
+    # SHA-256 digest of the refresh token, the token itself is never stored
+    refresh_token_hash = Column(LargeBinary(32), nullable=True)
     refresh_token_expiry = Column(TIMESTAMP(timezone=True), nullable=True)
+    # Digest of the refresh token consumed when the session was rotated. The session keeps the token's expiry,
+    # the reaper deletes it once the token could not be presented anymore.
+    rotated_token_hash = Column(LargeBinary(32), nullable=True)
+    # When the session was rotated, its token reused within REFRESH_TOKEN_REUSE_GRACE_SECONDS does not revoke the family
+    rotated_at = Column(TIMESTAMP(timezone=True), nullable=True)
+    # Id of the session created at login that this session descends from through rotations, NULL for that session
+    family_id = Column(INTEGER, nullable=True)
     device_info = Column(VARCHAR(255), nullable=True)
     ip_address = Column(VARCHAR(255), nullable=True)
-    created_at = Column(TIMESTAMP(timezone=True), nullable=False, server_default='now()')
+    created_at = Column(TIMESTAMP(timezone=True), nullable=False, server_default=text('now()'))
 
-    def is_valid(self, refresh_token: str):
+    def is_valid(self, refresh_token_hash: bytes):
         if (
-            self.refresh_token == refresh_token
+            self.refresh_token_hash == refresh_token_hash
             and self.refresh_token_expiry > datetime.now(timezone.utc)
         ):
             return True
@@ -51,19 +72,27 @@ class UserProfile(Base):
     user_id = Column(INTEGER, ForeignKey('users.id', ondelete='CASCADE'), nullable=False, unique=True)
     full_name = Column(VARCHAR(255), nullable=True)
     country = Column(VARCHAR(255), nullable=True)
-    created_at = Column(TIMESTAMP(timezone=True), nullable=False, server_default='now()')
+    created_at = Column(TIMESTAMP(timezone=True), nullable=False, server_default=text('now()'))
     updated_at = Column(TIMESTAMP(timezone=True), nullable=True)
 
 
 class UserVerificationToken(Base):
     __tablename__ = 'user_verification_tokens'
+    __table_args__ = (
+        # Unused tokens are looked up when consumed, queries must filter on is_used = false to use this index
+        Index('ix_user_verification_tokens_token', 'token', postgresql_where=text('is_used = false')),
+        # Used tokens are looked up when a verification link is opened again, filtering on is_used = true
+        Index('ix_user_verification_tokens_used_token', 'token', postgresql_where=text('is_used = true')),
+        # Used by the session reaper to find expired tokens
+        Index('ix_user_verification_tokens_token_expiry', 'token_expiry'),
+    )
     id = Column(INTEGER, primary_key=True, nullable=False)
     user_id = Column(INTEGER, nullable=False)
     type = Column(Enum('new_signup', 'password_reset', name='user_verification_request_type_enum'), nullable=False)
     token = Column(VARCHAR(255), nullable=True)
     token_expiry = Column(TIMESTAMP(timezone=True), nullable=True)
     is_used = Column(BOOLEAN, nullable=True)
-    created_at = Column(TIMESTAMP(timezone=True), nullable=False, server_default='now()')
+    created_at = Column(TIMESTAMP(timezone=True), nullable=False, server_default=text('now()'))
     updated_at = Column(TIMESTAMP(timezone=True), nullable=True)
 
     def is_valid(self, type: str):
@@ -98,15 +127,17 @@ class Subscription(Base):
     __tablename__ = 'subscriptions'
 
     id = Column(INTEGER, primary_key=True, nullable=False)
-    user_id = Column(INTEGER, ForeignKey('users.id', ondelete='CASCADE'), nullable=False)
+    user_id = Column(INTEGER, ForeignKey('users.id', ondelete='CASCADE'), nullable=False, index=True)
     plan_id = Column(INTEGER, ForeignKey('plans.id', ondelete="SET NULL"), nullable=False)
     status = Column(Enum('active', 'inactive', 'canceled', 'past_due', name='subscription_status_enum'),
                     nullable=False, server_default='inactive')
     start_date = Column(TIMESTAMP(timezone=True), nullable=True)
     end_date = Column(TIMESTAMP(timezone=True), nullable=True)
-    created_at = Column(TIMESTAMP(timezone=True), nullable=False, server_default='now()')
+    created_at = Column(TIMESTAMP(timezone=True), nullable=False, server_default=text('now()'))
     updated_at = Column(TIMESTAMP(timezone=True), nullable=True)
 
+    plan = relationship('Plan')
+
 
 class Payment(Base):
     __tablename__ = "payments"
@@ -119,29 +150,91 @@ class Payment(Base):
     status = Column(Enum('paid', 'failed', 'refunded', name='payment_status_enum'), nullable=True)
     invoice_url = Column(VARCHAR(500), nullable=True)
     paid_at = Column(TIMESTAMP(timezone=True), nullable=True)
-    created_at = Column(TIMESTAMP(timezone=True), nullable=False, server_default='now()')
+    created_at = Column(TIMESTAMP(timezone=True), nullable=False, server_default=text('now()'))
 
 
 class Notification(Base):
     __tablename__ = 'notifications'
+    __table_args__ = (
+        # Keyset pagination of a user's notifications on (created_at, id), all of them or the unread ones only
+        Index('ix_notifications_user_id_created_at', 'user_id', 'created_at', 'id'),
+        Index('ix_notifications_user_id_is_read_created_at', 'user_id', 'is_read', 'created_at', 'id'),
+    )
 
     id = Column(INTEGER, primary_key=True, nullable=False)
     user_id = Column(INTEGER, ForeignKey('users.id', ondelete='CASCADE'), nullable=False)
     message = Column(VARCHAR(255), nullable=False)
     is_read = Column(BOOLEAN, nullable=False, server_default='false')
     is_sent = Column(BOOLEAN, nullable=False, server_default='false')
-    created_at = Column(TIMESTAMP(timezone=True), nullable=False, server_default='now()')
+    created_at = Column(TIMESTAMP(timezone=True), nullable=False, server_default=text('now()'))
     updated_at = Column(TIMESTAMP(timezone=True), nullable=True)
 
 
+# Unread notifications per user, maintained by statement level triggers on notifications
+# so that clients polling the count never trigger a COUNT(*)
+class NotificationCounter(Base):
+    __tablename__ = 'notification_counters'
+
+    user_id = Column(INTEGER, ForeignKey('users.id', ondelete='CASCADE'), primary_key=True, nullable=False)
+    unread_count = Column(INTEGER, nullable=False, server_default='0')
+
+
+# Emails written in the same transaction as the rows they refer to, and delivered by app.tasks.email_dispatcher
+class EmailOutbox(Base):
+    __tablename__ = 'email_outbox'
+    __table_args__ = (
+        # Only pending emails are ever scanned by the dispatcher
+        Index('ix_email_outbox_pending_next_attempt_at', 'next_attempt_at',
+              postgresql_where=text("status = 'pending'")),
+        # Sent and dead lettered emails are purged by the reaper
+        Index('ix_email_outbox_finished_next_attempt_at', 'next_attempt_at',
+              postgresql_where=text("status <> 'pending'")),
+    )
+
+    id = Column(INTEGER, primary_key=True, nullable=False)
+    recipient = Column(VARCHAR(255), nullable=False)
+    subject = Column(VARCHAR(255), nullable=False)
+    body = Column(TEXT, nullable=False)
+    status = Column(Enum('pending', 'sent', 'failed', name='email_outbox_status_enum'),
+                    nullable=False, server_default='pending')
+    attempts = Column(INTEGER, nullable=False, server_default='0')
+    next_attempt_at = Column(TIMESTAMP(timezone=True), nullable=False, server_default=text('now()'))
+    last_error = Column(TEXT, nullable=True)
+    created_at = Column(TIMESTAMP(timezone=True), nullable=False, server_default=text('now()'))
+    sent_at = Column(TIMESTAMP(timezone=True), nullable=True)
+
+
+# Postgres backed job queue consumed by app.tasks.queue workers. Jobs are deleted once they succeed,
+# so only queued, running (claimed) and failed (dead letter) jobs are ever stored.
 class Jobs(Base):
     __tablename__ = 'jobs'
+    __table_args__ = (
+        # Claim order of the workers, running jobs are included since their run_at is the visibility timeout
+        Index('ix_jobs_claim', 'queue', text('priority DESC'), 'run_at',
+              postgresql_where=text("status IN ('queued', 'running')")),
+        # At most one fresh queued job per unique_key, later enqueues of the same key are coalesced into it.
+        # Jobs waiting for a retry are left out, so they never conflict with a job enqueued in the meantime.
+        Index('ix_jobs_unique_key', 'unique_key', unique=True,
+              postgresql_where=text("status = 'queued' AND retries = 0")),
+    )
+
     id = Column(INTEGER, primary_key=True, nullable=False)
+    queue = Column(VARCHAR(50), nullable=False, server_default='default')
+    type = Column(VARCHAR(100), nullable=False)
+    payload = Column(JSON, nullable=True)
+    status = Column(Enum('queued', 'running', 'failed', name='job_status_enum'), nullable=False,
+                    server_default='queued')
+    unique_key = Column(VARCHAR(255), nullable=True)
     priority = Column(INTEGER, nullable=False, server_default='0')
+    # Times the job was claimed by a worker, and times it failed and was scheduled again
+    attempts = Column(INTEGER, nullable=False, server_default='0')
     retries = Column(INTEGER, nullable=False, server_default='0')
     max_retries = Column(INTEGER, nullable=False, server_default='3')
+    run_at = Column(TIMESTAMP(timezone=True), nullable=False, server_default=text('now()'))
+    locked_by = Column(VARCHAR(100), nullable=True)
     last_error = Column(TEXT, nullable=True)
-    created_at = Column(TIMESTAMP(timezone=True), nullable=False, server_default='now()')
+    created_at = Column(TIMESTAMP(timezone=True), nullable=False, server_default=text('now()'))
+    updated_at = Column(TIMESTAMP(timezone=True), nullable=True)
 
 
 class FailedJobs(Base):
@@ -149,4 +242,4 @@ class FailedJobs(Base):
     id = Column(INTEGER, primary_key=True, nullable=False)
     job_id = Column(INTEGER, ForeignKey('jobs.id', ondelete='CASCADE'), nullable=False)
     error_message = Column(TEXT, nullable=True)
-    failed_at = Column(TIMESTAMP(timezone=True), nullable=False, server_default='now()')
+    failed_at = Column(TIMESTAMP(timezone=True), nullable=False, server_default=text('now()'))
@@ -0,0 +1,210 @@
+from fastapi import APIRouter, status, Depends, HTTPException, Request
+from app.config import database
+from app.config.settings import Settings, get_settings
+from app.schemas.auth import Token
+from app.models import User, UserSession
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession
+import app.utils.auth as auth_utility
+import app.utils.email as email_utility
+from app.tasks import jobs
+from fastapi.security import OAuth2PasswordRequestForm
+from app.schemas.auth import UserRegistrationRequest
+from app.schemas.auth import UserRegistrationResponse
+from app.schemas.auth import RefreshTokenRequest, ForgotPasswordRequest, ResetPasswordRequest
+from app.utils.user_cache import invalidate_user
+from app.utils.rate_limit import rate_limit
+from app.utils.query_inspector import query_budget
+from app.utils.responses import ModelResponse
+from datetime import datetime, timezone
+
+
+# Async variant of app.routes.auth, served when DB_ASYNC_MODE is enabled.
+# Relationships are never lazily loaded here because lazy loads cannot be awaited.
+router = APIRouter(prefix="/auth", tags=["Auth"])
+
+
+# Endpoint for user registration
+@router.post('/register', status_code=status.HTTP_201_CREATED, response_model=UserRegistrationResponse,
+             dependencies=[Depends(rate_limit("register"))])
+@query_budget(4)
+async def register(payload: UserRegistrationRequest, request: Request, db: AsyncSession = Depends(database.get_async_db)):
+    payload.password = await auth_utility.hash_password_async(payload.password)
+    data = payload.model_dump()
+    user = User(**data)
+    db.add(user)
+    try:
+        await db.flush()
+    except Exception as e:
+        await db.rollback()
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="Email already registered.")
+    v_token = await auth_utility.create_user_verification_token_async(
+        user_id=user.id, type="new_signup", size=64, validity=24, db=db)
+    email_utility.send_signup_verification_email(user.email, v_token, request, db)
+    await db.execute(jobs.dispatch_email_outbox_statement())
+    # The user, its verification token, the outbox email and the job delivering it are committed together
+    try:
+        await db.commit()
+    except Exception as e:
+        await db.rollback()
+        raise HTTPException(status_code=status.HTTP_500_INTERNAL_SERVER_ERROR, detail="Registration failed.")
+    return ModelResponse(UserRegistrationResponse.model_validate(user, from_attributes=True),
+                         status_code=status.HTTP_201_CREATED)
+
+
+# Endpoint for user login
+@router.post('/login', response_model=Token, dependencies=[Depends(rate_limit("login"))])
+@query_budget(4)
+async def login(creds: OAuth2PasswordRequestForm = Depends(), db: AsyncSession = Depends(database.get_async_db),
+                settings: Settings = Depends(get_settings)):
+    user = (await db.execute(select(User).filter(User.email == creds.username))).scalars().first()
+    is_valid, new_hash = (
+        await auth_utility.verify_and_update_password_async(creds.password, user.password) if user else (False, None))
+
+    if not is_valid:
+        raise HTTPException(status_code=status.HTTP_401_UNAUTHORIZED,
+                            detail="Incorrect login credentials", headers={"WWW-Authenticate": "Bearer"})
+    elif not user.is_verified and settings.force_email_verification:
+        raise HTTPException(status_code=status.HTTP_401_UNAUTHORIZED,
+                            detail="Email not verified. Please verify your email before logging in.")
+    else:
+        if new_hash:
+            # Transparently upgrade hashes created with outdated parameters (e.g. a lower BCRYPT_ROUNDS)
+            user.password = new_hash
+        access_token = auth_utility.create_access_token(
+            data={"user_id": str(user.id), "role": user.role, "is_verified": user.is_verified,
+                  "token_version": user.token_version})
+        refresh_token, refresh_expiry = auth_utility.create_refresh_token(
+            data={"user_id": str(user.id), "token_version": user.token_version})
+        # Evict the oldest active sessions beyond MAX_SESSIONS_PER_USER
+        evict_statement = auth_utility.evict_oldest_sessions_statement(user.id)
+        if evict_statement is not None:
+            await db.execute(evict_statement)
+        # Store refresh token and expiry in DB
+        db.add(
+            UserSession(
+                user_id=user.id,
+                refresh_token_hash=auth_utility.hash_refresh_token(refresh_token),
+                refresh_token_expiry=refresh_expiry,
+                device_info=None,
+                ip_address=None
+            )
+        )
+        user.last_login_at = datetime.now(timezone.utc)
+        try:
+            await db.commit()
+        except Exception as e:
+            await db.rollback()
+            raise HTTPException(status_code=status.HTTP_500_INTERNAL_SERVER_ERROR, detail="Login failed.")
+        if new_hash:
+            invalidate_user(user.id)
+        return ModelResponse(Token(access_token=access_token, refresh_token=refresh_token, token_type="bearer"))
+
+
+# Endpoint to refresh access token
+# The refresh token is rotated atomically: consuming it and storing its successor is a single statement, so that
+# of concurrent refreshes with the same token exactly one succeeds. Presenting a token that was already rotated
+# revokes every session descending from the same login, in that same statement.
+@router.post('/refresh', response_model=Token)
+@query_budget(1)
+async def refresh_token(payload: RefreshTokenRequest, db: AsyncSession = Depends(database.get_async_db)):
+    token_data = auth_utility.verify_refresh_token(payload.refresh_token)
+    refresh_token_hash = auth_utility.hash_refresh_token(payload.refresh_token)
+    new_refresh_token, new_refresh_expiry = auth_utility.create_refresh_token(
+        data={"user_id": token_data.user_id, "token_version": token_data.token_version})
+    try:
+        user = (await db.execute(auth_utility.rotate_refresh_token_statement(
+            token_data, refresh_token_hash, auth_utility.hash_refresh_token(new_refresh_token),
+            new_refresh_expiry))).first()
+        # No row for an unknown, expired, revoked or already rotated token, in the last case the statement revoked
+        # the whole family
+        await db.commit()
+    except Exception as e:
+        await db.rollback()
+        raise HTTPException(status_code=status.HTTP_500_INTERNAL_SERVER_ERROR, detail="Could not refresh access token.")
+    if user is None:
+        raise HTTPException(status_code=status.HTTP_401_UNAUTHORIZED, detail="Invalid refresh token")
+
+    access_token = auth_utility.create_access_token(
+        data={"user_id": str(user.user_id), "role": user.role, "is_verified": user.is_verified,
+              "token_version": token_data.token_version})
+    return ModelResponse(Token(access_token=access_token, refresh_token=new_refresh_token, token_type="bearer"))
+
+
+# Endpoint to verify email
+# Consuming the token and verifying the user is a single statement, a link already used costs a second lookup
+@router.get('/verify', status_code=status.HTTP_200_OK)
+@query_budget(2)
+async def verify_email(db: AsyncSession = Depends(database.get_async_db), token: str = None):
+    # Links used before this release had their token set to NULL, which a missing token would match
+    if not token:
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="Invalid verification token")
+    try:
+        user = (await db.execute(auth_utility.verify_email_statement(token))).first()
+        await db.commit()
+    except Exception as e:
+        await db.rollback()
+        raise HTTPException(status_code=status.HTTP_500_INTERNAL_SERVER_ERROR, detail=f"Email verification failed.")
+    if user is None:
+        if (await db.execute(auth_utility.verified_email_statement(token))).first() is not None:
+            return {"message": "Email already verified."}
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="Invalid verification token")
+    invalidate_user(user.id)
+    return {"message": "Email verified successfully."}
+
+
+# Endpoint for user logout
+# bump the user's token_version, so every access and refresh token issued so far is rejected.
+@router.post('/logout', status_code=200)
+async def logout(db: AsyncSession = Depends(database.get_async_db), current_user: User = Depends(auth_utility.get_current_user_async)):
+    await db.execute(auth_utility.revoke_user_tokens_statement(current_user.id))
+    await db.commit()
+    invalidate_user(current_user.id)
+    return {"message": "Logged out successfully."}
+
+
+@router.post('/forget-password', status_code=status.HTTP_200_OK,
+             dependencies=[Depends(rate_limit("forget-password"))])
+@query_budget(4)
+async def forget_password(payload: ForgotPasswordRequest, request: Request, db: AsyncSession = Depends(database.get_async_db)):
+    user = (await db.execute(select(User).filter(User.email == payload.email))).scalars().first()
+    if user:
+        v_token = await auth_utility.create_user_verification_token_async(
+            user_id=user.id, type="password_reset", size=64, validity=1, db=db)
+        email_utility.send_password_reset_verification_email(user.email, v_token, request, db)
+        await db.execute(jobs.dispatch_email_outbox_statement())
+        try:
+            await db.commit()
+        except Exception as e:
+            await db.rollback()
+            raise HTTPException(status_code=status.HTTP_500_INTERNAL_SERVER_ERROR, detail="Password reset failed.")
+        return {
+            "message": f"A link has been sent to the email id."
+        }
+    else:
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST,
+                            detail=f"User with email {payload.email} does not exist.")
+
+
+# The token is checked before the new password is hashed, so that invalid tokens cost an indexed lookup rather
+# than a hash. Consuming the token and storing the new password is then a single statement.
+@router.post('/reset-password')
+@query_budget(2)
+async def reset_password(payload: ResetPasswordRequest, db: AsyncSession = Depends(database.get_async_db)):
+    token = (await db.execute(
+        auth_utility.usable_verification_token_statement(payload.token, "password_reset"))).first()
+    if token is None:
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail=f"Invalid token.")
+    password_hash = await auth_utility.hash_password_async(payload.new_password)
+    try:
+        user = (await db.execute(auth_utility.reset_password_statement(payload.token, password_hash))).first()
+        await db.commit()
+    except Exception as e:
+        await db.rollback()
+        raise HTTPException(status_code=status.HTTP_500_INTERNAL_SERVER_ERROR, detail=f"Failed to reset password.")
+    if user is None:
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail=f"Invalid token.")
+    invalidate_user(user.id)
+    return {
+        "message": "Password reset done successfully."
+    }
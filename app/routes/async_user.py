@@ -0,0 +1,137 @@
+from fastapi import APIRouter, Depends, HTTPException, Query, status
+from app.schemas.user import UserProfileResponse, UserProfileUpdateRequest, UpdatePasswordRequest, UserProfileCreateRequest, UpdatePasswordResponse
+from app.schemas.user import ProfileResponse
+from app.schemas.user import NotificationPageResponse, MarkNotificationsReadRequest, MarkNotificationsReadResponse, UnreadCountResponse
+from app.utils import auth as auth_util
+from app.models import User, UserProfile, Subscription
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.orm import joinedload
+from app.schemas.auth import Principal
+from app.config import database
+from app.utils.user_cache import invalidate_user
+from app.utils import notifications as notifications_util
+from app.utils.query_inspector import query_budget
+from app.utils.responses import ModelResponse
+from typing import Optional
+
+
+# Async variant of app.routes.user, served when DB_ASYNC_MODE is enabled.
+router = APIRouter(prefix="/user", tags=["User"])
+
+
+# Uses the claims-only principal so the user, profile, subscription and plan are fetched together in a single
+# query, followed by one query for a capped page of notifications
+@router.get("/profile", response_model=UserProfileResponse, status_code=status.HTTP_200_OK)
+@query_budget(2)
+async def get_user(notifications_limit: int = Query(20, ge=0, le=100),
+                   notifications_cursor: Optional[str] = Query(None, description="next_cursor of the previous page"),
+                   principal: Principal = Depends(auth_util.get_current_principal), db: AsyncSession = Depends(database.get_async_db)):
+    current_user = (await db.execute(
+        select(User).options(
+            joinedload(User.profile),
+            joinedload(User.subscription).joinedload(Subscription.plan),
+        ).filter(User.id == principal.id))).scalars().first()
+    if not current_user:
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="User not found")
+    auth_util.check_token_version(current_user, principal)
+    profile = current_user.profile
+    notifications, next_cursor = notifications_util.page((await db.execute(notifications_util.page_statement(
+        current_user.id, notifications_limit, notifications_cursor))).scalars().all(), notifications_limit)
+    return ModelResponse(UserProfileResponse.model_validate({
+        "id": current_user.id,
+        "email": current_user.email,
+        "is_verified": current_user.is_verified,
+        "full_name": profile.full_name if profile else None,
+        "country": profile.country if profile else None,
+        "created_at": current_user.created_at,
+        "updated_at": current_user.updated_at,
+        "subscription": current_user.subscription,
+        "notifications": notifications,
+        "notifications_next_cursor": next_cursor
+    }, from_attributes=True))
+
+
+@router.get("/notifications", response_model=NotificationPageResponse, status_code=status.HTTP_200_OK)
+@query_budget(2)
+async def get_notifications(limit: int = Query(20, ge=1, le=100),
+                            cursor: Optional[str] = Query(None, description="next_cursor of the previous page"),
+                            unread_only: bool = False,
+                            current_user: User = Depends(auth_util.get_current_user_async), db: AsyncSession = Depends(database.get_async_db)):
+    items, next_cursor = notifications_util.page((await db.execute(
+        notifications_util.page_statement(current_user.id, limit, cursor, unread_only))).scalars().all(), limit)
+    return ModelResponse(NotificationPageResponse.model_validate({"items": items, "next_cursor": next_cursor},
+                                                                from_attributes=True))
+
+
+# Marks the given notifications as read, or all of them, in a single UPDATE
+@router.post("/notifications/read", response_model=MarkNotificationsReadResponse, status_code=status.HTTP_200_OK)
+async def mark_notifications_read(payload: MarkNotificationsReadRequest, current_user: User = Depends(auth_util.get_current_user_async),
+                                  db: AsyncSession = Depends(database.get_async_db)):
+    try:
+        updated = (await db.execute(notifications_util.mark_read_statement(current_user.id, payload.ids))).rowcount
+        unread_count = (await db.execute(notifications_util.unread_count_statement(current_user.id))).scalar()
+        await db.commit()
+    except Exception as e:
+        await db.rollback()
+        raise HTTPException(status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
+                            detail="Failed to mark notifications as read.")
+    return ModelResponse(MarkNotificationsReadResponse(updated=updated, unread_count=unread_count))
+
+
+# Served from the counter maintained by triggers, cheap enough to be polled
+@router.get("/notifications/unread-count", response_model=UnreadCountResponse, status_code=status.HTTP_200_OK)
+@query_budget(2)
+async def get_unread_count(current_user: User = Depends(auth_util.get_current_user_async), db: AsyncSession = Depends(database.get_async_db)):
+    unread_count = (await db.execute(notifications_util.unread_count_statement(current_user.id))).scalar()
+    return ModelResponse(UnreadCountResponse(unread_count=unread_count))
+
+
+@router.post('/profile', response_model=ProfileResponse)
+async def create_user_profile(payload: UserProfileCreateRequest, current_user: User = Depends(auth_util.get_current_user_async), db: AsyncSession = Depends(database.get_async_db)):
+    user_profile = UserProfile(user_id=current_user.id, full_name=payload.full_name, country=payload.country)
+    db.add(user_profile)
+
+    try:
+        await db.commit()
+    except Exception as e:
+        await db.rollback()
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail=f"Failed to create user profile.")
+
+    return ModelResponse(ProfileResponse.model_validate(user_profile))
+
+
+@router.put("/profile", response_model=ProfileResponse)
+async def update_user_profile(payload: UserProfileUpdateRequest, current_user: User = Depends(auth_util.get_current_user_async), db: AsyncSession = Depends(database.get_async_db)):
+    user_profile = (await db.execute(select(UserProfile).filter(UserProfile.user_id == current_user.id))).scalars().first()
+    if not user_profile:
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="Failed to update user profile.")
+    user_profile.full_name = payload.full_name
+    user_profile.country = payload.country
+
+    try:
+        await db.commit()
+    except Exception as e:
+        await db.rollback()
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="Failed to update user profile.")
+
+    invalidate_user(current_user.id)
+    return ModelResponse(ProfileResponse.model_validate(user_profile))
+
+
+@router.put('/update-password', status_code=status.HTTP_200_OK)
+async def update_password(payload: UpdatePasswordRequest, current_user: User = Depends(auth_util.get_current_user_async), db: AsyncSession = Depends(database.get_async_db)):
+    if await auth_util.verify_password_async(payload.old_password, current_user.password):
+        current_user.password = await auth_util.hash_password_async(payload.new_password)
+
+        try:
+            await db.commit()
+            invalidate_user(current_user.id)
+            return UpdatePasswordResponse(message="Password updated successfully")
+        except Exception as e:
+            await db.rollback()
+            raise HTTPException(status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
+                                detail="Failed to update password.")
+
+    else:
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail=f"Failed to update user password.")
@@ -1,14 +1,20 @@
-from fastapi import APIRouter, status, Depends, HTTPException, BackgroundTasks, Request
-from app.config import database, api
+from fastapi import APIRouter, status, Depends, HTTPException, Request
+from app.config import database
+from app.config.settings import Settings, get_settings
 from app.schemas.auth import Token
-from app.models import User, UserVerificationToken, UserSession
+from app.models import User, UserSession
 from sqlalchemy.orm import Session
 import app.utils.auth as auth_utility
 import app.utils.email as email_utility
+from app.tasks import jobs
 from fastapi.security import OAuth2PasswordRequestForm
 from app.schemas.auth import UserRegistrationRequest
 from app.schemas.auth import UserRegistrationResponse
 from app.schemas.auth import RefreshTokenRequest, ForgotPasswordRequest, ResetPasswordRequest
+from app.utils.user_cache import invalidate_user
+from app.utils.rate_limit import rate_limit
+from app.utils.query_inspector import query_budget
+from app.utils.responses import ModelResponse
 from datetime import datetime, timezone
 
 
@@ -16,164 +22,187 @@ router = APIRouter(prefix="/auth", tags=["Auth"])
 
 
 # Endpoint for user registration
-@router.post('/register', status_code=status.HTTP_201_CREATED, response_model=UserRegistrationResponse)
-def register(payload: UserRegistrationRequest, background_tasks: BackgroundTasks, request: Request, db: Session = Depends(database.get_db)):
+@router.post('/register', status_code=status.HTTP_201_CREATED, response_model=UserRegistrationResponse,
+             dependencies=[Depends(rate_limit("register"))])
+@query_budget(4)
+def register(payload: UserRegistrationRequest, request: Request, db: Session = Depends(database.get_db)):
     payload.password = auth_utility.hash_password(payload.password)
     data = payload.model_dump()
     user = User(**data)
     db.add(user)
     try:
-        db.commit()
+        db.flush()
     except Exception as e:
         db.rollback()
         raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="Email already registered.")
-    db.refresh(user)
     v_token = auth_utility.create_user_verification_token(
         user_id=user.id, type="new_signup", size=64, validity=24, db=db)
-    email_utility.send_signup_verification_email(user.email, v_token, background_tasks, request)
-    return user
+    email_utility.send_signup_verification_email(user.email, v_token, request, db)
+    db.execute(jobs.dispatch_email_outbox_statement())
+    # The user, its verification token, the outbox email and the job delivering it are committed together
+    try:
+        db.commit()
+    except Exception as e:
+        db.rollback()
+        raise HTTPException(status_code=status.HTTP_500_INTERNAL_SERVER_ERROR, detail="Registration failed.")
+    return ModelResponse(UserRegistrationResponse.model_validate(user, from_attributes=True),
+                         status_code=status.HTTP_201_CREATED)
 
 # Endpoint for user login
 
 
-@router.post('/login', response_model=Token)
-def login(creds: OAuth2PasswordRequestForm = Depends(), db: Session = Depends(database.get_db)):
+@router.post('/login', response_model=Token, dependencies=[Depends(rate_limit("login"))])
+@query_budget(4)
+def login(creds: OAuth2PasswordRequestForm = Depends(), db: Session = Depends(database.get_db),
+          settings: Settings = Depends(get_settings)):
     user = db.query(User).filter(User.email == creds.username).first()
+    is_valid, new_hash = (
+        auth_utility.verify_and_update_password(creds.password, user.password) if user else (False, None))
 
-    if not user or not auth_utility.verify_password(creds.password, user.password):
+    if not is_valid:
         raise HTTPException(status_code=status.HTTP_401_UNAUTHORIZED,
                             detail="Incorrect login credentials", headers={"WWW-Authenticate": "Bearer"})
-    elif not user.is_verified and api.force_email_verification:
+    elif not user.is_verified and settings.force_email_verification:
         raise HTTPException(status_code=status.HTTP_401_UNAUTHORIZED,
                             detail="Email not verified. Please verify your email before logging in.")
     else:
-        access_token = auth_utility.create_access_token(data={"user_id": str(user.id)})
-        refresh_token, refresh_expiry = auth_utility.create_refresh_token(data={"user_id": str(user.id)})
+        if new_hash:
+            # Transparently upgrade hashes created with outdated parameters (e.g. a lower BCRYPT_ROUNDS)
+            user.password = new_hash
+        access_token = auth_utility.create_access_token(
+            data={"user_id": str(user.id), "role": user.role, "is_verified": user.is_verified,
+                  "token_version": user.token_version})
+        refresh_token, refresh_expiry = auth_utility.create_refresh_token(
+            data={"user_id": str(user.id), "token_version": user.token_version})
+        # Evict the oldest active sessions beyond MAX_SESSIONS_PER_USER
+        evict_statement = auth_utility.evict_oldest_sessions_statement(user.id)
+        if evict_statement is not None:
+            db.execute(evict_statement)
         # Store refresh token and expiry in DB
-        # user.refresh_token = refresh_token
-        # user.refresh_token_expiry = refresh_expiry
-        user.sessions.append(
+        db.add(
             UserSession(
-                refresh_token=refresh_token,
+                user_id=user.id,
+                refresh_token_hash=auth_utility.hash_refresh_token(refresh_token),
                 refresh_token_expiry=refresh_expiry,
                 device_info=None,
                 ip_address=None
             )
         )
-        user.last_login = datetime.now(timezone.utc)
+        user.last_login_at = datetime.now(timezone.utc)
         db.add(user)
         try:
             db.commit()
         except Exception as e:
             db.rollback()
             raise HTTPException(status_code=status.HTTP_500_INTERNAL_SERVER_ERROR, detail="Login failed.")
-        db.refresh(user)
-        return Token(access_token=access_token, refresh_token=refresh_token, token_type="bearer")
+        if new_hash:
+            invalidate_user(user.id)
+        return ModelResponse(Token(access_token=access_token, refresh_token=refresh_token, token_type="bearer"))
 
 
 # Endpoint to refresh access token
+# The refresh token is rotated atomically: consuming it and storing its successor is a single statement, so that
+# of concurrent refreshes with the same token exactly one succeeds. Presenting a token that was already rotated
+# revokes every session descending from the same login, in that same statement.
 @router.post('/refresh', response_model=Token)
+@query_budget(1)
 def refresh_token(payload: RefreshTokenRequest, db: Session = Depends(database.get_db)):
-
-    session = db.query(UserSession).filter(UserSession.refresh_token == payload.refresh_token).first()
-    if not session.is_valid(refresh_token=payload.refresh_token):
-        raise HTTPException(status_code=status.HTTP_401_UNAUTHORIZED, detail="Invalid refresh token")
-    # Verify token
-    user_id = auth_utility.verify_refresh_token(payload.refresh_token)
-    # Find user by refresh token
-    user = session.user
-    print(user)
-    if str(user.id) != str(user_id):
-        raise HTTPException(status_code=status.HTTP_401_UNAUTHORIZED, detail="Invalid refresh token")
-
-    # Invalidate session
-    session.refresh_token = None
-    session.refresh_token_expiry = None
-
-    # Issue new tokens
-    access_token = auth_utility.create_access_token(data={"user_id": str(user.id)})
-    new_refresh_token, new_refresh_expiry = auth_utility.create_refresh_token(data={"user_id": str(user.id)})
-    user.sessions.append(
-        UserSession(
-            refresh_token=new_refresh_token,
-            refresh_token_expiry=new_refresh_expiry,
-            device_info=None,
-            ip_address=None
-        )
-    )
-    # db.add(user)
+    token_data = auth_utility.verify_refresh_token(payload.refresh_token)
+    refresh_token_hash = auth_utility.hash_refresh_token(payload.refresh_token)
+    new_refresh_token, new_refresh_expiry = auth_utility.create_refresh_token(
+        data={"user_id": token_data.user_id, "token_version": token_data.token_version})
     try:
+        user = (db.execute(auth_utility.rotate_refresh_token_statement(
+            token_data, refresh_token_hash, auth_utility.hash_refresh_token(new_refresh_token),
+            new_refresh_expiry))).first()
+        # No row for an unknown, expired, revoked or already rotated token, in the last case the statement revoked
+        # the whole family
         db.commit()
     except Exception as e:
         db.rollback()
         raise HTTPException(status_code=status.HTTP_500_INTERNAL_SERVER_ERROR, detail="Could not refresh access token.")
-    db.refresh(user)
-    return Token(access_token=access_token, refresh_token=new_refresh_token, token_type="bearer")
+    if user is None:
+        raise HTTPException(status_code=status.HTTP_401_UNAUTHORIZED, detail="Invalid refresh token")
+
+    access_token = auth_utility.create_access_token(
+        data={"user_id": str(user.user_id), "role": user.role, "is_verified": user.is_verified,
+              "token_version": token_data.token_version})
+    return ModelResponse(Token(access_token=access_token, refresh_token=new_refresh_token, token_type="bearer"))
 
 
 # Endpoint to verify email
+# Consuming the token and verifying the user is a single statement, a link already used costs a second lookup
 @router.get('/verify', status_code=status.HTTP_200_OK)
+@query_budget(2)
 def verify_email(db: Session = Depends(database.get_db), token: str = None):
-    token = db.query(UserVerificationToken).filter(UserVerificationToken.token == token).first()
-    if not token.is_valid(type='new_signup'):
+    # Links used before this release had their token set to NULL, which a missing token would match
+    if not token:
         raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="Invalid verification token")
-    if token.is_used:
-        return {"message": "Email already verified."}
-    if not token.token_expiry or token.token_expiry < datetime.now(timezone.utc):
-        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="Verification token has expired")
-    token = token.invalidate()
-    user = db.query(User).filter(User.id == token.user_id).first()
-    user.is_verified = True
     try:
+        user = db.execute(auth_utility.verify_email_statement(token)).first()
         db.commit()
     except Exception as e:
         db.rollback()
         raise HTTPException(status_code=status.HTTP_500_INTERNAL_SERVER_ERROR, detail=f"Email verification failed.")
+    if user is None:
+        if db.execute(auth_utility.verified_email_statement(token)).first() is not None:
+            return {"message": "Email already verified."}
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="Invalid verification token")
+    invalidate_user(user.id)
     return {"message": "Email verified successfully."}
 
 
 # Endpoint for user logout
-# invalidate the user's refresh token in the database, so it cannot be used to obtain new access tokens.
+# bump the user's token_version, so every access and refresh token issued so far is rejected.
 @router.post('/logout', status_code=200)
 def logout(db: Session = Depends(database.get_db), current_user: User = Depends(auth_utility.get_current_user)):
-    for session in current_user.sessions:
-        session.refresh_token = None
-        session.refresh_token_expiry = None
+    db.execute(auth_utility.revoke_user_tokens_statement(current_user.id))
     db.commit()
+    invalidate_user(current_user.id)
     return {"message": "Logged out successfully."}
 
 
-@router.post('/forget-password', status_code=status.HTTP_200_OK)
-def forget_password(payload: ForgotPasswordRequest, background_tasks: BackgroundTasks, request: Request, db: Session = Depends(database.get_db)):
+@router.post('/forget-password', status_code=status.HTTP_200_OK,
+             dependencies=[Depends(rate_limit("forget-password"))])
+@query_budget(4)
+def forget_password(payload: ForgotPasswordRequest, request: Request, db: Session = Depends(database.get_db)):
     user = db.query(User).filter(User.email == payload.email).first()
     if user:
         v_token = auth_utility.create_user_verification_token(
             user_id=user.id, type="password_reset", size=64, validity=1, db=db)
-        email_utility.send_password_reset_verification_email(user.email, v_token, background_tasks, request)
+        email_utility.send_password_reset_verification_email(user.email, v_token, request, db)
+        db.execute(jobs.dispatch_email_outbox_statement())
+        try:
+            db.commit()
+        except Exception as e:
+            db.rollback()
+            raise HTTPException(status_code=status.HTTP_500_INTERNAL_SERVER_ERROR, detail="Password reset failed.")
         return {
             "message": f"A link has been sent to the email id."
         }
     else:
         raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST,
-                            detail=f"User with email {user.email} does not exist.")
+                            detail=f"User with email {payload.email} does not exist.")
 
 
+# The token is checked before the new password is hashed, so that invalid tokens cost an indexed lookup rather
+# than a hash. Consuming the token and storing the new password is then a single statement.
 @router.post('/reset-password')
+@query_budget(2)
 def reset_password(payload: ResetPasswordRequest, db: Session = Depends(database.get_db)):
-    token = db.query(UserVerificationToken).filter(UserVerificationToken.token == payload.token).first()
-    if token.is_valid(type='password_reset'):
-        user = db.query(User).filter(User.id == token.user_id).first()
-        if not user:
-            raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail=f"User not found")
-        else:
-            user.password = auth_utility.hash_password(payload.new_password)
-            token = token.invalidate()
-            try:
-                db.commit()
-                return {
-                    "message": "Password reset done successfully."
-                }
-            except Exception as e:
-                raise HTTPException(status_code=status.HTTP_200_OK, detail=f"Failed to reset password.")
-    else:
+    token = db.execute(auth_utility.usable_verification_token_statement(payload.token, "password_reset")).first()
+    if token is None:
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail=f"Invalid token.")
+    password_hash = auth_utility.hash_password(payload.new_password)
+    try:
+        user = db.execute(auth_utility.reset_password_statement(payload.token, password_hash)).first()
+        db.commit()
+    except Exception as e:
+        db.rollback()
+        raise HTTPException(status_code=status.HTTP_500_INTERNAL_SERVER_ERROR, detail=f"Failed to reset password.")
+    if user is None:
         raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail=f"Invalid token.")
+    invalidate_user(user.id)
+    return {
+        "message": "Password reset done successfully."
+    }
@@ -0,0 +1,19 @@
+from fastapi import APIRouter, Depends, status
+from app.schemas.auth import Principal
+from app.schemas.user import EntitlementsResponse
+from app.utils import auth as auth_util
+from app.utils.entitlements import get_entitlements
+from app.utils.query_inspector import query_budget
+from app.utils.responses import ModelResponse
+
+
+# Served by both the sync and the async application, entitlements are resolved from their cache
+router = APIRouter(prefix="/user", tags=["User"])
+
+
+# Plan and features of the caller, for clients to show or hide what routes gated with
+# require_feature / require_plan would refuse
+@router.get("/entitlements", response_model=EntitlementsResponse, status_code=status.HTTP_200_OK)
+@query_budget(1)
+async def get_user_entitlements(principal: Principal = Depends(auth_util.get_current_principal)):
+    return ModelResponse(await get_entitlements(principal.id))
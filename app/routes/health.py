@@ -0,0 +1,24 @@
+from fastapi import APIRouter, Response, status
+from app.utils.health import database_ready, server_state
+
+
+router = APIRouter(prefix="/health", tags=["Health"])
+
+
+# Liveness probe: answers as long as the event loop does, restarting the process is the only remedy otherwise
+@router.get('/live', status_code=status.HTTP_200_OK)
+async def liveness():
+    return {"status": "alive"}
+
+
+# Readiness probe: fails while the process drains before stopping or cannot reach the database,
+# the load balancer routes requests to other instances meanwhile
+@router.get('/ready', status_code=status.HTTP_200_OK)
+async def readiness(response: Response):
+    if server_state.draining:
+        response.status_code = status.HTTP_503_SERVICE_UNAVAILABLE
+        return {"status": "draining"}
+    if not await database_ready():
+        response.status_code = status.HTTP_503_SERVICE_UNAVAILABLE
+        return {"status": "database unavailable"}
+    return {"status": "ready"}
@@ -0,0 +1,80 @@
+from fastapi import APIRouter, Response, status
+from app.config import database
+from app.config.settings import get_settings
+from app.utils.db_pool import pool_stats
+from app.utils.user_cache import user_cache
+from app.utils.plan_catalog import plan_catalog
+from app.utils.entitlements import entitlement_cache
+from app.tasks.reaper import reaper_stats
+from app.tasks.email_dispatcher import dispatcher_stats
+from app.tasks.queue import queue_stats
+from app.utils.notification_stream import notification_stream_stats
+from app.utils.rate_limit import rate_limit_stats
+from app.utils.metrics import registry
+import os
+
+
+router = APIRouter(tags=["Metrics"])
+
+
+# Endpoint exposing the request, database, hashing and threadpool series in the Prometheus text format.
+# Async so that scraping never waits for a threadpool thread, and reads the threadpool of the event loop.
+# Under gunicorn the series of every worker are aggregated through METRICS_DIR, see app.utils.metrics.
+@router.get('/metrics', status_code=status.HTTP_200_OK)
+async def get_metrics():
+    return Response(registry.render(get_settings().metrics_dir), media_type="text/plain; version=0.0.4; charset=utf-8")
+
+
+# The JSON endpoints below report the state of the worker process serving them, identified by "worker"
+def per_worker(stats: dict):
+    return {"worker": os.getpid(), **stats}
+
+
+# Endpoint exposing live connection pool statistics for the sync and async engines
+@router.get('/metrics/db-pool', status_code=status.HTTP_200_OK)
+def get_db_pool_metrics():
+    return per_worker({
+        "mode": get_settings().db_pool_mode,
+        "sync": pool_stats(database.engine.pool),
+        "async": pool_stats(database.async_engine.sync_engine.pool),
+    })
+
+
+# Endpoint exposing hit, miss and eviction counters of the authenticated user, plans catalog and entitlement caches
+@router.get('/metrics/cache', status_code=status.HTTP_200_OK)
+def get_cache_metrics():
+    return per_worker({
+        "user": user_cache.stats(),
+        "plans": plan_catalog.stats(),
+        "entitlements": entitlement_cache.stats(),
+    })
+
+
+# Endpoint exposing rows purged by the session and verification token reaper
+@router.get('/metrics/reaper', status_code=status.HTTP_200_OK)
+def get_reaper_metrics():
+    return per_worker(reaper_stats())
+
+
+# Endpoint exposing delivery counters of the email outbox dispatcher running in this process
+@router.get('/metrics/email', status_code=status.HTTP_200_OK)
+def get_email_metrics():
+    return per_worker(dispatcher_stats())
+
+
+# Endpoint exposing the job queue depth and age per queue and status
+@router.get('/metrics/jobs', status_code=status.HTTP_200_OK)
+def get_job_metrics():
+    return per_worker(queue_stats())
+
+
+# Endpoint exposing the notification streams open in this process and their delivery counters
+@router.get('/metrics/notifications', status_code=status.HTTP_200_OK)
+def get_notification_metrics():
+    return per_worker(notification_stream_stats())
+
+
+# Endpoint exposing the requests allowed and rejected by the rate limits of the credential endpoints
+@router.get('/metrics/rate-limit', status_code=status.HTTP_200_OK)
+def get_rate_limit_metrics():
+    return per_worker(rate_limit_stats())
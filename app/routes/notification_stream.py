@@ -0,0 +1,44 @@
+from fastapi import APIRouter, Depends, Header, Query
+from fastapi.responses import StreamingResponse
+from app.schemas.auth import Principal
+from app.schemas.user import NotificationResponse
+from app.config import database
+from app.config.settings import get_settings
+from app.utils import auth as auth_util
+from app.utils import notifications as notifications_util
+from app.utils.notification_stream import RESET_EVENT, event_stream, format_event, notification_hub
+from typing import Optional
+
+
+# Served by both the sync and the async application, streams only hold a subscription to the
+# process wide LISTEN connection and never a database connection of their own
+router = APIRouter(prefix="/user", tags=["User"])
+
+
+# Server-Sent Events stream of the caller's new notifications. Each event id is a cursor: EventSource sends
+# the last one back as Last-Event-ID when reconnecting, and the notifications missed meanwhile are replayed.
+@router.get("/notifications/stream", response_class=StreamingResponse)
+async def stream_notifications(last_event_id: Optional[str] = Header(None),
+                               cursor: Optional[str] = Query(None, description="Event id to resume from"),
+                               principal: Principal = Depends(auth_util.get_stream_principal)):
+    resume_from = last_event_id or cursor
+    limit = get_settings().notification_stream_resume_limit
+    replay_statement = notifications_util.since_statement(principal.id, resume_from, limit) if resume_from else None
+
+    # Subscribe before reading the replay so that nothing inserted in between is missed
+    subscriber = await notification_hub.subscribe(principal.id)
+    replay = []
+    if replay_statement is not None:
+        try:
+            async with database.AsyncSessionLocal() as db:
+                rows = (await db.execute(replay_statement)).scalars().all()
+        except BaseException:
+            notification_hub.unsubscribe(subscriber)
+            raise
+        if len(rows) > limit:
+            replay = [(None, RESET_EVENT)]
+        else:
+            replay = [(row.id, format_event(NotificationResponse.model_validate(row))) for row in rows]
+
+    return StreamingResponse(event_stream(subscriber, replay), media_type="text/event-stream",
+                             headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"})
@@ -0,0 +1,31 @@
+from fastapi import APIRouter, Header, Response, status
+from app.config.settings import get_settings
+from app.schemas.user import PlanResponse
+from app.utils.plan_catalog import plan_catalog
+from app.utils.query_inspector import query_budget
+from typing import Optional
+
+
+router = APIRouter(tags=["Plans"])
+
+
+# If-None-Match uses the weak comparison: W/ prefixes are ignored
+def _etag_matches(if_none_match: str, etag: str):
+    if if_none_match.strip() == "*":
+        return True
+    return any(tag.strip().removeprefix("W/") == etag for tag in if_none_match.split(","))
+
+
+# Public catalog of the active plans, served from the in-process plan_catalog without touching the database.
+# Conditional requests carrying the current ETag get an empty 304.
+@router.get("/plans", response_model=list[PlanResponse], status_code=status.HTTP_200_OK,
+            responses={status.HTTP_304_NOT_MODIFIED: {"description": "The client's copy is up to date"}})
+@query_budget(0)
+async def get_plans(if_none_match: Optional[str] = Header(None)):
+    body, etag = await plan_catalog.get()
+    headers = {"ETag": etag, "Cache-Control": f"public, max-age={get_settings().plans_cache_max_age_seconds}"}
+    if if_none_match and _etag_matches(if_none_match, etag):
+        plan_catalog.not_modified += 1
+        return Response(status_code=status.HTTP_304_NOT_MODIFIED, headers=headers)
+    plan_catalog.hits += 1
+    return Response(content=body, media_type="application/json", headers=headers)
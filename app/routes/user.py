@@ -1,18 +1,40 @@
-from fastapi import APIRouter, Depends, HTTPException, status
+from fastapi import APIRouter, Depends, HTTPException, Query, status
 from app.schemas.user import UserProfileResponse, UserProfileUpdateRequest, UpdatePasswordRequest, UserProfileCreateRequest, UpdatePasswordResponse
+from app.schemas.user import ProfileResponse
+from app.schemas.user import NotificationPageResponse, MarkNotificationsReadRequest, MarkNotificationsReadResponse, UnreadCountResponse
 from app.utils import auth as auth_util
-from app.models import User, UserProfile
-from sqlalchemy.orm import Session
+from app.models import User, UserProfile, Subscription
+from sqlalchemy.orm import Session, joinedload
+from app.schemas.auth import Principal
 from app.config import database
+from app.utils.user_cache import invalidate_user
+from app.utils import notifications as notifications_util
+from app.utils.query_inspector import query_budget
+from app.utils.responses import ModelResponse
+from typing import Optional
 
 
 router = APIRouter(prefix="/user", tags=["User"])
 
 
+# Uses the claims-only principal so the user, profile, subscription and plan are fetched together in a single
+# query, followed by one query for a capped page of notifications
 @router.get("/profile", response_model=UserProfileResponse, status_code=status.HTTP_200_OK)
-def get_user(current_user: User = Depends(auth_util.get_current_user)):
+@query_budget(2)
+def get_user(notifications_limit: int = Query(20, ge=0, le=100),
+             notifications_cursor: Optional[str] = Query(None, description="next_cursor of the previous page"),
+             principal: Principal = Depends(auth_util.get_current_principal), db: Session = Depends(database.get_db)):
+    current_user = db.query(User).options(
+        joinedload(User.profile),
+        joinedload(User.subscription).joinedload(Subscription.plan),
+    ).filter(User.id == principal.id).first()
+    if not current_user:
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="User not found")
+    auth_util.check_token_version(current_user, principal)
     profile = current_user.profile
-    return {
+    notifications, next_cursor = notifications_util.page(db.execute(notifications_util.page_statement(
+        current_user.id, notifications_limit, notifications_cursor)).scalars().all(), notifications_limit)
+    return ModelResponse(UserProfileResponse.model_validate({
         "id": current_user.id,
         "email": current_user.email,
         "is_verified": current_user.is_verified,
@@ -20,11 +42,48 @@ def get_user(current_user: User = Depends(auth_util.get_current_user)):
         "country": profile.country if profile else None,
         "created_at": current_user.created_at,
         "updated_at": current_user.updated_at,
-        "notifications": current_user.notifications
-    }
+        "subscription": current_user.subscription,
+        "notifications": notifications,
+        "notifications_next_cursor": next_cursor
+    }, from_attributes=True))
+
+
+@router.get("/notifications", response_model=NotificationPageResponse, status_code=status.HTTP_200_OK)
+@query_budget(2)
+def get_notifications(limit: int = Query(20, ge=1, le=100),
+                      cursor: Optional[str] = Query(None, description="next_cursor of the previous page"),
+                      unread_only: bool = False,
+                      current_user: User = Depends(auth_util.get_current_user), db: Session = Depends(database.get_db)):
+    items, next_cursor = notifications_util.page(db.execute(
+        notifications_util.page_statement(current_user.id, limit, cursor, unread_only)).scalars().all(), limit)
+    return ModelResponse(NotificationPageResponse.model_validate({"items": items, "next_cursor": next_cursor},
+                                                                from_attributes=True))
+
+
+# Marks the given notifications as read, or all of them, in a single UPDATE
+@router.post("/notifications/read", response_model=MarkNotificationsReadResponse, status_code=status.HTTP_200_OK)
+def mark_notifications_read(payload: MarkNotificationsReadRequest, current_user: User = Depends(auth_util.get_current_user),
+                            db: Session = Depends(database.get_db)):
+    try:
+        updated = db.execute(notifications_util.mark_read_statement(current_user.id, payload.ids)).rowcount
+        unread_count = db.execute(notifications_util.unread_count_statement(current_user.id)).scalar()
+        db.commit()
+    except Exception as e:
+        db.rollback()
+        raise HTTPException(status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
+                            detail="Failed to mark notifications as read.")
+    return ModelResponse(MarkNotificationsReadResponse(updated=updated, unread_count=unread_count))
+
+
+# Served from the counter maintained by triggers, cheap enough to be polled
+@router.get("/notifications/unread-count", response_model=UnreadCountResponse, status_code=status.HTTP_200_OK)
+@query_budget(2)
+def get_unread_count(current_user: User = Depends(auth_util.get_current_user), db: Session = Depends(database.get_db)):
+    unread_count = db.execute(notifications_util.unread_count_statement(current_user.id)).scalar()
+    return ModelResponse(UnreadCountResponse(unread_count=unread_count))
 
 
-@router.post('/profile')
+@router.post('/profile', response_model=ProfileResponse)
 def create_user_profile(payload: UserProfileCreateRequest, current_user: User = Depends(auth_util.get_current_user), db: Session = Depends(database.get_db)):
     user_profile = UserProfile(user_id=current_user.id, full_name=payload.full_name, country=payload.country)
     db.add(user_profile)
@@ -34,11 +93,10 @@ def create_user_profile(payload: UserProfileCreateRequest, current_user: User =
     except Exception as e:
         raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail=f"Failed to create user profile.")
 
-    db.refresh(user_profile)
-    return user_profile
+    return ModelResponse(ProfileResponse.model_validate(user_profile))
 
 
-@router.put("/profile")
+@router.put("/profile", response_model=ProfileResponse)
 def update_user_profile(payload: UserProfileUpdateRequest, current_user: User = Depends(auth_util.get_current_user), db: Session = Depends(database.get_db)):
     current_user.profile.full_name = payload.full_name
     current_user.profile.country = payload.country
@@ -51,8 +109,8 @@ def update_user_profile(payload: UserProfileUpdateRequest, current_user: User =
         db.rollback()
         raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="Failed to update user profile.")
 
-    db.refresh(user_profile)
-    return user_profile
+    invalidate_user(current_user.id)
+    return ModelResponse(ProfileResponse.model_validate(user_profile))
 
 
 @router.put('/update-password', status_code=status.HTTP_200_OK)
@@ -63,6 +121,7 @@ def update_password(payload: UpdatePasswordRequest, current_user: User = Depends
 
         try:
             db.commit()
+            invalidate_user(current_user.id)
             return UpdatePasswordResponse(message="Password updated successfully")
         except Exception as e:
             raise HTTPException(status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
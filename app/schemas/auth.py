@@ -1,4 +1,4 @@
-from pydantic import BaseModel, EmailStr
+from pydantic import BaseModel, EmailStr, Field
 from typing import Optional
 
 
@@ -9,7 +9,8 @@ class UserRegistrationRequest(BaseModel):
 
 class UserRegistrationResponse(BaseModel):
     id: int
-    email: EmailStr
+    # Validated when registering, checking a stored address again on every response is pure overhead
+    email: str = Field(json_schema_extra={"format": "email"})
 
 
 class UserLoginRequest(BaseModel):
@@ -30,6 +31,17 @@ class RefreshTokenRequest(BaseModel):
 
 class TokenData(BaseModel):
     user_id: Optional[str] = None
+    role: Optional[str] = None
+    is_verified: Optional[bool] = None
+    token_version: int = 0
+
+
+# Identity of the caller taken from signed access token claims, without a database lookup
+class Principal(BaseModel):
+    id: int
+    role: str
+    is_verified: bool
+    token_version: int = 0
 
 
 class ForgotPasswordRequest(BaseModel):
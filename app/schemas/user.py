@@ -1,18 +1,90 @@
-from pydantic import BaseModel, EmailStr
+from pydantic import BaseModel, ConfigDict, Field
 from datetime import datetime
-from typing import Optional
+from typing import Any, Optional
+
+
+class PlanResponse(BaseModel):
+    model_config = ConfigDict(from_attributes=True)
+
+    id: int
+    name: str
+    description: Optional[str] = None
+    price: Optional[str] = None
+    features: Optional[Any] = None
+
+
+class SubscriptionResponse(BaseModel):
+    model_config = ConfigDict(from_attributes=True)
+
+    id: int
+    status: str
+    start_date: Optional[datetime] = None
+    end_date: Optional[datetime] = None
+    plan: Optional[PlanResponse] = None
+
+
+class EntitlementsResponse(BaseModel):
+    # Plan granting the features, "free" without an active subscription
+    plan: str
+    features: Optional[Any] = None
+    # End of the subscription, None when it does not expire
+    expires_at: Optional[datetime] = None
+
+
+class NotificationResponse(BaseModel):
+    model_config = ConfigDict(from_attributes=True)
+
+    id: int
+    message: str
+    is_read: bool
+    is_sent: bool
+    created_at: datetime
 
 
 class UserProfileResponse(BaseModel):
     id: int
-    email: EmailStr
+    # Validated when registering, checking a stored address again on every response is pure overhead
+    email: str = Field(json_schema_extra={"format": "email"})
     full_name: Optional[str] = None
     country: Optional[str] = None
     is_verified: bool
     created_at: datetime
     updated_at: Optional[datetime] = None
-    subscriptions: Optional[list[dict]] = None
-    notifications: Optional[list[dict]] = None
+    subscription: Optional[SubscriptionResponse] = None
+    # Latest notifications first, pass notifications_next_cursor back as notifications_cursor for the next page
+    notifications: list[NotificationResponse] = []
+    notifications_next_cursor: Optional[str] = None
+
+
+class NotificationPageResponse(BaseModel):
+    items: list[NotificationResponse]
+    # Pass back as cursor to fetch the next page, None on the last page
+    next_cursor: Optional[str] = None
+
+
+class MarkNotificationsReadRequest(BaseModel):
+    # Every unread notification when omitted
+    ids: Optional[list[int]] = Field(None, max_length=1000)
+
+
+class MarkNotificationsReadResponse(BaseModel):
+    updated: int
+    unread_count: int
+
+
+class UnreadCountResponse(BaseModel):
+    unread_count: int
+
+
+class ProfileResponse(BaseModel):
+    model_config = ConfigDict(from_attributes=True)
+
+    id: int
+    user_id: int
+    full_name: Optional[str] = None
+    country: Optional[str] = None
+    created_at: datetime
+    updated_at: Optional[datetime] = None
 
 
 class UserProfileCreateRequest(BaseModel):
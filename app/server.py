@@ -0,0 +1,64 @@
+"""Production server: gunicorn supervising uvicorn workers (see gunicorn.conf.py).
+
+    gunicorn app.main:app
+"""
+from gunicorn.arbiter import Arbiter
+from uvicorn import Server
+from uvicorn_worker import UvicornWorker
+from app.config.settings import cpu_limit, get_settings
+from app.utils.health import server_state
+from app.utils.notification_stream import notification_hub
+import asyncio
+import math
+import sys
+
+
+# Server worker processes gunicorn starts. Each one runs an event loop, one per CPU saturates them. At least
+# two, so that a worker recycled after its max requests never leaves the instance without one.
+def worker_count():
+    settings = get_settings()
+    if settings.web_concurrency:
+        return settings.web_concurrency
+    return max(2, round(cpu_limit() * settings.server_workers_per_cpu))
+
+
+# Uvicorn server draining before it stops when asked to by a signal: GET /health/ready fails right away while
+# requests keep being served for SERVER_DRAIN_SECONDS, long enough for the load balancer to route new ones
+# elsewhere. The notification streams are then ended, their clients reconnect to another instance, and
+# uvicorn waits for the requests in flight. A worker recycled after its max requests skips the drain, the
+# other workers keep the instance ready.
+class DrainingServer(Server):
+    def __init__(self, config):
+        super().__init__(config)
+        self.signalled = False
+
+    def handle_exit(self, sig, frame):
+        self.signalled = True
+        server_state.draining = True
+        super().handle_exit(sig, frame)
+
+    async def shutdown(self, sockets=None):
+        drain_seconds = get_settings().server_drain_seconds
+        if self.signalled and drain_seconds:
+            await asyncio.sleep(drain_seconds)
+        notification_hub.close()
+        await super().shutdown(sockets=sockets)
+
+
+# Uvicorn worker on uvloop and httptools, serving with DrainingServer
+class Worker(UvicornWorker):
+    CONFIG_KWARGS = {
+        "loop": "uvloop",
+        "http": "httptools",
+        # What is left of the graceful timeout once drained, for the requests in flight
+        "timeout_graceful_shutdown": max(1, get_settings().server_graceful_timeout
+                                         - math.ceil(get_settings().server_drain_seconds) - 1),
+    }
+
+    async def _serve(self):
+        self.config.app = self.wsgi
+        server = DrainingServer(config=self.config)
+        self._install_sigquit_handler()
+        await server.serve(sockets=self.sockets)
+        if not server.started:
+            sys.exit(Arbiter.WORKER_BOOT_ERROR)
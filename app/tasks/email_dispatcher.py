@@ -0,0 +1,192 @@
+from sqlalchemy import func, insert, select, update
+from datetime import timedelta
+from app.config import database
+from app.models import EmailOutbox, Jobs, FailedJobs
+from app.utils.metrics import Counter, Histogram
+from app.config.settings import get_settings
+import app.utils.email as email_utility
+import argparse
+import asyncio
+import httpx
+import logging
+import random
+import time
+
+
+logger = logging.getLogger(__name__)
+
+
+# Delivery counters since the process started, and the duration of each provider batch
+sent_emails = Counter()
+failed_attempts = Counter()
+dead_letters = Counter()
+batch_seconds = Histogram()
+
+
+# Claim up to batch_size due emails and hide them from other dispatchers for the lease duration.
+# SKIP LOCKED lets several dispatchers drain the outbox concurrently without claiming the same email twice,
+# and an email claimed by a dispatcher that crashed becomes due again once its lease expires.
+def _claim_statement(batch_size: int, lease_seconds: int):
+    due = (
+        select(EmailOutbox.id)
+        .where(EmailOutbox.status == 'pending', EmailOutbox.next_attempt_at <= func.now())
+        .order_by(EmailOutbox.next_attempt_at)
+        .limit(batch_size)
+        .with_for_update(skip_locked=True)
+    )
+    return (
+        update(EmailOutbox)
+        .where(EmailOutbox.id.in_(due.scalar_subquery()))
+        .values(attempts=EmailOutbox.attempts + 1, next_attempt_at=func.now() + timedelta(seconds=lease_seconds))
+        .returning(EmailOutbox.id, EmailOutbox.recipient, EmailOutbox.subject, EmailOutbox.body, EmailOutbox.attempts)
+    )
+
+
+# Exponential backoff with jitter, so emails failing together are not all retried at the same instant
+def retry_delay(attempts: int):
+    settings = get_settings()
+    delay = min(settings.email_retry_backoff_seconds * 2 ** (attempts - 1), settings.email_retry_max_backoff_seconds)
+    return timedelta(seconds=delay * random.uniform(0.5, 1.0))
+
+
+def create_http_client():
+    settings = get_settings()
+    # A single pooled client per dispatcher, connection failures are retried by the transport
+    transport = httpx.AsyncHTTPTransport(
+        retries=2,
+        limits=httpx.Limits(max_connections=settings.email_http_max_connections,
+                            max_keepalive_connections=settings.email_http_max_connections),
+    )
+    return httpx.AsyncClient(transport=transport, headers=email_utility.api_headers(),
+                             timeout=settings.email_http_timeout_seconds)
+
+
+# Send the emails in one provider request, returns one error per email (None when it was accepted)
+async def _send_batch(client: httpx.AsyncClient, emails: list):
+    try:
+        response = await client.post(get_settings().email_api_batch_endpoint,
+                                     json=email_utility.batch_payload(emails))
+    except httpx.HTTPError as e:
+        return [f"{type(e).__name__}: {e}"] * len(emails)
+    if response.status_code >= 400:
+        return [f"HTTP {response.status_code}: {response.text[:500]}"] * len(emails)
+
+    results = response.json().get("responses", [])
+    errors = []
+    for i in range(len(emails)):
+        result = results[i] if i < len(results) else {"success": False, "errors": ["Missing from batch response"]}
+        errors.append(None if result.get("success") else "; ".join(map(str, result.get("errors") or ["Rejected"])))
+    return errors
+
+
+# Mark delivered emails as sent, schedule a retry for failed ones, and move the ones out of attempts
+# to the dead letter jobs, all in one transaction
+async def _record_results(emails: list, errors: list):
+    sent_ids = [email.id for email, error in zip(emails, errors) if error is None]
+    async with database.async_engine.begin() as conn:
+        if sent_ids:
+            await conn.execute(
+                update(EmailOutbox).where(EmailOutbox.id.in_(sent_ids))
+                .values(status='sent', sent_at=func.now(), last_error=None))
+        for email, error in zip(emails, errors):
+            if error is None:
+                continue
+            if email.attempts < get_settings().email_max_attempts:
+                await conn.execute(
+                    update(EmailOutbox).where(EmailOutbox.id == email.id)
+                    .values(next_attempt_at=func.now() + retry_delay(email.attempts), last_error=error))
+                continue
+            await conn.execute(
+                update(EmailOutbox).where(EmailOutbox.id == email.id).values(status='failed', last_error=error))
+            job_id = (await conn.execute(
+                insert(Jobs).values(
+                    queue='email',
+                    type='email.send',
+                    status='failed',
+                    attempts=email.attempts,
+                    payload={"email_outbox_id": email.id, "recipient": email.recipient, "subject": email.subject},
+                    retries=email.attempts,
+                    max_retries=get_settings().email_max_attempts,
+                    last_error=error,
+                ).returning(Jobs.id))).scalar_one()
+            await conn.execute(insert(FailedJobs).values(job_id=job_id, error_message=error))
+            dead_letters.inc()
+            logger.warning("Email %s to %s moved to dead letters: %s", email.id, email.recipient, error)
+
+    sent_emails.inc(len(sent_ids))
+    failed_attempts.inc(len(emails) - len(sent_ids))
+
+
+# Claim, send and record one batch, returns the number of emails claimed
+async def dispatch_once(client: httpx.AsyncClient, batch_size: int = None):
+    batch_size = batch_size or get_settings().email_dispatch_batch_size
+    async with database.async_engine.begin() as conn:
+        emails = (await conn.execute(
+            _claim_statement(batch_size, get_settings().email_dispatch_lease_seconds))).all()
+    if not emails:
+        return 0
+
+    start = time.perf_counter()
+    errors = await _send_batch(client, emails)
+    batch_seconds.observe(time.perf_counter() - start)
+    await _record_results(emails, errors)
+    return len(emails)
+
+
+def dispatcher_stats():
+    return {
+        "sent": sent_emails.value,
+        "failed_attempts": failed_attempts.value,
+        "dead_letters": dead_letters.value,
+        "batch_seconds": batch_seconds.snapshot(),
+    }
+
+
+# Long running task started by the application lifespan when EMAIL_DISPATCHER_ENABLED is set
+async def dispatcher_loop(interval_seconds: float, batch_size: int = None):
+    batch_size = batch_size or get_settings().email_dispatch_batch_size
+    async with create_http_client() as client:
+        while True:
+            try:
+                # Full batches are drained back to back, the outbox is only polled again once it is empty
+                if await dispatch_once(client, batch_size) >= batch_size:
+                    continue
+            except Exception:
+                logger.exception("Email dispatch failed")
+            await asyncio.sleep(interval_seconds)
+
+
+# Deliver everything currently due, used by the email.dispatch_outbox job and the command line
+async def drain(batch_size: int = None):
+    batch_size = batch_size or get_settings().email_dispatch_batch_size
+    total = 0
+    try:
+        async with create_http_client() as client:
+            while True:
+                claimed = await dispatch_once(client, batch_size)
+                total += claimed
+                if claimed < batch_size:
+                    return total
+    finally:
+        await database.async_engine.dispose()
+
+
+def main():
+    settings = get_settings()
+    parser = argparse.ArgumentParser(description="Deliver the emails waiting in the outbox.")
+    parser.add_argument("--batch-size", type=int, default=settings.email_dispatch_batch_size)
+    parser.add_argument("--loop", action="store_true", help="keep polling every EMAIL_DISPATCH_INTERVAL_SECONDS")
+    args = parser.parse_args()
+    logging.basicConfig(level=logging.INFO)
+
+    if args.loop:
+        asyncio.run(dispatcher_loop(settings.email_dispatch_interval_seconds, args.batch_size))
+    else:
+        claimed = asyncio.run(drain(args.batch_size))
+        stats = dispatcher_stats()
+        print(f"{claimed} claimed, {stats['sent']} sent, {stats['failed_attempts']} failed, "
+              f"{stats['dead_letters']} dead letters")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,73 @@
+from pydantic import BaseModel
+from app.config.settings import get_settings
+from app.tasks.queue import job, enqueue, enqueue_statement, run_workers
+from app.tasks import email_dispatcher
+from app.tasks.reaper import run_reaper
+import argparse
+import json
+import logging
+
+
+class DispatchEmailOutboxPayload(BaseModel):
+    batch_size: int | None = None
+
+
+class ReapSessionsPayload(BaseModel):
+    batch_size: int | None = None
+    max_batches: int | None = None
+    # Enqueue the next run this many seconds after this one finished, making the job recurring
+    every_seconds: int | None = None
+
+
+# Deliver every email due in the outbox, failures are retried by the outbox itself
+@job("email.dispatch_outbox", DispatchEmailOutboxPayload, queue="email")
+async def dispatch_email_outbox(payload: DispatchEmailOutboxPayload):
+    await email_dispatcher.drain(payload.batch_size)
+
+
+# Purge expired sessions and verification tokens
+@job("sessions.reap", ReapSessionsPayload)
+def reap_sessions(payload: ReapSessionsPayload):
+    run_reaper(batch_size=payload.batch_size, max_batches=payload.max_batches)
+    if payload.every_seconds:
+        enqueue("sessions.reap", payload, delay_seconds=payload.every_seconds, unique_key="sessions.reap")
+
+
+# Statement waking an email worker up for emails added to the outbox in the caller's transaction, executed right
+# before the commit. All the emails queued before a worker picks the job up are delivered by that single job.
+# It is coalesced with unless_queued rather than a unique key: every register and forget-password request would
+# otherwise wait on the uncommitted job of the previous one. A request coalescing into a queued job keeps it
+# from being claimed until the request committed, the job then delivers that request's emails too. Concurrent
+# requests may enqueue a few jobs, the first delivers the emails and the others find the outbox drained.
+def dispatch_email_outbox_statement():
+    return enqueue_statement("email.dispatch_outbox", unless_queued=True)
+
+
+def main():
+    settings = get_settings()
+    parser = argparse.ArgumentParser(description="Run job queue workers or enqueue a job.")
+    commands = parser.add_subparsers(dest="command", required=True)
+    worker_parser = commands.add_parser("worker", help="process jobs")
+    worker_parser.add_argument("--processes", type=int, default=settings.job_worker_processes)
+    worker_parser.add_argument("--queues", default=",".join(settings.job_queues))
+    worker_parser.add_argument("--batch-size", type=int, default=settings.job_batch_size)
+    enqueue_parser = commands.add_parser("enqueue", help="enqueue a job, e.g. sessions.reap")
+    enqueue_parser.add_argument("type")
+    enqueue_parser.add_argument("--payload", default="{}", help="JSON payload")
+    enqueue_parser.add_argument("--priority", type=int, default=0)
+    enqueue_parser.add_argument("--delay-seconds", type=float, default=0)
+    enqueue_parser.add_argument("--unique-key")
+    args = parser.parse_args()
+    logging.basicConfig(level=logging.INFO)
+
+    if args.command == "worker":
+        queues = [queue.strip() for queue in args.queues.split(",") if queue.strip()]
+        run_workers(args.processes, queues, args.batch_size)
+    else:
+        job_id = enqueue(args.type, json.loads(args.payload), priority=args.priority,
+                         delay_seconds=args.delay_seconds, unique_key=args.unique_key)
+        print(f"Enqueued job {job_id}" if job_id else f"Coalesced into the queued {args.unique_key} job")
+
+
+if __name__ == "__main__":
+    main()
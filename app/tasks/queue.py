@@ -0,0 +1,291 @@
+from sqlalchemy import delete, exists, func, insert, literal, select, text, tuple_, update
+from sqlalchemy.sql.expression import ClauseElement
+from sqlalchemy.dialects.postgresql import insert as pg_insert
+from pydantic import BaseModel
+from datetime import datetime, timedelta
+from app.config import database
+from app.config.settings import get_settings
+from app.models import Jobs, FailedJobs
+from app.utils.metrics import Counter, Histogram
+import asyncio
+import importlib
+import inspect
+import logging
+import multiprocessing
+import os
+import psycopg2
+import random
+import select as select_module
+import signal
+import socket
+import time
+
+
+logger = logging.getLogger(__name__)
+
+# Channel notified by the jobs_notify trigger with the queue name of every queued job
+NOTIFY_CHANNEL = "jobs"
+# Module defining the application's job types, imported by every worker process
+JOBS_MODULE = "app.tasks.jobs"
+
+
+# Job outcomes in this process, and the duration of each job
+processed_jobs = Counter()
+retried_jobs = Counter()
+dead_jobs = Counter()
+job_seconds = Histogram()
+
+
+class JobDefinition:
+    def __init__(self, name: str, handler, payload_model: type[BaseModel], queue: str, max_retries: int):
+        self.name = name
+        self.handler = handler
+        self.payload_model = payload_model
+        self.queue = queue
+        self.max_retries = max_retries
+
+
+# Registered job types by name
+registry = {}
+
+
+# Decorator registering a job handler. The handler receives the validated payload model and can be
+# a plain or an async function, it fails the job by raising.
+def job(name: str, payload_model: type[BaseModel], queue: str = "default", max_retries: int = 3):
+    def decorator(handler):
+        registry[name] = JobDefinition(name, handler, payload_model, queue, max_retries)
+        return handler
+    return decorator
+
+
+# Statement enqueuing a job, executed by the caller so the job is committed with the caller's transaction.
+# Jobs sharing a unique_key are coalesced while one of them is still queued, which makes enqueuing idempotent;
+# note that a concurrent enqueue of the same key waits for the first transaction to commit, so unique keys
+# serialize the transactions enqueuing them. unless_queued coalesces without that wait: the job is skipped
+# when a fresh job of the same type is already queued and committed, concurrent transactions may then each
+# enqueue one. Meant for idempotent jobs enqueued on hot paths, where a duplicate is cheaper than the wait.
+# The queued job is share locked until the caller commits, so workers skip it rather than running it before
+# the caller's data is visible, and notified so that they claim it once the caller committed. Share locks do
+# not conflict with each other, concurrent callers coalescing into the same job do not wait on one another.
+def enqueue_statement(name: str, payload: BaseModel | dict = None, priority: int = 0, run_at: datetime = None,
+                      delay_seconds: float = 0, unique_key: str = None, unless_queued: bool = False):
+    definition = registry[name]
+    payload = definition.payload_model.model_validate(payload or {})
+    values = {
+        "queue": definition.queue,
+        "type": name,
+        "payload": payload.model_dump(mode="json"),
+        "priority": priority,
+        "max_retries": definition.max_retries,
+        "unique_key": unique_key,
+    }
+    if run_at is not None:
+        values["run_at"] = run_at
+    elif delay_seconds:
+        values["run_at"] = func.now() + timedelta(seconds=delay_seconds)
+    if unless_queued:
+        queued = (
+            select(Jobs.id, func.pg_notify(NOTIFY_CHANNEL, Jobs.queue).label("notified"))
+            .where(Jobs.queue == definition.queue, Jobs.type == name, Jobs.status == 'queued', Jobs.retries == 0)
+            .limit(1)
+            .with_for_update(read=True)
+            .cte("queued")
+        )
+        columns = Jobs.__table__.c
+        row = select(*(value if isinstance(value, ClauseElement) else literal(value, columns[key].type)
+                       for key, value in values.items())).where(~exists(select(queued.c.id)))
+        return insert(Jobs).from_select(list(values), row).returning(Jobs.id)
+    statement = pg_insert(Jobs).values(**values)
+    if unique_key is not None:
+        statement = statement.on_conflict_do_nothing(
+            index_elements=[Jobs.unique_key], index_where=text("status = 'queued' AND retries = 0"))
+    return statement.returning(Jobs.id)
+
+
+# Enqueue a job in its own transaction, returns its id (None when coalesced into an already queued job)
+def enqueue(name: str, payload: BaseModel | dict = None, **options):
+    with database.engine.begin() as conn:
+        return conn.execute(enqueue_statement(name, payload, **options)).scalar()
+
+
+# Claim up to batch_size due jobs of the given queues, highest priority first.
+# SKIP LOCKED lets workers claim concurrently without waiting on each other. A claimed job is marked running
+# and its run_at is pushed by the visibility timeout, so the job of a crashed worker becomes due again.
+def claim_statement(queues: list, batch_size: int, worker_id: str, visibility_timeout_seconds: int):
+    due = (
+        select(Jobs.id)
+        .where(Jobs.queue.in_(queues), Jobs.status.in_(('queued', 'running')), Jobs.run_at <= func.now())
+        .order_by(Jobs.priority.desc(), Jobs.run_at)
+        .limit(batch_size)
+        .with_for_update(skip_locked=True)
+    )
+    return (
+        update(Jobs)
+        .where(Jobs.id.in_(due.scalar_subquery()))
+        .values(status='running', attempts=Jobs.attempts + 1, locked_by=worker_id, updated_at=func.now(),
+                run_at=func.now() + timedelta(seconds=visibility_timeout_seconds))
+        .returning(Jobs.id, Jobs.type, Jobs.payload, Jobs.attempts, Jobs.max_retries)
+    )
+
+
+# Exponential backoff with jitter, so jobs failing together are not all retried at the same instant
+def retry_delay(attempts: int):
+    settings = get_settings()
+    delay = min(settings.job_retry_backoff_seconds * 2 ** (attempts - 1), settings.job_retry_max_backoff_seconds)
+    return timedelta(seconds=delay * random.uniform(0.5, 1.0))
+
+
+class PermanentJobError(Exception):
+    """Raised by a handler to move its job to the failed jobs without any further retry."""
+
+
+class Worker:
+    def __init__(self, queues: list = None, batch_size: int = None, worker_id: str = None):
+        self.queues = queues or get_settings().job_queues
+        self.batch_size = batch_size or get_settings().job_batch_size
+        self.worker_id = worker_id or f"{socket.gethostname()}:{os.getpid()}"
+        self.stopping = False
+
+    def claim(self):
+        with database.engine.begin() as conn:
+            return conn.execute(claim_statement(
+                self.queues, self.batch_size, self.worker_id, get_settings().job_visibility_timeout_seconds)).all()
+
+    # Run a claimed job, returns whether it succeeded. Failures are recorded right away.
+    def run_job(self, job):
+        start = time.perf_counter()
+        succeeded = False
+        try:
+            definition = registry.get(job.type)
+            if definition is None:
+                raise PermanentJobError(f"Unknown job type {job.type}")
+            if job.attempts > job.max_retries + 1:
+                raise PermanentJobError("Visibility timeout expired on every attempt")
+            payload = definition.payload_model.model_validate(job.payload or {})
+            if inspect.iscoroutinefunction(definition.handler):
+                asyncio.run(definition.handler(payload))
+            else:
+                definition.handler(payload)
+            succeeded = True
+        except Exception as e:
+            logger.exception("Job %s (%s) failed on attempt %s", job.id, job.type, job.attempts)
+            self._fail(job, f"{type(e).__name__}: {e}", permanent=isinstance(e, PermanentJobError))
+        job_seconds.observe(time.perf_counter() - start)
+        return succeeded
+
+    # Each statement only applies to the claim it was made for, in case the job was claimed again meanwhile
+    def _claimed(self, job):
+        return (Jobs.id == job.id) & (Jobs.attempts == job.attempts)
+
+    # Delete the jobs of a batch that succeeded in a single statement
+    def _complete(self, jobs: list):
+        if not jobs:
+            return
+        with database.engine.begin() as conn:
+            conn.execute(delete(Jobs).where(
+                tuple_(Jobs.id, Jobs.attempts).in_([(job.id, job.attempts) for job in jobs])))
+        processed_jobs.inc(len(jobs))
+
+    def _fail(self, job, error: str, permanent: bool = False):
+        with database.engine.begin() as conn:
+            if not permanent and job.attempts <= job.max_retries:
+                conn.execute(
+                    update(Jobs).where(self._claimed(job))
+                    .values(status='queued', retries=Jobs.retries + 1, run_at=func.now() + retry_delay(job.attempts),
+                            locked_by=None, last_error=error, updated_at=func.now()))
+                retried_jobs.inc()
+                return
+            failed = conn.execute(
+                update(Jobs).where(self._claimed(job))
+                .values(status='failed', locked_by=None, last_error=error, updated_at=func.now())
+                .returning(Jobs.id)).scalar()
+            if failed:
+                conn.execute(insert(FailedJobs).values(job_id=job.id, error_message=error))
+        dead_jobs.inc()
+
+    def _listen(self):
+        conn = psycopg2.connect(get_settings().listen_dsn)
+        conn.set_isolation_level(psycopg2.extensions.ISOLATION_LEVEL_AUTOCOMMIT)
+        conn.cursor().execute(f"LISTEN {NOTIFY_CHANNEL}")
+        return conn
+
+    # Block until a job is queued on one of our queues, or until the poll interval elapsed
+    # (jobs scheduled with a run_at, retries and expired visibility timeouts are not notified)
+    def _wait(self, conn, timeout: float):
+        deadline = time.monotonic() + timeout
+        while not self.stopping:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0 or not select_module.select([conn], [], [], remaining)[0]:
+                return
+            conn.poll()
+            notified = any(notify.payload in self.queues for notify in conn.notifies)
+            conn.notifies.clear()
+            if notified:
+                return
+
+    def stop(self, *args):
+        self.stopping = True
+
+    # Process jobs until stopped, or until no job is due when exit_when_empty is set
+    def run(self, exit_when_empty: bool = False):
+        listen_conn = None if exit_when_empty else self._listen()
+        try:
+            while not self.stopping:
+                jobs = self.claim()
+                self._complete([job for job in jobs if self.run_job(job)])
+                # A full batch means more jobs are probably due, claim again right away
+                if len(jobs) == self.batch_size:
+                    continue
+                if exit_when_empty and not jobs:
+                    return
+                if listen_conn is not None:
+                    self._wait(listen_conn, get_settings().job_poll_interval_seconds)
+        finally:
+            if listen_conn is not None:
+                listen_conn.close()
+
+
+def queue_stats():
+    with database.engine.connect() as conn:
+        rows = conn.execute(
+            select(Jobs.queue, Jobs.status, func.count(), func.min(Jobs.created_at))
+            .group_by(Jobs.queue, Jobs.status)).all()
+        now = conn.execute(select(func.now())).scalar()
+    stats = {}
+    for queue, status, count, oldest in rows:
+        stats.setdefault(queue, {})[status] = {"count": count, "oldest_seconds": (now - oldest).total_seconds()}
+    return {
+        "queues": stats,
+        "processed": processed_jobs.value,
+        "retried": retried_jobs.value,
+        "dead": dead_jobs.value,
+        "job_seconds": job_seconds.snapshot(),
+    }
+
+
+def _worker_process(queues: list, batch_size: int):
+    logging.basicConfig(level=logging.INFO)
+    importlib.import_module(JOBS_MODULE)
+    worker = Worker(queues, batch_size)
+    # Finish the job at hand before exiting
+    signal.signal(signal.SIGTERM, worker.stop)
+    signal.signal(signal.SIGINT, worker.stop)
+    worker.run()
+
+
+# Start one worker per process and wait for them, SIGTERM / SIGINT stop them gracefully
+def run_workers(processes: int, queues: list, batch_size: int):
+    context = multiprocessing.get_context("spawn")
+    workers = [context.Process(target=_worker_process, args=(queues, batch_size)) for _ in range(processes)]
+    for worker in workers:
+        worker.start()
+
+    def stop(*args):
+        for worker in workers:
+            if worker.is_alive():
+                worker.terminate()
+
+    signal.signal(signal.SIGTERM, stop)
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+    for worker in workers:
+        worker.join()
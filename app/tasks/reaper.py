@@ -0,0 +1,131 @@
+from sqlalchemy import and_, delete, func, or_, select
+from datetime import timedelta
+from app.config import database
+from app.config.settings import get_settings
+from app.models import EmailOutbox, UserSession, UserVerificationToken
+from app.utils.metrics import Counter, Histogram
+import argparse
+import asyncio
+import logging
+import time
+
+
+logger = logging.getLogger(__name__)
+
+
+# Rows purged per table since the process started, and the duration of each run
+purged_rows = {
+    UserSession.__tablename__: Counter(),
+    UserVerificationToken.__tablename__: Counter(),
+    EmailOutbox.__tablename__: Counter(),
+}
+runs = Counter()
+run_seconds = Histogram()
+last_run = {}
+
+
+# Sessions past their expiry, or invalidated (refresh token and expiry cleared) longer than the retention window ago.
+# Rotated sessions keep the expiry of their token, so that its reuse is detected for as long as the token is valid.
+def _expired_sessions(cutoff):
+    return or_(
+        UserSession.refresh_token_expiry < cutoff,
+        and_(UserSession.refresh_token_hash.is_(None), UserSession.refresh_token_expiry.is_(None),
+             UserSession.created_at < cutoff),
+    )
+
+
+# Verification tokens are kept until their expiry, used or not, plus the retention window
+def _expired_verification_tokens(cutoff):
+    return UserVerificationToken.token_expiry < cutoff
+
+
+# Emails sent or dead lettered longer than the retention window ago. next_attempt_at holds the end of the lease of
+# their last attempt, i.e. when they were sent or given up on.
+def _finished_emails(cutoff):
+    return and_(EmailOutbox.status != 'pending', EmailOutbox.next_attempt_at < cutoff)
+
+
+# Delete matching rows in batches, each batch in its own short transaction.
+# SKIP LOCKED lets several reapers (or a reaper and live traffic) work on the table without waiting on each other.
+def _purge(model, condition, batch_size: int, max_batches: int):
+    total = 0
+    for _ in range(max_batches):
+        batch = select(model.id).where(condition).limit(batch_size).with_for_update(skip_locked=True)
+        with database.engine.begin() as conn:
+            deleted = conn.execute(delete(model).where(model.id.in_(batch.scalar_subquery()))).rowcount
+        total += deleted
+        if deleted < batch_size:
+            break
+    return total
+
+
+# Run one reaper pass over sessions, verification tokens and emails, returns the number of purged rows per table
+def run_reaper(batch_size: int = None, max_batches: int = None):
+    settings = get_settings()
+    batch_size = batch_size or settings.reaper_batch_size
+    max_batches = max_batches or settings.reaper_max_batches
+    start = time.perf_counter()
+    with database.engine.connect() as conn:
+        now = conn.execute(select(func.now())).scalar()
+
+    result = {
+        UserSession.__tablename__: _purge(
+            UserSession, _expired_sessions(now - timedelta(hours=settings.session_retention_hours)),
+            batch_size, max_batches),
+        UserVerificationToken.__tablename__: _purge(
+            UserVerificationToken,
+            _expired_verification_tokens(now - timedelta(hours=settings.verification_token_retention_hours)),
+            batch_size, max_batches),
+        EmailOutbox.__tablename__: _purge(
+            EmailOutbox, _finished_emails(now - timedelta(hours=settings.email_outbox_retention_hours)),
+            batch_size, max_batches),
+    }
+
+    duration = time.perf_counter() - start
+    for table, count in result.items():
+        purged_rows[table].inc(count)
+    runs.inc()
+    run_seconds.observe(duration)
+    last_run.update({"finished_at": time.time(), "duration_seconds": duration, "purged": result})
+    logger.info("Reaper purged %s in %.2fs", result, duration)
+    return result
+
+
+def reaper_stats():
+    return {
+        "runs": runs.value,
+        "purged_rows": {table: counter.value for table, counter in purged_rows.items()},
+        "run_seconds": run_seconds.snapshot(),
+        "last_run": last_run,
+    }
+
+
+# Periodic task started by the application lifespan when REAPER_ENABLED is set
+async def reaper_loop(interval_seconds: int):
+    while True:
+        try:
+            await asyncio.to_thread(run_reaper)
+        except Exception:
+            logger.exception("Reaper run failed")
+        await asyncio.sleep(interval_seconds)
+
+
+def main():
+    settings = get_settings()
+    parser = argparse.ArgumentParser(description="Delete expired sessions, verification tokens and delivered emails.")
+    parser.add_argument("--batch-size", type=int, default=settings.reaper_batch_size)
+    parser.add_argument("--max-batches", type=int, default=settings.reaper_max_batches)
+    parser.add_argument("--loop", action="store_true", help="keep running every REAPER_INTERVAL_SECONDS")
+    args = parser.parse_args()
+    logging.basicConfig(level=logging.INFO)
+
+    while True:
+        result = run_reaper(batch_size=args.batch_size, max_batches=args.max_batches)
+        print(", ".join(f"{table}: {count} purged" for table, count in result.items()))
+        if not args.loop:
+            break
+        time.sleep(settings.reaper_interval_seconds)
+
+
+if __name__ == "__main__":
+    main()
@@ -1,67 +1,101 @@
-from fastapi import Depends, HTTPException, status
-from passlib.context import CryptContext
+from fastapi import Depends, HTTPException, Request, status
 from jwt.exceptions import InvalidTokenError
 from datetime import datetime, timedelta, timezone
 import jwt
-from app.schemas.auth import TokenData
+from app.schemas.auth import TokenData, Principal
 from fastapi.security import OAuth2PasswordBearer
-from app.models import User, UserVerificationToken
+from app.models import User, UserVerificationToken, UserSession
+from sqlalchemy import LargeBinary, TIMESTAMP, delete, func, insert, literal, or_, select, update
 from sqlalchemy.orm import Session
+from sqlalchemy.ext.asyncio import AsyncSession
+from typing import Optional
 import os
-from app.config.oauth2 import oauth2_secret_key, oauth2_algorithm, oauth2_access_token_expiry
+import hashlib
+from app.config.settings import get_settings
 from app.config import database
+from app.utils.hashing import hashing_service
+from app.utils import user_cache
 
 
+# Password hashing runs on the dedicated hashing processes, see app.utils.hashing
 def hash_password(pwd: str):
-    pwd_context = CryptContext(schemes=["bcrypt"], deprecated="auto")
-    hashed_pwd = pwd_context.hash(pwd)
-    return hashed_pwd
+    return hashing_service.hash(pwd)
 
 
 def verify_password(plain_pwd, hashed_pwd):
-    pwd_context = CryptContext(schemes=["bcrypt"], deprecated="auto")
-    return pwd_context.verify(plain_pwd, hashed_pwd)
+    is_valid, _ = hashing_service.verify_and_update(plain_pwd, hashed_pwd)
+    return is_valid
+
+
+# Returns (is_valid, new_hash), new_hash is set when the stored hash should be replaced
+def verify_and_update_password(plain_pwd, hashed_pwd):
+    return hashing_service.verify_and_update(plain_pwd, hashed_pwd)
+
+
+async def hash_password_async(pwd: str):
+    return await hashing_service.hash_async(pwd)
+
+
+async def verify_password_async(plain_pwd, hashed_pwd):
+    is_valid, _ = await hashing_service.verify_and_update_async(plain_pwd, hashed_pwd)
+    return is_valid
+
+
+async def verify_and_update_password_async(plain_pwd, hashed_pwd):
+    return await hashing_service.verify_and_update_async(plain_pwd, hashed_pwd)
 
 
-SECRET_KEY = oauth2_secret_key
-ALGORITHM = oauth2_algorithm
-ACCESS_TOKEN_EXPIRE_MINUTES = oauth2_access_token_expiry
 oauth2_scheme = OAuth2PasswordBearer(tokenUrl="login")
 
 
 # Utility function to create JWT access token
+# role and is_verified are embedded so that get_current_principal can skip the user lookup
 def create_access_token(data: dict):
-    access_token_expires = timedelta(minutes=ACCESS_TOKEN_EXPIRE_MINUTES)
+    settings = get_settings()
+    access_token_expires = timedelta(minutes=settings.oauth2_access_token_expire_minutes)
     expire = datetime.now(timezone.utc) + access_token_expires
     data_to_encode = {
         "exp": expire,
-        "sub": data["user_id"]
+        "sub": data["user_id"],
+        "role": data.get("role"),
+        "is_verified": data.get("is_verified"),
+        "ver": data.get("token_version", 0)
     }
-    encoded_jwt = jwt.encode(data_to_encode, SECRET_KEY, algorithm=ALGORITHM)
+    encoded_jwt = jwt.encode(data_to_encode, settings.oauth2_secret_key, algorithm=settings.oauth2_algorithm)
     return encoded_jwt
 
 
 # Utility function to create refresh token
+# jti makes every token unique, even when two are issued for the same user within the same second
 def create_refresh_token(data: dict, expires_minutes: int = 60 * 24 * 7):
+    settings = get_settings()
     expire = datetime.now(timezone.utc) + timedelta(minutes=expires_minutes)
     data_to_encode = {
         "exp": expire,
-        "sub": data["user_id"]
+        "sub": data["user_id"],
+        "ver": data.get("token_version", 0),
+        "jti": os.urandom(16).hex()
     }
-    encoded_jwt = jwt.encode(data_to_encode, SECRET_KEY, algorithm=ALGORITHM)
+    encoded_jwt = jwt.encode(data_to_encode, settings.oauth2_secret_key, algorithm=settings.oauth2_algorithm)
     return encoded_jwt, expire
 
 
+# Utility function to compute the fixed size digest under which a refresh token is stored and looked up
+def hash_refresh_token(token: str):
+    return hashlib.sha256(token.encode()).digest()
+
+
 # Utility function to verify refresh token
 def verify_refresh_token(token: str):
+    settings = get_settings()
     try:
-        payload = jwt.decode(token, SECRET_KEY, algorithms=[ALGORITHM])
+        payload = jwt.decode(token, settings.oauth2_secret_key, algorithms=[settings.oauth2_algorithm])
         user_id = payload.get("sub")
         if user_id is None:
             raise HTTPException(status_code=status.HTTP_401_UNAUTHORIZED,
                                 detail="Invalid refresh token",
                                 headers={"WWW-Authenticate": "Bearer"})
-        return user_id
+        return TokenData(user_id=user_id, token_version=payload.get("ver", 0))
     except InvalidTokenError:
         raise HTTPException(status_code=status.HTTP_401_UNAUTHORIZED,
                             detail="Invalid refresh token",
@@ -71,14 +105,16 @@ def verify_refresh_token(token: str):
 # Utility function to decode and verify JWT token
 # Raises credentials_exception if token is invalid
 def verify_access_token(token: str):
+    settings = get_settings()
     try:
-        payload = jwt.decode(token, SECRET_KEY, algorithms=[ALGORITHM])
+        payload = jwt.decode(token, settings.oauth2_secret_key, algorithms=[settings.oauth2_algorithm])
         user_id = payload.get("sub")
         if user_id is None:
             raise HTTPException(status_code=status.HTTP_401_UNAUTHORIZED,
                                 detail="Invalid credentials1",
                                 headers={"WWW-Authenticate": "Bearer"})
-        token_data = TokenData(user_id=user_id)
+        token_data = TokenData(user_id=user_id, role=payload.get("role"), is_verified=payload.get("is_verified"),
+                               token_version=payload.get("ver", 0))
     except InvalidTokenError:
         raise HTTPException(status_code=status.HTTP_401_UNAUTHORIZED,
                             detail="Invalid credentials",
@@ -86,11 +122,138 @@ def verify_access_token(token: str):
     return token_data
 
 
+# Utility function to reject tokens issued before the user's tokens were revoked
+def check_token_version(user: User, token_data: TokenData):
+    if not user or user.token_version != token_data.token_version:
+        raise HTTPException(status_code=status.HTTP_401_UNAUTHORIZED,
+                            detail="Invalid credentials",
+                            headers={"WWW-Authenticate": "Bearer"})
+    return user
+
+
 # Dependency to get current user based on JWT token
 def get_current_user(token: str = Depends(oauth2_scheme), db: Session = Depends(database.get_db)):
     user_id = verify_access_token(token)
-    user = db.query(User).filter(User.id == int(user_id.user_id)).first()
-    return user
+    user = user_cache.get_user(int(user_id.user_id), db)
+    return check_token_version(user, user_id)
+
+
+# Dependency to get the caller's identity from the JWT claims alone, without querying the database
+# Handlers that also need the ORM user can load it on demand with load_user / load_user_async
+# Being stateless, it keeps accepting an access token revoked by logout until the token expires,
+# handlers loading the user anyway should pass it through check_token_version
+def get_current_principal(token: str = Depends(oauth2_scheme)):
+    token_data = verify_access_token(token)
+    if token_data.role is None or token_data.is_verified is None:
+        # Tokens issued before the claims were embedded have to be refreshed
+        raise HTTPException(status_code=status.HTTP_401_UNAUTHORIZED,
+                            detail="Invalid credentials",
+                            headers={"WWW-Authenticate": "Bearer"})
+    return Principal(id=int(token_data.user_id), role=token_data.role, is_verified=token_data.is_verified,
+                     token_version=token_data.token_version)
+
+
+# Dependency authenticating long lived streams. EventSource cannot send headers, so the access token is also
+# accepted as the access_token query parameter (keep it out of access logs). The token version is checked once,
+# when the stream opens; no database session is held for the lifetime of the stream.
+async def get_stream_principal(request: Request, access_token: Optional[str] = None):
+    principal = get_current_principal(access_token or await oauth2_scheme(request))
+    async with database.AsyncSessionLocal() as db:
+        user = (await db.execute(select(User.token_version).where(User.id == principal.id))).first()
+    check_token_version(user, principal)
+    return principal
+
+
+# Utility function to load the full user behind a principal
+def load_user(principal: Principal, db: Session):
+    return db.get(User, principal.id)
+
+
+async def load_user_async(principal: Principal, db: AsyncSession):
+    return await db.get(User, principal.id)
+
+
+# Async dependency to get current user based on JWT token
+async def get_current_user_async(token: str = Depends(oauth2_scheme), db: AsyncSession = Depends(database.get_async_db)):
+    user_id = verify_access_token(token)
+    user = await user_cache.get_user_async(int(user_id.user_id), db)
+    return check_token_version(user, user_id)
+
+
+# Statement revoking every access and refresh token of a user in a single UPDATE
+def revoke_user_tokens_statement(user_id: int):
+    return update(User).where(User.id == user_id).values(token_version=User.token_version + 1)
+
+
+# Statement deleting the user's oldest active sessions so that, with the one about to be created,
+# at most MAX_SESSIONS_PER_USER remain. Returns None when the cap is disabled.
+def evict_oldest_sessions_statement(user_id: int):
+    max_sessions_per_user = get_settings().max_sessions_per_user
+    if max_sessions_per_user <= 0:
+        return None
+    oldest = (
+        select(UserSession.id)
+        .where(UserSession.user_id == user_id, UserSession.refresh_token_hash.is_not(None))
+        .order_by(UserSession.id.desc())
+        .offset(max_sessions_per_user - 1)
+    )
+    return delete(UserSession).where(UserSession.id.in_(oldest.scalar_subquery()))
+
+
+# Statement rotating a refresh token in a single round trip: consumes the session holding the token, provided it
+# has not expired and the token was issued for the user's current token_version, and inserts the session of the
+# new token into the same family. When the token was already rotated, the family is revoked by the same statement
+# instead (see _revoke_session_family). Returns the user's id, role and is_verified, no row when nothing was
+# consumed. Concurrent rotations of the same token serialize on the session row, only the first one consumes it.
+def rotate_refresh_token_statement(token_data: TokenData, refresh_token_hash: bytes, new_refresh_token_hash: bytes,
+                                   new_refresh_token_expiry: datetime):
+    consumed = (
+        update(UserSession)
+        .where(UserSession.refresh_token_hash == refresh_token_hash,
+               UserSession.refresh_token_expiry > func.now(),
+               UserSession.user_id == int(token_data.user_id),
+               User.id == UserSession.user_id,
+               User.token_version == token_data.token_version)
+        # The expiry is kept: the reaper keeps the rotated session, and detects the reuse of its token, until then
+        .values(refresh_token_hash=None, rotated_token_hash=refresh_token_hash, rotated_at=func.now())
+        .returning(UserSession.user_id, func.coalesce(UserSession.family_id, UserSession.id).label("family_id"),
+                   User.role, User.is_verified)
+        .cte("consumed")
+    )
+    inserted = insert(UserSession).from_select(
+        ["user_id", "family_id", "refresh_token_hash", "refresh_token_expiry"],
+        select(consumed.c.user_id, consumed.c.family_id,
+               literal(new_refresh_token_hash, LargeBinary),
+               literal(new_refresh_token_expiry, TIMESTAMP(timezone=True))),
+    ).cte("inserted")
+    revoked = _revoke_session_family(refresh_token_hash)
+    return select(consumed.c.user_id, consumed.c.role, consumed.c.is_verified).add_cte(inserted, revoked)
+
+
+# CTE invalidating every active session of the family a rotated token belonged to. Presenting a token that was
+# already rotated means it leaked (or the rotation was replayed), neither copy can tell which client is genuine.
+# Within REFRESH_TOKEN_REUSE_GRACE_SECONDS of the rotation the family is left alone: that is the client's own
+# concurrent refreshes (several tabs, a retried request) losing the race, and the token is merely refused.
+# A token is either held by an active session or was rotated away from one, never both, so this never touches
+# the rows consumed or inserted by the rotation it is part of.
+def _revoke_session_family(refresh_token_hash: bytes):
+    grace = timedelta(seconds=get_settings().refresh_token_reuse_grace_seconds)
+    reused = (
+        select(UserSession.user_id, func.coalesce(UserSession.family_id, UserSession.id).label("family_id"))
+        .where(UserSession.rotated_token_hash == refresh_token_hash,
+               # Sessions rotated before rotated_at existed are past any grace
+               or_(UserSession.rotated_at.is_(None), UserSession.rotated_at < func.now() - grace))
+        .subquery("reused")
+    )
+    return (
+        update(UserSession)
+        .where(UserSession.user_id == reused.c.user_id,
+               func.coalesce(UserSession.family_id, UserSession.id) == reused.c.family_id,
+               UserSession.refresh_token_hash.is_not(None))
+        .values(refresh_token_hash=None, refresh_token_expiry=None)
+        .returning(UserSession.id)
+        .cte("revoked")
+    )
 
 
 # Utility function to create and store multipurpose user verification token
@@ -104,13 +267,81 @@ def create_user_verification_token(user_id: int, type: str, size: int = None, va
         "is_used": False
     }
     token = UserVerificationToken(**data)
+    # Committed by the caller, together with the email carrying the token
     db.add(token)
-    try:
-        db.commit()
-        return v_token
-    except:
-        db.rollback()
-        raise Exception()
+    return v_token
+
+
+# Async utility function to create and store multipurpose user verification token
+async def create_user_verification_token_async(user_id: int, type: str, db: AsyncSession, size: int = None, validity: int = None):
+    v_token, v_token_expiry = generate_random_token(size, validity)
+    data = {
+        "user_id": user_id,
+        "type": type,
+        "token": v_token,
+        "token_expiry": v_token_expiry,
+        "is_used": False
+    }
+    token = UserVerificationToken(**data)
+    # Committed by the caller, together with the email carrying the token
+    db.add(token)
+    return v_token
+
+
+# Conditions of an unused and unexpired verification token of the given type
+def _usable_verification_token(token: str, type: str):
+    return (UserVerificationToken.token == token, UserVerificationToken.is_used == False,
+            UserVerificationToken.type == type, UserVerificationToken.token_expiry > func.now())
+
+
+# Statement checking that a verification token could be consumed, without consuming it
+def usable_verification_token_statement(token: str, type: str):
+    return select(UserVerificationToken.id).where(*_usable_verification_token(token, type)).limit(1)
+
+
+# CTE consuming an unused and unexpired verification token of the given type, returns its user_id.
+# The token is kept, so that a verification link opened again is recognized (see verified_email_statement).
+def _consume_verification_token(token: str, type: str):
+    return (
+        update(UserVerificationToken)
+        .where(*_usable_verification_token(token, type))
+        .values(is_used=True, updated_at=func.now())
+        .returning(UserVerificationToken.user_id)
+        .cte("consumed")
+    )
+
+
+# Statement consuming a signup verification token and verifying its user in a single round trip.
+# Returns the id of the verified user, no row when the token is unknown, used or expired.
+def verify_email_statement(token: str):
+    consumed = _consume_verification_token(token, "new_signup")
+    return (
+        update(User).where(User.id == consumed.c.user_id).values(is_verified=True).returning(User.id)
+        # The ORM cannot match the CTE against loaded objects, and would drop RETURNING to fetch the rows itself
+        .execution_options(synchronize_session=False)
+    )
+
+
+# Statement finding the verified user of an already used signup verification token, so that a link opened again
+# (a second click, a mail client prefetching it) is answered like the first time. No row otherwise.
+def verified_email_statement(token: str):
+    return (
+        select(User.id)
+        .join(UserVerificationToken, UserVerificationToken.user_id == User.id)
+        .where(UserVerificationToken.token == token, UserVerificationToken.is_used == True,
+               UserVerificationToken.type == "new_signup", User.is_verified == True)
+        .limit(1)
+    )
+
+
+# Statement consuming a password reset token and storing the new password hash in a single round trip.
+# Returns the id of the user, no row when the token is unknown, used or expired.
+def reset_password_statement(token: str, password_hash: str):
+    consumed = _consume_verification_token(token, "password_reset")
+    return (
+        update(User).where(User.id == consumed.c.user_id).values(password=password_hash).returning(User.id)
+        .execution_options(synchronize_session=False)
+    )
 
 
 def generate_random_token(size: int = 64, validity: int = 24):
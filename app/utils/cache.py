@@ -0,0 +1,218 @@
+from collections import OrderedDict
+from threading import Lock
+from app.config.settings import get_settings
+import json
+import logging
+import time
+
+
+logger = logging.getLogger(__name__)
+
+
+# In-process cache with a per-entry TTL that evicts the least recently used entry when full
+class TTLCache:
+    def __init__(self, max_size: int, ttl: float):
+        self.max_size = max_size
+        self.ttl = ttl
+        self._data = OrderedDict()
+        self._lock = Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.expirations = 0
+
+    def get(self, key):
+        with self._lock:
+            item = self._data.get(key)
+            if item is None:
+                self.misses += 1
+                return None
+            expires_at, value = item
+            if expires_at <= time.monotonic():
+                del self._data[key]
+                self.expirations += 1
+                self.misses += 1
+                return None
+            self._data.move_to_end(key)
+            self.hits += 1
+            return value
+
+    def set(self, key, value, ttl: float = None):
+        expires_at = time.monotonic() + (self.ttl if ttl is None else ttl)
+        with self._lock:
+            self._data[key] = (expires_at, value)
+            self._data.move_to_end(key)
+            while len(self._data) > self.max_size:
+                self._data.popitem(last=False)
+                self.evictions += 1
+
+    def delete(self, key):
+        with self._lock:
+            self._data.pop(key, None)
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+
+    def stats(self):
+        return {
+            "size": len(self._data),
+            "max_size": self.max_size,
+            "hits": self.hits,
+            "misses": self.misses,
+            "evictions": self.evictions,
+            "expirations": self.expirations,
+        }
+
+
+# Minimal in-memory stand-in for the subset of the Redis protocol used by the app
+class InMemoryRedis:
+    def __init__(self):
+        self._data = {}
+        self._lock = Lock()
+
+    def _alive(self, name):
+        item = self._data.get(name)
+        if item is not None and item[1] is not None and item[1] <= time.monotonic():
+            del self._data[name]
+            return None
+        return item
+
+    def get(self, name):
+        with self._lock:
+            item = self._alive(name)
+            return item[0] if item else None
+
+    def set(self, name, value, ex: int = None):
+        if isinstance(value, str):
+            value = value.encode()
+        with self._lock:
+            self._data[name] = (value, time.monotonic() + ex if ex else None)
+        return True
+
+    def delete(self, *names):
+        with self._lock:
+            return sum(1 for name in names if self._data.pop(name, None) is not None)
+
+    def incr(self, name, amount: int = 1):
+        with self._lock:
+            item = self._alive(name)
+            value = (int(item[0]) if item else 0) + amount
+            self._data[name] = (str(value).encode(), item[1] if item else None)
+            return value
+
+    def expire(self, name, seconds: int):
+        with self._lock:
+            item = self._alive(name)
+            if item is None:
+                return False
+            self._data[name] = (item[0], time.monotonic() + seconds)
+            return True
+
+    def flushall(self):
+        with self._lock:
+            self._data.clear()
+        return True
+
+    def pipeline(self, transaction: bool = True):
+        return InMemoryPipeline(self)
+
+
+# Queues commands like a redis-py pipeline, they are run one by one on execute()
+class InMemoryPipeline:
+    def __init__(self, client: InMemoryRedis):
+        self._client = client
+        self._commands = []
+
+    def __getattr__(self, command):
+        def queue(*args, **kwargs):
+            self._commands.append((getattr(self._client, command), args, kwargs))
+            return self
+        return queue
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self._commands = []
+
+    def execute(self):
+        commands, self._commands = self._commands, []
+        return [command(*args, **kwargs) for command, args, kwargs in commands]
+
+
+_redis_client = None
+
+
+# Function to get the shared Redis client, None when REDIS_URL is not configured
+def get_redis_client():
+    global _redis_client
+    redis_url = get_settings().redis_url
+    if _redis_client is None and redis_url:
+        if redis_url.startswith("memory://"):
+            _redis_client = InMemoryRedis()
+        else:
+            # redis is an optional dependency, only needed when a real server is configured
+            import redis
+            _redis_client = redis.Redis.from_url(redis_url)
+    return _redis_client
+
+
+# Two tier cache: an in-process TTL+LRU tier in front of an optional shared Redis tier.
+# Values stored in the shared tier must be JSON serializable. Errors from the shared tier are
+# logged and treated as misses so that a Redis outage only costs extra database reads.
+class TieredCache:
+    def __init__(self, namespace: str, max_size: int, ttl: int, shared=None):
+        self.namespace = namespace
+        self.ttl = ttl
+        self.local = TTLCache(max_size=max_size, ttl=ttl)
+        self.shared = shared
+        self.shared_hits = 0
+        self.shared_errors = 0
+
+    def _key(self, key):
+        return f"{self.namespace}:{key}"
+
+    def get(self, key):
+        value = self.local.get(key)
+        if value is not None or self.shared is None:
+            return value
+        try:
+            raw = self.shared.get(self._key(key))
+        except Exception:
+            self.shared_errors += 1
+            logger.warning("Shared cache read failed for %s", self._key(key), exc_info=True)
+            return None
+        if raw is None:
+            return None
+        value = json.loads(raw)
+        self.shared_hits += 1
+        self.local.set(key, value)
+        return value
+
+    def set(self, key, value):
+        self.local.set(key, value)
+        if self.shared is not None:
+            try:
+                self.shared.set(self._key(key), json.dumps(value), ex=self.ttl)
+            except Exception:
+                self.shared_errors += 1
+                logger.warning("Shared cache write failed for %s", self._key(key), exc_info=True)
+
+    def delete(self, key):
+        self.local.delete(key)
+        if self.shared is not None:
+            try:
+                self.shared.delete(self._key(key))
+            except Exception:
+                self.shared_errors += 1
+                logger.warning("Shared cache invalidation failed for %s", self._key(key), exc_info=True)
+
+    def stats(self):
+        stats = self.local.stats()
+        stats.update({
+            "shared_enabled": self.shared is not None,
+            "shared_hits": self.shared_hits,
+            "shared_errors": self.shared_errors,
+        })
+        return stats
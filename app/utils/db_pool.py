@@ -0,0 +1,68 @@
+from sqlalchemy import exc
+from sqlalchemy.pool import QueuePool, AsyncAdaptedQueuePool, NullPool, Pool
+from app.utils.metrics import Counter, Histogram
+import time
+
+
+# Checkout statistics collected for a connection pool
+class PoolMetrics:
+    def __init__(self):
+        self.checkouts = Counter()
+        self.timeouts = Counter()
+        self.wait_seconds = Histogram()
+
+
+sync_pool_metrics = PoolMetrics()
+async_pool_metrics = PoolMetrics()
+
+
+# Mixin timing how long each checkout waits for a connection, including connects and pre-pings
+class _InstrumentedPoolMixin:
+    metrics: PoolMetrics
+
+    def connect(self):
+        start = time.perf_counter()
+        try:
+            connection = super().connect()
+        except exc.TimeoutError:
+            self.metrics.timeouts.inc()
+            raise
+        finally:
+            self.metrics.wait_seconds.observe(time.perf_counter() - start)
+        self.metrics.checkouts.inc()
+        return connection
+
+
+class InstrumentedQueuePool(_InstrumentedPoolMixin, QueuePool):
+    metrics = sync_pool_metrics
+
+
+class InstrumentedAsyncAdaptedQueuePool(_InstrumentedPoolMixin, AsyncAdaptedQueuePool):
+    metrics = async_pool_metrics
+
+
+class InstrumentedNullPool(_InstrumentedPoolMixin, NullPool):
+    metrics = sync_pool_metrics
+
+
+class InstrumentedAsyncNullPool(_InstrumentedPoolMixin, NullPool):
+    metrics = async_pool_metrics
+
+
+# Utility function to snapshot the live state of a pool along with its checkout statistics
+def pool_stats(pool: Pool):
+    metrics = pool.metrics
+    stats = {
+        "pool_class": type(pool).__name__,
+        "checkouts": metrics.checkouts.value,
+        "timeouts": metrics.timeouts.value,
+        "wait_seconds": metrics.wait_seconds.snapshot(),
+    }
+    if isinstance(pool, QueuePool):
+        stats.update({
+            "size": pool.size(),
+            "checked_in": pool.checkedin(),
+            "checked_out": pool.checkedout(),
+            "overflow": pool.overflow(),
+        })
+    return stats
@@ -1,49 +1,62 @@
-from fastapi import BackgroundTasks, Request
-import app.config.email as email_config
-import requests
+from fastapi import Request
+from sqlalchemy.orm import Session
+from sqlalchemy.ext.asyncio import AsyncSession
+from app.models import EmailOutbox
+from app.config.settings import get_settings
 
 
-def send_email(receiver_email: str, subject: str, body: str):
-    url = email_config.email_api_endpoint
-    api_token = email_config.email_api_key
-    headers = {
-        "Host": email_config.email_api_host,
-        "Authorization": f"Bearer {api_token}",
+# Add an email to the outbox in the caller's session. Nothing is sent here: the email is delivered by
+# app.tasks.email_dispatcher once, and only if, the caller's transaction commits.
+def queue_email(receiver_email: str, subject: str, body: str, db: Session | AsyncSession):
+    email = EmailOutbox(recipient=receiver_email, subject=subject, body=body)
+    db.add(email)
+    return email
+
+
+def api_headers():
+    return {
+        "Authorization": f"Bearer {get_settings().email_api_key}",
         "Content-Type": "application/json"
     }
 
-    payload = {
-        "from": {
-            "email": email_config.email_from,
-            "name": email_config.email_from_name
+
+# Payload of the provider's batch endpoint, the sender is shared and every email is one request
+def batch_payload(emails: list):
+    settings = get_settings()
+    return {
+        "base": {
+            "from": {
+                "email": settings.email_from,
+                "name": settings.email_from_name
+            },
+            "category": "Testing"
         },
-        "to": [
+        "requests": [
             {
-                "email": receiver_email
+                "to": [
+                    {
+                        "email": email.recipient
+                    }
+                ],
+                "subject": email.subject,
+                "text": email.body
             }
-        ],
-        "subject": subject,
-        "text": body,
-        "category": "Testing"
+            for email in emails
+        ]
     }
 
-    response = requests.post(url, json=payload, headers=headers)
-    print("Email sent:", response.status_code, response.text)
-
 
-def send_signup_verification_email(to: str, token: str, background_tasks: BackgroundTasks, request: Request):
+def send_signup_verification_email(to: str, token: str, request: Request, db: Session | AsyncSession):
     verification_link = str(request.url_for("verify_email")) + f"?token={token}"
     subject = "Webscan || Verify your email"
     body = f"Please click the following link to verify your email: {verification_link}"
 
-    # Sending email in the background
-    background_tasks.add_task(send_email, to, subject, body)
+    return queue_email(to, subject, body, db)
 
 
-def send_password_reset_verification_email(to: str, token: str, background_tasks: BackgroundTasks, request: Request):
+def send_password_reset_verification_email(to: str, token: str, request: Request, db: Session | AsyncSession):
     verification_link = str(request.url_for("reset_password")) + f"?token={token}"
     subject = "Webscan || Reset your password"
     body = f"Please click the following link to reset your password: {verification_link}"
 
-    # Sending email in the background
-    background_tasks.add_task(send_email, to, subject, body)
+    return queue_email(to, subject, body, db)
@@ -0,0 +1,108 @@
+from fastapi import Depends, HTTPException, status
+from sqlalchemy import func, or_, select
+from datetime import datetime, timezone
+from app.config.settings import get_settings
+from app.config import database
+from app.models import Subscription
+from app.schemas.auth import Principal
+from app.schemas.user import EntitlementsResponse
+from app.utils import auth as auth_util
+from app.utils.cache import TieredCache, get_redis_client
+from app.utils.pg_listener import pg_listener
+from app.utils.plan_catalog import plan_catalog
+
+
+# Plan names from the lowest to the highest tier, in the order of plan_name_enum
+PLAN_TIERS = ('free', 'pro', 'enterprise')
+# Channel notified by the subscriptions_notify trigger with the user id of every changed subscription
+NOTIFY_CHANNEL = "subscriptions"
+
+# Cache of the subscription granting each user's entitlements, keyed by user id. Entries only hold the
+# plan id and end date: plan names and features come from plan_catalog, so plan changes apply right away.
+entitlement_cache = TieredCache(
+    namespace="entitlements",
+    max_size=get_settings().entitlement_cache_max_size,
+    ttl=get_settings().entitlement_cache_ttl,
+    shared=get_redis_client(),
+)
+
+
+# Statement selecting the user's active subscription, the latest one should there be several
+def active_subscription_statement(user_id: int):
+    return (
+        select(Subscription.plan_id, Subscription.end_date)
+        .where(Subscription.user_id == user_id, Subscription.status == 'active',
+               or_(Subscription.end_date.is_(None), Subscription.end_date > func.now()))
+        .order_by(Subscription.id.desc())
+        .limit(1)
+    )
+
+
+async def _load_subscription(user_id: int):
+    async with database.AsyncSessionLocal() as db:
+        row = (await db.execute(active_subscription_statement(user_id))).first()
+    if row is None:
+        return {"plan_id": None, "end_date": None}
+    return {"plan_id": row.plan_id, "end_date": row.end_date.isoformat() if row.end_date else None}
+
+
+# Resolve the user's entitlements, a single indexed query on a cache miss and none on a hit.
+# Uses its own short lived session, so a hit does not check a connection out of the pool either.
+async def get_entitlements(user_id: int):
+    cache_enabled = get_settings().entitlement_cache_enabled
+    data = entitlement_cache.get(user_id) if cache_enabled else None
+    if data is None:
+        data = await _load_subscription(user_id)
+        if cache_enabled:
+            entitlement_cache.set(user_id, data)
+    plans, free_plan = await plan_catalog.get_plans()
+    end_date = datetime.fromisoformat(data["end_date"]) if data["end_date"] else None
+    plan = plans.get(data["plan_id"])
+    if plan is None or (end_date is not None and end_date <= datetime.now(timezone.utc)):
+        return EntitlementsResponse(plan='free', features=free_plan.features if free_plan else None)
+    return EntitlementsResponse(plan=plan.name, features=plan.features, expires_at=end_date)
+
+
+# Plan features are either a list of feature names or a mapping of feature names to a value,
+# a feature is granted when listed or mapped to a truthy value (e.g. {"exports": true, "seats": 5})
+def has_feature(entitlements: EntitlementsResponse, feature: str):
+    features = entitlements.features
+    if isinstance(features, dict):
+        return bool(features.get(feature))
+    if isinstance(features, list):
+        return feature in features
+    return False
+
+
+def invalidate_entitlements(user_id: int):
+    entitlement_cache.delete(user_id)
+
+
+# Dependency factories gating a route on the caller's plan. They rely on the claims-only principal, so on
+# a cache hit gating a route costs no query at all. The resolved entitlements are returned to the handler.
+def require_feature(feature: str):
+    async def dependency(principal: Principal = Depends(auth_util.get_current_principal)):
+        entitlements = await get_entitlements(principal.id)
+        if not has_feature(entitlements, feature):
+            raise HTTPException(status_code=status.HTTP_403_FORBIDDEN,
+                                detail=f"Your plan does not include {feature}.")
+        return entitlements
+    return dependency
+
+
+def require_plan(plan: str):
+    minimum = PLAN_TIERS.index(plan)
+
+    async def dependency(principal: Principal = Depends(auth_util.get_current_principal)):
+        entitlements = await get_entitlements(principal.id)
+        if PLAN_TIERS.index(entitlements.plan) < minimum:
+            raise HTTPException(status_code=status.HTTP_403_FORBIDDEN,
+                                detail=f"This requires the {plan} plan or higher.")
+        return entitlements
+    return dependency
+
+
+# Subscriptions may change outside of the API (billing webhooks, admin), every process drops the
+# changed user's entry on the notification, and its whole in-process tier when notifications were missed
+pg_listener.add_handler(NOTIFY_CHANNEL, lambda payload: invalidate_entitlements(int(payload)))
+pg_listener.add_connect_handler(entitlement_cache.local.clear)
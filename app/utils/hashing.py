@@ -0,0 +1,94 @@
+from fastapi import HTTPException, status
+from passlib.context import CryptContext
+from concurrent.futures import Future, ProcessPoolExecutor
+from threading import Lock
+import asyncio
+import multiprocessing
+import time
+from app.config.settings import get_settings
+from app.utils.metrics import Family, Gauge, Histogram, registry
+
+
+# Module level context, shared by every call in this process and by each hashing worker process
+pwd_context = CryptContext(schemes=["bcrypt"], deprecated="auto", bcrypt__rounds=get_settings().bcrypt_rounds)
+
+
+hashing_seconds = registry.register(Family(
+    "password_hashing_duration_seconds", "Time from submitting a bcrypt operation until its result, queueing included.",
+    Histogram, ("operation",)))
+
+
+def _hash(pwd: str):
+    return pwd_context.hash(pwd)
+
+
+# Returns (is_valid, new_hash), new_hash is set when the stored hash uses outdated parameters
+def _verify_and_update(plain_pwd: str, hashed_pwd: str):
+    return pwd_context.verify_and_update(plain_pwd, hashed_pwd)
+
+
+# Bounded process pool running bcrypt outside of the web process so it neither holds the GIL
+# nor competes with request handling, and rejects work once too many operations are pending.
+class HashingService:
+    def __init__(self, workers: int, max_queue: int):
+        self.workers = workers
+        self.max_queue = max_queue
+        self._executor = None
+        self._pending = 0
+        self._lock = Lock()
+
+    @property
+    def pending(self):
+        return self._pending
+
+    def _release(self, future: Future):
+        with self._lock:
+            self._pending -= 1
+
+    def _submit(self, operation: str, fn, *args):
+        start = time.perf_counter()
+        with self._lock:
+            if self._pending >= self.max_queue:
+                raise HTTPException(status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+                                    detail="Server is busy, please retry shortly.",
+                                    headers={"Retry-After": "1"})
+            self._pending += 1
+            if self.workers > 0 and self._executor is None:
+                # spawn avoids forking a process that already runs threadpool and event loop threads
+                self._executor = ProcessPoolExecutor(max_workers=self.workers,
+                                                     mp_context=multiprocessing.get_context("spawn"))
+        if self._executor is None:
+            future = Future()
+            try:
+                future.set_result(fn(*args))
+            except Exception as e:
+                future.set_exception(e)
+        else:
+            future = self._executor.submit(fn, *args)
+        future.add_done_callback(self._release)
+        histogram = hashing_seconds.labels(operation)
+        future.add_done_callback(lambda future: histogram.observe(time.perf_counter() - start))
+        return future
+
+    def hash(self, pwd: str):
+        return self._submit("hash", _hash, pwd).result()
+
+    def verify_and_update(self, plain_pwd: str, hashed_pwd: str):
+        return self._submit("verify", _verify_and_update, plain_pwd, hashed_pwd).result()
+
+    async def hash_async(self, pwd: str):
+        return await asyncio.wrap_future(self._submit("hash", _hash, pwd))
+
+    async def verify_and_update_async(self, plain_pwd: str, hashed_pwd: str):
+        return await asyncio.wrap_future(self._submit("verify", _verify_and_update, plain_pwd, hashed_pwd))
+
+    def shutdown(self):
+        with self._lock:
+            executor, self._executor = self._executor, None
+        if executor is not None:
+            executor.shutdown(wait=True, cancel_futures=True)
+
+
+hashing_service = HashingService(workers=get_settings().hashing_workers, max_queue=get_settings().hashing_max_queue)
+registry.register(Family("password_hashing_pending", "bcrypt operations queued or running.", Gauge,
+                         callback=lambda: hashing_service.pending))
@@ -0,0 +1,31 @@
+from sqlalchemy import text
+from app.config import database
+import asyncio
+
+
+# Seconds GET /health/ready waits for the database
+DATABASE_TIMEOUT_SECONDS = 2
+
+
+# Set once the process is asked to stop, GET /health/ready then fails so that the load balancer stops routing
+# new requests to it while the ones it already has are drained
+class ServerState:
+    def __init__(self):
+        self.draining = False
+
+
+server_state = ServerState()
+
+
+async def _ping_database():
+    async with database.async_engine.connect() as conn:
+        await conn.execute(text("SELECT 1"))
+
+
+# Whether a connection can be checked out of the async pool and answer in time
+async def database_ready():
+    try:
+        await asyncio.wait_for(_ping_database(), DATABASE_TIMEOUT_SECONDS)
+        return True
+    except Exception:
+        return False
@@ -0,0 +1,278 @@
+from bisect import bisect_left
+from contextlib import contextmanager
+from pathlib import Path
+from threading import Lock
+import asyncio
+import json
+import os
+
+
+# Default histogram buckets (in seconds) used for latency style measurements
+DEFAULT_LATENCY_BUCKETS = (0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+
+
+# Monotonically increasing counter, safe to share between threadpool workers
+class Counter:
+    def __init__(self):
+        self._value = 0
+        self._lock = Lock()
+
+    def inc(self, amount: float = 1):
+        with self._lock:
+            self._value += amount
+
+    @property
+    def value(self):
+        return self._value
+
+    def state(self):
+        return self._value
+
+
+# Fixed bucket histogram, reported with cumulative bucket counts like Prometheus
+class Histogram:
+    def __init__(self, buckets: tuple = DEFAULT_LATENCY_BUCKETS):
+        self.buckets = tuple(sorted(buckets))
+        self._counts = [0] * (len(self.buckets) + 1)
+        self._sum = 0.0
+        self._lock = Lock()
+
+    def observe(self, value: float):
+        index = bisect_left(self.buckets, value)
+        with self._lock:
+            self._counts[index] += 1
+            self._sum += value
+
+    # Bucket counts (not cumulative) and sum
+    def state(self):
+        with self._lock:
+            return {"counts": list(self._counts), "sum": self._sum}
+
+    def snapshot(self):
+        return _cumulative(self.buckets, self.state())
+
+
+def _cumulative(bounds: tuple, state: dict):
+    cumulative = 0
+    buckets = {}
+    for bound, count in zip(bounds + (float("inf"),), state["counts"]):
+        cumulative += count
+        buckets["+Inf" if bound == float("inf") else str(bound)] = cumulative
+    return {"buckets": buckets, "count": cumulative, "sum": state["sum"]}
+
+
+# Value that goes up and down, such as requests in flight
+class Gauge:
+    def __init__(self):
+        self._value = 0
+        self._lock = Lock()
+
+    def inc(self, amount: float = 1):
+        with self._lock:
+            self._value += amount
+
+    def dec(self, amount: float = 1):
+        with self._lock:
+            self._value -= amount
+
+    def set(self, value: float):
+        self._value = value
+
+    @property
+    def value(self):
+        return self._value
+
+    def state(self):
+        return self._value
+
+
+# Named metric with one child Counter, Gauge or Histogram per combination of label values, or a single
+# unlabelled one. Gauges may instead be read from a callback at collection time.
+class Family:
+    def __init__(self, name: str, help: str, kind: type, labels: tuple = (), callback=None, **kwargs):
+        self.name = name
+        self.help = help
+        self.kind = kind
+        self.label_names = labels
+        self.callback = callback
+        self._kwargs = kwargs
+        self._children = {}
+        self._lock = Lock()
+        if not labels and callback is None:
+            self._children[()] = kind(**kwargs)
+
+    def labels(self, *values):
+        child = self._children.get(values)
+        if child is None:
+            with self._lock:
+                child = self._children.setdefault(values, self.kind(**self._kwargs))
+        return child
+
+    # State of every child by label values, read from the callback for callback gauges
+    def collect(self):
+        if self.callback is not None:
+            return {(): self.callback()}
+        return {values: child.state() for values, child in list(self._children.items())}
+
+    # The unlabelled child
+    def __getattr__(self, attr):
+        return getattr(self._children[()], attr)
+
+
+def _escape(value):
+    return str(value).replace("\\", "\\\\").replace("\"", "\\\"").replace("\n", "\\n")
+
+
+def _format_labels(names: tuple, values: tuple, extra: str = None):
+    pairs = [f'{name}="{_escape(value)}"' for name, value in zip(names, values)]
+    if extra:
+        pairs.append(extra)
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+
+_TYPES = {Counter: "counter", Gauge: "gauge", Histogram: "histogram"}
+
+
+# Families exposed by GET /metrics
+class Registry:
+    def __init__(self):
+        self.families = []
+
+    def register(self, family: Family):
+        self.families.append(family)
+        return family
+
+    # State of every family of this process, in the format of the snapshot files
+    def collect(self):
+        return {family.name: {"kind": _TYPES[family.kind],
+                              "series": [[list(values), state] for values, state in family.collect().items()]}
+                for family in self.families}
+
+    # Prometheus text exposition format (version 0.0.4). With a directory, the series of every server worker sharing
+    # it are rendered (see write_snapshot), otherwise only those of this process.
+    def render(self, directory: str = None):
+        if directory is None:
+            return self._render(_merge([{"pid": None, "live": True, "families": self.collect()}]), worker_label=False)
+        write_snapshot(directory, self.collect())
+        with _snapshots_lock(directory, shared=True):
+            snapshots = [_read_snapshot(path) for path in Path(directory).glob("*.json")]
+        return self._render(_merge([snapshot for snapshot in snapshots if snapshot is not None]), worker_label=True)
+
+    def _render(self, merged: dict, worker_label: bool):
+        lines = []
+        for family in self.families:
+            lines.append(f"# HELP {family.name} {family.help}")
+            lines.append(f"# TYPE {family.name} {_TYPES[family.kind]}")
+            label_names = family.label_names
+            if family.kind is Gauge and worker_label:
+                label_names += ("worker",)
+            if family.kind is Histogram:
+                bounds = Histogram(**family._kwargs).buckets
+            for values, state in sorted(merged.get(family.name, {}).get("series", {}).items()):
+                if family.kind is Histogram:
+                    snapshot = _cumulative(bounds, state)
+                    for bound, count in snapshot["buckets"].items():
+                        labels = _format_labels(label_names, values, f'le="{bound}"')
+                        lines.append(f"{family.name}_bucket{labels} {count}")
+                    labels = _format_labels(label_names, values)
+                    lines.append(f"{family.name}_sum{labels} {snapshot['sum']}")
+                    lines.append(f"{family.name}_count{labels} {snapshot['count']}")
+                else:
+                    lines.append(f"{family.name}{_format_labels(label_names, values)} {state}")
+        return "\n".join(lines) + "\n"
+
+
+registry = Registry()
+
+
+# Multiprocess mode (METRICS_DIR, set by gunicorn.conf.py). Every server worker writes the state of its registry to
+# <directory>/<pid>.json, periodically and whenever it serves GET /metrics, which then merges the files of all the
+# workers: counters and histograms are summed, gauges are reported per live worker with a worker="<pid>" label.
+# The master folds the counters and histograms of a worker that exited into dead.json (mark_process_dead), so
+# that the sums never go down when workers are recycled, and the directory holds one file per live worker.
+DEAD_SNAPSHOT = "dead.json"
+
+
+def write_snapshot(directory: str, families: dict):
+    path = Path(directory) / f"{os.getpid()}.json"
+    temporary = path.with_suffix(".tmp")
+    temporary.write_text(json.dumps({"pid": os.getpid(), "live": True, "families": families}))
+    os.replace(temporary, path)
+
+
+# Long running task started by the application lifespan in multiprocess mode, so that the series of a worker are
+# at most interval_seconds old when another one serves GET /metrics
+async def snapshot_loop(directory: str, interval_seconds: float):
+    while True:
+        write_snapshot(directory, registry.collect())
+        await asyncio.sleep(interval_seconds)
+
+
+# Called by the gunicorn master for each worker that exited
+def mark_process_dead(directory: str, pid: int):
+    path = Path(directory) / f"{pid}.json"
+    dead_path = Path(directory) / DEAD_SNAPSHOT
+    with _snapshots_lock(directory, shared=False):
+        snapshot = _read_snapshot(path)
+        if snapshot is None:
+            return
+        snapshot["live"] = False
+        dead = _read_snapshot(dead_path)
+        merged = _merge([snapshot] if dead is None else [snapshot, dead])
+        families = {name: {"kind": family["kind"],
+                           "series": [[list(values), state] for values, state in family["series"].items()]}
+                    for name, family in merged.items()}
+        temporary = dead_path.with_suffix(".tmp")
+        temporary.write_text(json.dumps({"pid": None, "live": False, "families": families}))
+        os.replace(temporary, dead_path)
+        path.unlink()
+
+
+# Removes the snapshots of a previous run, called by the gunicorn master on start
+def clear_snapshots(directory: str):
+    Path(directory).mkdir(parents=True, exist_ok=True)
+    for path in Path(directory).glob("*.json"):
+        path.unlink()
+
+
+def _read_snapshot(path: Path):
+    try:
+        return json.loads(path.read_text())
+    except (OSError, ValueError):
+        return None
+
+
+# Kind and series of every family by label values (with the worker pid appended for gauges), summed across the
+# snapshots
+def _merge(snapshots: list):
+    merged = {}
+    for snapshot in snapshots:
+        for name, family in snapshot["families"].items():
+            series = merged.setdefault(name, {"kind": family["kind"], "series": {}})["series"]
+            for values, state in family["series"]:
+                values = tuple(values)
+                if family["kind"] == "gauge":
+                    if snapshot["live"]:
+                        series[values + ((str(snapshot["pid"]),) if snapshot["pid"] else ())] = state
+                elif family["kind"] == "counter":
+                    series[values] = series.get(values, 0) + state
+                else:
+                    previous = series.get(values)
+                    series[values] = state if previous is None else {
+                        "counts": [a + b for a, b in zip(previous["counts"], state["counts"])],
+                        "sum": previous["sum"] + state["sum"],
+                    }
+    return merged
+
+
+# Serializes the master folding a dead worker into dead.json with the workers reading the snapshots
+@contextmanager
+def _snapshots_lock(directory: str, shared: bool):
+    import fcntl
+
+    with open(Path(directory) / ".lock", "a") as lock:
+        fcntl.flock(lock, fcntl.LOCK_SH if shared else fcntl.LOCK_EX)
+        try:
+            yield
+        finally:
+            fcntl.flock(lock, fcntl.LOCK_UN)
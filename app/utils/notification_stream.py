@@ -0,0 +1,169 @@
+from fastapi import HTTPException, status
+from app.config.settings import get_settings
+from app.schemas.user import NotificationResponse
+from app.utils import notifications as notifications_util
+from app.utils.metrics import Counter, Histogram
+from app.utils.pg_listener import pg_listener
+import asyncio
+import json
+import time
+
+
+# Channel notified by the notifications_notify trigger, once per inserting statement and user
+NOTIFY_CHANNEL = "notifications"
+# Seconds a new stream waits for the LISTEN connection before giving up
+LISTEN_TIMEOUT_SECONDS = 5
+
+# Tells the client to reload its notifications (GET /user/notifications) instead of receiving them one by one
+RESET_EVENT = "event: reset\ndata: {}\n\n"
+HEARTBEAT_EVENT = ": ping\n\n"
+# Queued to end a stream
+CLOSE = None
+
+
+# Stream counters and fan out latency of this process
+opened_streams = Counter()
+closed_streams = Counter()
+dropped_streams = Counter()
+delivered_events = Counter()
+received_notifies = Counter()
+fanout_seconds = Histogram()
+
+
+# Server-Sent Event of a notification, its id is the keyset cursor the stream resumes from
+def format_event(notification: NotificationResponse):
+    return (f"id: {notifications_util.encode_cursor(notification)}\nevent: notification\n"
+            f"data: {notification.model_dump_json()}\n\n")
+
+
+# One open stream. Events are (notification id, event) tuples, the id being None for a reset event.
+class Subscriber:
+    def __init__(self, user_id: int, queue_size: int):
+        self.user_id = user_id
+        self.queue = asyncio.Queue(queue_size)
+        self.closed = False
+
+    # Never waits: a client that stops reading is disconnected once its queue is full, rather than
+    # slowing the fan out down or buffering without bound. It resumes from its last event on reconnect.
+    def push(self, event: tuple):
+        if self.closed:
+            return
+        try:
+            self.queue.put_nowait(event)
+        except asyncio.QueueFull:
+            dropped_streams.inc()
+            self.close()
+
+    def close(self):
+        if self.closed:
+            return
+        self.closed = True
+        # The dropped events are replayed when the client resumes
+        while not self.queue.empty():
+            self.queue.get_nowait()
+        self.queue.put_nowait(CLOSE)
+
+
+# Fans the notifications received on the process wide LISTEN connection out to the open streams
+class NotificationHub:
+    def __init__(self):
+        # Open streams by user id
+        self.subscribers = {}
+
+    @property
+    def connections(self):
+        return sum(len(subscribers) for subscribers in self.subscribers.values())
+
+    # Register a stream, the LISTEN connection is opened by the first one
+    async def subscribe(self, user_id: int):
+        try:
+            await pg_listener.start(LISTEN_TIMEOUT_SECONDS)
+        except asyncio.TimeoutError:
+            raise HTTPException(status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+                                detail="Notification stream unavailable")
+        subscriber = Subscriber(user_id, get_settings().notification_stream_queue_size)
+        self.subscribers.setdefault(user_id, set()).add(subscriber)
+        opened_streams.inc()
+        return subscriber
+
+    def unsubscribe(self, subscriber: Subscriber):
+        subscribers = self.subscribers.get(subscriber.user_id)
+        if subscribers is None or subscriber not in subscribers:
+            return
+        subscribers.discard(subscriber)
+        if not subscribers:
+            del self.subscribers[subscriber.user_id]
+        closed_streams.inc()
+
+    def _on_notify(self, payload: str):
+        received_notifies.inc()
+        data = json.loads(payload)
+        subscribers = self.subscribers.get(data["user_id"])
+        if not subscribers:
+            return
+        start = time.perf_counter()
+        # The trigger leaves the rows out of statements inserting many notifications for the same user
+        if data["notifications"] is None:
+            events = [(None, RESET_EVENT)]
+        else:
+            notifications = [NotificationResponse.model_validate(row) for row in data["notifications"]]
+            events = [(notification.id, format_event(notification)) for notification in notifications]
+        # Serialized once, whatever the number of streams the user has open
+        for subscriber in list(subscribers):
+            for event in events:
+                subscriber.push(event)
+        fanout_seconds.observe(time.perf_counter() - start)
+
+    def close(self):
+        for subscribers in self.subscribers.values():
+            for subscriber in subscribers:
+                subscriber.close()
+
+
+notification_hub = NotificationHub()
+pg_listener.add_handler(NOTIFY_CHANNEL, notification_hub._on_notify)
+# Notifications sent while the LISTEN connection was down are missed, the clients resume from their last event
+pg_listener.add_connect_handler(notification_hub.close)
+
+
+# Body of a stream: the replayed events, then live ones and a heartbeat whenever the stream is idle
+async def event_stream(subscriber: Subscriber, replay: list):
+    try:
+        yield f"retry: {get_settings().notification_stream_retry_ms}\n\n"
+        replayed = set()
+        for notification_id, event in replay:
+            replayed.add(notification_id)
+            delivered_events.inc()
+            yield event
+        while True:
+            try:
+                item = await asyncio.wait_for(subscriber.queue.get(),
+                                              get_settings().notification_stream_heartbeat_seconds)
+            except asyncio.TimeoutError:
+                yield HEARTBEAT_EVENT
+                continue
+            if item is CLOSE:
+                return
+            notification_id, event = item
+            # Notifications inserted while the replay was read are also delivered live
+            if notification_id is not None and notification_id in replayed:
+                continue
+            delivered_events.inc()
+            yield event
+    finally:
+        notification_hub.unsubscribe(subscriber)
+
+
+def notification_stream_stats():
+    return {
+        "open": notification_hub.connections,
+        "users": len(notification_hub.subscribers),
+        "listening": pg_listener.ready.is_set(),
+        "opened": opened_streams.value,
+        "closed": closed_streams.value,
+        "dropped": dropped_streams.value,
+        "delivered": delivered_events.value,
+        "notifies": received_notifies.value,
+        "listener_reconnects": pg_listener.reconnects.value,
+        "fanout_seconds": fanout_seconds.snapshot(),
+    }
@@ -0,0 +1,66 @@
+from fastapi import HTTPException, status
+from sqlalchemy import func, select, tuple_, update
+from datetime import datetime
+from app.models import Notification, NotificationCounter
+import base64
+
+
+# Opaque cursor of keyset pagination: the (created_at, id) of the last notification of a page
+def encode_cursor(notification: Notification):
+    raw = f"{notification.created_at.isoformat()}|{notification.id}"
+    return base64.urlsafe_b64encode(raw.encode()).decode()
+
+
+def decode_cursor(cursor: str):
+    try:
+        created_at, id = base64.urlsafe_b64decode(cursor.encode()).decode().split("|")
+        return datetime.fromisoformat(created_at), int(id)
+    except Exception:
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="Invalid cursor")
+
+
+# Statement selecting one page of a user's notifications, newest first. The row comparison on (created_at, id)
+# is resolved by the (user_id, [is_read,] created_at, id) indexes, so every page costs the same however deep it is.
+# One extra row is fetched to tell whether another page exists, see page.
+def page_statement(user_id: int, limit: int, cursor: str = None, unread_only: bool = False):
+    query = select(Notification).filter(Notification.user_id == user_id)
+    if unread_only:
+        query = query.filter(Notification.is_read == False)
+    if cursor:
+        query = query.filter(tuple_(Notification.created_at, Notification.id) < decode_cursor(cursor))
+    return query.order_by(Notification.created_at.desc(), Notification.id.desc()).limit(limit + 1)
+
+
+# Split the rows of page_statement into the page and the cursor of the next one
+def page(rows: list, limit: int):
+    items = rows[:limit]
+    next_cursor = encode_cursor(items[-1]) if len(rows) > limit and items else None
+    return items, next_cursor
+
+
+# Statement marking the given notifications (all of them when ids is None) as read in a single UPDATE.
+# Already read rows are left out so the unread counter triggers only see actual changes.
+def mark_read_statement(user_id: int, ids: list = None):
+    statement = update(Notification).filter(Notification.user_id == user_id, Notification.is_read == False)
+    if ids is not None:
+        statement = statement.filter(Notification.id.in_(ids))
+    return statement.values(is_read=True, updated_at=func.now())
+
+
+# Statement reading the unread counter maintained by triggers on notifications, instead of a COUNT(*)
+def unread_count_statement(user_id: int):
+    return select(func.coalesce(
+        select(NotificationCounter.unread_count)
+        .filter(NotificationCounter.user_id == user_id)
+        .scalar_subquery(), 0))
+
+
+# Statement selecting the notifications created after a cursor, oldest first, used to resume a stream
+def since_statement(user_id: int, cursor: str, limit: int):
+    return (
+        select(Notification)
+        .filter(Notification.user_id == user_id,
+                tuple_(Notification.created_at, Notification.id) > decode_cursor(cursor))
+        .order_by(Notification.created_at, Notification.id)
+        .limit(limit + 1)
+    )
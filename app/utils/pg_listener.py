@@ -0,0 +1,93 @@
+from app.config.settings import get_settings
+from app.utils.metrics import Counter
+import asyncio
+import asyncpg
+import logging
+
+
+logger = logging.getLogger(__name__)
+
+# Seconds between probes of an idle LISTEN connection, and timeout of a probe
+PROBE_INTERVAL_SECONDS = 15
+PROBE_TIMEOUT_SECONDS = 5
+# Reconnect backoff
+RETRY_SECONDS = 1
+MAX_RETRY_SECONDS = 30
+
+
+# Single LISTEN connection per process shared by every consumer of Postgres notifications (the notification
+# streams, the plans catalog). Handlers are registered per channel at import time and called on the event loop
+# with the payload; they must not block. Connect handlers run every time the channels start being listened to,
+# consumers catch up there on whatever was notified before (or while the connection was lost).
+class PgListener:
+    def __init__(self):
+        self._handlers = {}
+        self._connect_handlers = []
+        self._task = None
+        self.ready = asyncio.Event()
+        self.reconnects = Counter()
+
+    def add_handler(self, channel: str, handler):
+        self._handlers[channel] = handler
+
+    def add_connect_handler(self, handler):
+        self._connect_handlers.append(handler)
+
+    # Open the connection in the background unless it already is
+    def ensure_started(self):
+        if self._task is None or self._task.done():
+            self._task = asyncio.create_task(self._run())
+
+    # Same, and wait until the channels are listened to
+    async def start(self, timeout: float):
+        self.ensure_started()
+        await asyncio.wait_for(self.ready.wait(), timeout)
+
+    async def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            self._task = None
+
+    def _dispatch(self, conn, pid, channel, payload):
+        try:
+            self._handlers[channel](payload)
+        except Exception:
+            logger.exception("Handler of the %s channel failed", channel)
+
+    async def _run(self):
+        delay = RETRY_SECONDS
+        while True:
+            try:
+                conn = await asyncpg.connect(get_settings().listen_dsn)
+            except Exception:
+                logger.exception("Could not open the LISTEN connection, retrying in %ss", delay)
+                await asyncio.sleep(delay)
+                delay = min(delay * 2, MAX_RETRY_SECONDS)
+                continue
+            delay = RETRY_SECONDS
+            lost = asyncio.Event()
+            conn.add_termination_listener(lambda conn: lost.set())
+            try:
+                for channel in self._handlers:
+                    await conn.add_listener(channel, self._dispatch)
+                self.ready.set()
+                for handler in self._connect_handlers:
+                    try:
+                        handler()
+                    except Exception:
+                        logger.exception("LISTEN connect handler failed")
+                # Idle connections are probed so that a silently dropped one is noticed
+                while not lost.is_set():
+                    try:
+                        await asyncio.wait_for(lost.wait(), PROBE_INTERVAL_SECONDS)
+                    except asyncio.TimeoutError:
+                        await conn.fetchval("SELECT 1", timeout=PROBE_TIMEOUT_SECONDS)
+            except Exception:
+                logger.exception("LISTEN connection lost")
+            finally:
+                self.ready.clear()
+                conn.terminate()
+            self.reconnects.inc()
+
+
+pg_listener = PgListener()
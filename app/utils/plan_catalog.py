@@ -0,0 +1,116 @@
+from pydantic import TypeAdapter
+from sqlalchemy import select
+from app.config.settings import get_settings
+from app.config import database
+from app.models import Plan
+from app.schemas.user import PlanResponse
+from app.utils.pg_listener import pg_listener
+import asyncio
+import hashlib
+import logging
+import time
+
+
+logger = logging.getLogger(__name__)
+
+# Channel notified by the plans_notify trigger whenever the plans table changes
+NOTIFY_CHANNEL = "plans"
+
+_plans_adapter = TypeAdapter(list[PlanResponse])
+
+
+# In-process copy of the active plans, kept as the serialized response body and its ETag so that GET /plans
+# neither queries the database nor serializes anything. Every process reloads its copy on the plans
+# notification, and at the latest PLANS_CACHE_REFRESH_SECONDS after the previous load.
+class PlanCatalog:
+    def __init__(self):
+        self.body = None
+        self.etag = None
+        self.plans = {}
+        self.free_plan = None
+        self.loaded_at = None
+        self._stale = False
+        self._reload_task = None
+        self.loads = 0
+        self.load_errors = 0
+        self.hits = 0
+        self.not_modified = 0
+
+    # Inactive plans are no longer offered but still grant their features to existing subscriptions,
+    # so they are kept in plans (see app.utils.entitlements) and left out of the body only
+    async def load(self):
+        async with database.AsyncSessionLocal() as db:
+            plans = (await db.execute(select(Plan).order_by(Plan.id))).scalars().all()
+        active = [plan for plan in plans if plan.is_active]
+        body = _plans_adapter.dump_json([PlanResponse.model_validate(plan) for plan in active])
+        # Strong validator: the body is byte for byte the same for a given ETag, in every process
+        self.body, self.etag = body, f'"{hashlib.sha256(body).hexdigest()[:32]}"'
+        self.plans = {plan.id: PlanResponse.model_validate(plan) for plan in plans}
+        self.free_plan = next((self.plans[plan.id] for plan in active if plan.name == 'free'), None)
+        self.loaded_at = time.monotonic()
+        self.loads += 1
+
+    # Reload in the background, changes notified while a reload runs are coalesced into one more reload
+    def invalidate(self, payload: str = None):
+        self._stale = True
+        if self._reload_task is None or self._reload_task.done():
+            self._reload_task = asyncio.create_task(self._reload())
+
+    async def _reload(self):
+        while self._stale:
+            self._stale = False
+            try:
+                await self.load()
+            except Exception:
+                self.load_errors += 1
+                logger.exception("Could not reload the plans catalog")
+                return
+
+    # Only the very first call after a failed startup load waits on the database,
+    # an expired copy keeps being served while it is reloaded
+    async def _ensure_loaded(self):
+        if self.body is None:
+            await self.load()
+        elif time.monotonic() - self.loaded_at > get_settings().plans_cache_refresh_seconds:
+            self.invalidate()
+
+    # Returns the (body, etag) to serve
+    async def get(self):
+        await self._ensure_loaded()
+        return self.body, self.etag
+
+    # Returns every plan by id, and the plan of users without an active subscription (None without a free plan)
+    async def get_plans(self):
+        await self._ensure_loaded()
+        return self.plans, self.free_plan
+
+    # Load at startup, the LISTEN connection is opened in the background and triggers a reload once listening
+    async def start(self):
+        pg_listener.ensure_started()
+        try:
+            await self.load()
+        except Exception:
+            self.load_errors += 1
+            logger.exception("Could not load the plans catalog, it is loaded by the first request instead")
+
+    # Wait until the channels are listened to and the reload this triggers is done, after which only
+    # notified changes reload the catalog (e.g. before counting the statements of requests)
+    async def wait_listening(self, timeout: float = 10):
+        await asyncio.wait_for(pg_listener.ready.wait(), timeout)
+        if self._reload_task is not None:
+            await self._reload_task
+
+    def stats(self):
+        return {
+            "plans_etag": self.etag,
+            "loads": self.loads,
+            "load_errors": self.load_errors,
+            "hits": self.hits,
+            "not_modified": self.not_modified,
+        }
+
+
+plan_catalog = PlanCatalog()
+pg_listener.add_handler(NOTIFY_CHANNEL, plan_catalog.invalidate)
+# Changes made before the channel was listened to are picked up by a reload
+pg_listener.add_connect_handler(plan_catalog.invalidate)
@@ -0,0 +1,182 @@
+from collections import Counter as StatementCounter
+from contextlib import contextmanager
+from contextvars import ContextVar
+from functools import lru_cache
+from typing import NamedTuple
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+from starlette.routing import Match
+from app.config import database
+from app.config.settings import get_settings
+import logging
+import re
+import time
+
+
+logger = logging.getLogger(__name__)
+
+_WHITESPACE = re.compile(r"\s+")
+# Bound parameters of psycopg2 (%(name)s) and asyncpg ($1), quoted strings and numbers
+_PARAMETERS = re.compile(r"%\(\w+\)s|\$\d+|'(?:[^']|'')*'|\b\d+(?:\.\d+)?\b")
+# Expanded IN lists vary with the number of values
+_PARAMETER_LISTS = re.compile(r"\(\?(?:, \?)+\)")
+
+
+# Statement with its parameters and literals replaced by ?, so that the same query run with other values compares equal
+@lru_cache(maxsize=1024)
+def normalize_sql(statement: str):
+    statement = _PARAMETERS.sub("?", _WHITESPACE.sub(" ", statement).strip())
+    return _PARAMETER_LISTS.sub("(?, ...)", statement)
+
+
+class QueryRecord(NamedTuple):
+    statement: str
+    seconds: float
+
+
+# Statements executed while a request was served or a capture_queries() block ran
+class QueryLog:
+    def __init__(self):
+        self.queries = []
+
+    @property
+    def count(self):
+        return len(self.queries)
+
+    @property
+    def seconds(self):
+        return sum(query.seconds for query in self.queries)
+
+    # Normalized statements run at least threshold times, the usual sign of a lazy load in a loop
+    def repeated(self, threshold: int = None):
+        threshold = get_settings().query_inspector_repeat_threshold if threshold is None else threshold
+        counts = StatementCounter(query.statement for query in self.queries)
+        return {statement: count for statement, count in counts.items() if count >= threshold}
+
+    def report(self):
+        lines = [f"{self.count} statements in {self.seconds * 1000:.1f} ms:"]
+        lines.extend(f"  {query.seconds * 1000:7.1f} ms  {query.statement}" for query in self.queries)
+        for statement, count in self.repeated().items():
+            lines.append(f"  suspected N+1, run {count} times: {statement}")
+        return "\n".join(lines)
+
+
+# Log of the request being served, the context is copied into the threadpool and the async engine's greenlets
+_request_log = ContextVar("query_log", default=None)
+# Logs of the capture_queries() blocks running, they record the statements of every thread
+_captures = []
+
+
+def _before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    conn.info["inspector_start"] = time.perf_counter()
+
+
+def _after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    log = _request_log.get()
+    if log is None and not _captures:
+        return
+    start = conn.info.pop("inspector_start", None)
+    record = QueryRecord(normalize_sql(statement), time.perf_counter() - start if start is not None else 0.0)
+    if log is not None:
+        log.queries.append(record)
+    for capture in _captures:
+        capture.queries.append(record)
+
+
+# Record the statements of an engine, for the async engine pass its sync_engine
+def inspect_engine(engine: Engine):
+    if not event.contains(engine, "after_cursor_execute", _after_cursor_execute):
+        event.listen(engine, "before_cursor_execute", _before_cursor_execute)
+        event.listen(engine, "after_cursor_execute", _after_cursor_execute)
+
+
+def _inspect_engines():
+    inspect_engine(database.engine)
+    inspect_engine(database.async_engine.sync_engine)
+
+
+# Record every statement executed by the process while the block runs, whichever thread or event loop
+# executes it (the TestClient serves requests on a thread of its own)
+@contextmanager
+def capture_queries():
+    _inspect_engines()
+    log = QueryLog()
+    _captures.append(log)
+    try:
+        yield log
+    finally:
+        _captures.remove(log)
+
+
+# Declare the number of statements a route is allowed, placed below the route decorator:
+#     @router.get("/profile")
+#     @query_budget(2)
+#     def get_user(...):
+def query_budget(max_queries: int):
+    def decorator(endpoint):
+        endpoint.query_budget = max_queries
+        return endpoint
+    return decorator
+
+
+def _iter_routes(routes):
+    for route in routes:
+        # Recent FastAPI versions wrap the included routers instead of copying their routes into the application
+        router = getattr(route, "original_router", None)
+        if router is not None:
+            yield from _iter_routes(router.routes)
+        else:
+            yield route
+
+
+# Budget declared by the route of the application serving method and path, None when it declares none
+def declared_query_budget(app, method: str, path: str):
+    scope = {"type": "http", "method": method, "path": path, "root_path": ""}
+    for route in _iter_routes(app.routes):
+        match, _ = route.matches(scope)
+        if match == Match.FULL:
+            return getattr(route.endpoint, "query_budget", None)
+    return None
+
+
+# Pure ASGI middleware recording the statements of each request (QUERY_INSPECTOR_ENABLED). Requests going over
+# their route's query budget or the duration budget, slow statements and repeated ones are logged as warnings.
+class QueryInspectorMiddleware:
+    def __init__(self, app):
+        self.app = app
+        _inspect_engines()
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            return await self.app(scope, receive, send)
+        log = QueryLog()
+        token = _request_log.set(log)
+        start = time.perf_counter()
+        try:
+            await self.app(scope, receive, send)
+        finally:
+            elapsed = time.perf_counter() - start
+            _request_log.reset(token)
+            route = scope.get("route")
+            self.inspect(f"{scope['method']} {route.path if route is not None else scope['path']}",
+                         getattr(getattr(route, "endpoint", None), "query_budget", None), log, elapsed)
+
+    @staticmethod
+    def inspect(request: str, budget: int, log: QueryLog, elapsed: float):
+        settings = get_settings()
+        budget = settings.query_inspector_max_queries if budget is None else budget
+        problems = []
+        if log.count > budget:
+            problems.append(f"ran {log.count} statements, over its budget of {budget}")
+        if elapsed > settings.query_inspector_max_request_seconds:
+            problems.append(f"took {elapsed * 1000:.0f} ms")
+        slow = [query for query in log.queries if query.seconds > settings.query_inspector_slow_query_seconds]
+        if slow:
+            problems.append(f"ran {len(slow)} slow statements")
+        repeated = log.repeated()
+        if repeated:
+            problems.append(f"repeated {len(repeated)} statements (suspected N+1)")
+        if problems:
+            logger.warning("%s %s\n%s", request, ", ".join(problems), log.report())
+        else:
+            logger.debug("%s %s", request, log.report())
@@ -0,0 +1,220 @@
+from fastapi import HTTPException, Request, status
+from threading import Lock
+from typing import NamedTuple
+from app.config.settings import get_settings
+from app.utils.cache import get_redis_client
+from app.utils.metrics import Counter
+import asyncio
+import hashlib
+import logging
+import math
+import time
+
+
+logger = logging.getLogger(__name__)
+
+# Expired in-process counters are swept every so many increments
+SWEEP_INTERVAL = 1000
+
+
+class Limit(NamedTuple):
+    requests: int
+    seconds: int
+
+
+# Parse a "<requests>/<seconds>" limit, None when empty
+def parse_limit(value: str):
+    if not value:
+        return None
+    requests, seconds = value.split("/")
+    return Limit(int(requests), int(seconds))
+
+
+# Limits of each rate limited route, per kind of key
+ROUTE_LIMITS = {
+    "login": {
+        "ip": parse_limit(get_settings().rate_limit_login_ip),
+        "email": parse_limit(get_settings().rate_limit_login_email),
+    },
+    "register": {
+        "ip": parse_limit(get_settings().rate_limit_register_ip),
+        "email": parse_limit(get_settings().rate_limit_register_email),
+    },
+    "forget-password": {
+        "ip": parse_limit(get_settings().rate_limit_forget_password_ip),
+        "email": parse_limit(get_settings().rate_limit_forget_password_email),
+    },
+}
+
+# Rate limiting counters of this process
+allowed_requests = Counter()
+rejected_requests = {route: {kind: Counter() for kind in limits} for route, limits in ROUTE_LIMITS.items()}
+storage_errors = Counter()
+
+
+# In-process counters, for a single node
+class MemoryStore:
+    blocking = False
+
+    def __init__(self):
+        self._counters = {}
+        self._lock = Lock()
+        self._increments = 0
+
+    def _sweep(self, now: float):
+        for key in [key for key, (_, expires_at) in self._counters.items() if expires_at <= now]:
+            del self._counters[key]
+
+    # Increment every (current, previous, ttl) window counter, returns (current count, previous count) pairs
+    def increment(self, windows: list):
+        now = time.monotonic()
+        counts = []
+        with self._lock:
+            self._increments += 1
+            if self._increments % SWEEP_INTERVAL == 0:
+                self._sweep(now)
+            for current, previous, ttl in windows:
+                count, expires_at = self._counters.get(current, (0, 0))
+                if expires_at <= now:
+                    count, expires_at = 0, now + ttl
+                self._counters[current] = (count + 1, expires_at)
+                previous_count, previous_expires_at = self._counters.get(previous, (0, 0))
+                counts.append((count + 1, previous_count if previous_expires_at > now else 0))
+        return counts
+
+
+# Counters shared by every node through Redis (or anything speaking its protocol), one round trip per request
+class RedisStore:
+    blocking = True
+
+    def __init__(self, client):
+        self.client = client
+
+    def increment(self, windows: list):
+        with self.client.pipeline(transaction=False) as pipe:
+            for current, previous, ttl in windows:
+                pipe.incr(current)
+                pipe.expire(current, ttl)
+                pipe.get(previous)
+            results = pipe.execute()
+        return [(int(results[i]), int(results[i + 2] or 0)) for i in range(0, len(results), 3)]
+
+
+def _create_store():
+    if get_settings().rate_limit_storage == "redis":
+        client = get_redis_client()
+        if client is None:
+            raise RuntimeError("RATE_LIMIT_STORAGE=redis requires REDIS_URL")
+        return RedisStore(client)
+    return MemoryStore()
+
+
+# Sliding window counter: the count of the current fixed window plus the count of the previous one weighted
+# by how much of it still overlaps the sliding window. Two counters per key, whatever the request rate.
+class SlidingWindowLimiter:
+    def __init__(self, store):
+        self.store = store
+
+    # Count a request against every (key, limit), returns for each the seconds to wait when exceeded, else 0
+    def hit(self, keys: list, now: float = None):
+        now = time.time() if now is None else now
+        windows = []
+        for key, limit in keys:
+            index = int(now // limit.seconds)
+            windows.append((f"rate-limit:{key}:{limit.seconds}:{index}",
+                            f"rate-limit:{key}:{limit.seconds}:{index - 1}", limit.seconds * 2))
+        waits = []
+        for (key, limit), (current, previous) in zip(keys, self.store.increment(windows)):
+            elapsed = now % limit.seconds
+            if previous * (1 - elapsed / limit.seconds) + current <= limit.requests:
+                waits.append(0)
+                continue
+            if current >= limit.requests:
+                # Only the start of the next window brings the count back under the limit
+                wait = limit.seconds - elapsed
+            else:
+                # Until enough of the previous window slid out
+                wait = limit.seconds * (1 - (limit.requests - current) / previous) - elapsed
+            waits.append(math.ceil(max(wait, 1)))
+        return waits
+
+
+limiter = SlidingWindowLimiter(_create_store())
+
+
+# Address of the client, read from X-Forwarded-For as appended by the trusted proxies when behind any
+def client_ip(request: Request):
+    trusted_proxies = get_settings().rate_limit_trusted_proxies
+    if trusted_proxies:
+        forwarded = [address.strip() for address in request.headers.get("x-forwarded-for", "").split(",")]
+        forwarded = [address for address in forwarded if address]
+        if len(forwarded) >= trusted_proxies:
+            return forwarded[-trusted_proxies]
+    return request.client.host if request.client else "unknown"
+
+
+# Email address of a login form (its username) or of a JSON body. FastAPI parsed the body before solving the
+# dependencies, reading it again here is served from the request. Email addresses are hashed out of the keys.
+async def _request_email(request: Request):
+    if request.headers.get("content-type", "").startswith("application/json"):
+        try:
+            body = await request.json()
+        except ValueError:
+            return None
+        email = body.get("email") if isinstance(body, dict) else None
+    else:
+        email = (await request.form()).get("username")
+    if not isinstance(email, str) or not email.strip():
+        return None
+    return hashlib.sha256(email.strip().lower().encode()).hexdigest()[:32]
+
+
+# Dependency factory limiting a credential endpoint per client IP and per email address. Declared in the
+# route's dependencies, it rejects a request before any password hashing or database work.
+def rate_limit(route: str):
+    limits = ROUTE_LIMITS[route]
+
+    async def dependency(request: Request):
+        if not get_settings().rate_limit_enabled:
+            return
+        kinds, keys = [], []
+        if limits["ip"]:
+            kinds.append("ip")
+            keys.append((f"{route}:ip:{client_ip(request)}", limits["ip"]))
+        if limits["email"]:
+            email = await _request_email(request)
+            if email:
+                kinds.append("email")
+                keys.append((f"{route}:email:{email}", limits["email"]))
+        if not keys:
+            return
+        try:
+            if limiter.store.blocking:
+                waits = await asyncio.to_thread(limiter.hit, keys)
+            else:
+                waits = limiter.hit(keys)
+        except Exception:
+            # A storage outage lets requests through rather than locking every user out
+            storage_errors.inc()
+            logger.warning("Rate limit storage failed, %s request allowed", route, exc_info=True)
+            return
+        if any(waits):
+            for kind, wait in zip(kinds, waits):
+                if wait:
+                    rejected_requests[route][kind].inc()
+            raise HTTPException(status_code=status.HTTP_429_TOO_MANY_REQUESTS,
+                                detail="Too many requests. Please try again later.",
+                                headers={"Retry-After": str(max(waits))})
+        allowed_requests.inc()
+    return dependency
+
+
+def rate_limit_stats():
+    return {
+        "enabled": get_settings().rate_limit_enabled,
+        "storage": type(limiter.store).__name__,
+        "allowed": allowed_requests.value,
+        "rejected": {route: {kind: counter.value for kind, counter in kinds.items()}
+                     for route, kinds in rejected_requests.items()},
+        "storage_errors": storage_errors.value,
+    }
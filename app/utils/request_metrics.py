@@ -0,0 +1,127 @@
+from contextvars import ContextVar
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+from app.utils.metrics import Counter, Family, Gauge, Histogram, registry
+import anyio.to_thread
+import time
+
+
+# Buckets of the number of queries run by a request
+QUERY_COUNT_BUCKETS = (0, 1, 2, 3, 5, 10, 25, 50, 100)
+# Route label of requests matching no route, so that scanners cannot blow the number of series up
+UNMATCHED_ROUTE = "unmatched"
+
+http_requests = registry.register(Family(
+    "http_requests_total", "HTTP requests by route template and status.",
+    Counter, ("method", "route", "status")))
+http_request_seconds = registry.register(Family(
+    "http_request_duration_seconds", "Time from receiving an HTTP request until its response was sent.",
+    Histogram, ("method", "route", "status")))
+http_requests_in_flight = registry.register(Family(
+    "http_requests_in_flight", "HTTP requests being served.", Gauge,
+    callback=lambda: MetricsMiddleware.in_flight))
+db_queries_per_request = registry.register(Family(
+    "db_queries_per_request", "Database queries run while serving a request.",
+    Histogram, ("route",), buckets=QUERY_COUNT_BUCKETS))
+db_seconds_per_request = registry.register(Family(
+    "db_query_seconds_per_request", "Time spent in database queries while serving a request.",
+    Histogram, ("route",)))
+db_query_seconds = registry.register(Family(
+    "db_query_duration_seconds", "Duration of each database query, in and out of requests.", Histogram))
+# Sync routes and dependencies run on the anyio threadpool, read at collection time on the event loop
+registry.register(Family(
+    "threadpool_busy_threads", "Threadpool threads running sync routes and dependencies.", Gauge,
+    callback=lambda: anyio.to_thread.current_default_thread_limiter().borrowed_tokens))
+registry.register(Family(
+    "threadpool_max_threads", "Size of the threadpool.", Gauge,
+    callback=lambda: anyio.to_thread.current_default_thread_limiter().total_tokens))
+registry.register(Family(
+    "threadpool_waiting_tasks", "Calls waiting for a free threadpool thread.", Gauge,
+    callback=lambda: anyio.to_thread.current_default_thread_limiter().statistics().tasks_waiting))
+
+
+# Queries run while serving the current request. The context is copied into the threadpool and the greenlets
+# of the async engine, so queries run by sync and async routes alike are counted in the request's object.
+class QueryStats:
+    __slots__ = ("count", "seconds")
+
+    def __init__(self):
+        self.count = 0
+        self.seconds = 0.0
+
+
+_query_stats = ContextVar("query_stats", default=None)
+
+
+def _before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    conn.info["query_start"] = time.perf_counter()
+
+
+def _after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    elapsed = time.perf_counter() - conn.info.pop("query_start")
+    db_query_seconds.observe(elapsed)
+    stats = _query_stats.get()
+    if stats is not None:
+        stats.count += 1
+        stats.seconds += elapsed
+
+
+# Time the queries of an engine, for the async engine pass its sync_engine
+def instrument_engine(engine: Engine):
+    event.listen(engine, "before_cursor_execute", _before_cursor_execute)
+    event.listen(engine, "after_cursor_execute", _after_cursor_execute)
+
+
+# Series of each (method, route template, status code), resolved once rather than label by label on every request
+_series = {}
+
+
+def _request_series(method: str, template: str, status_code: int):
+    key = (method, template, status_code)
+    series = _series.get(key)
+    if series is None:
+        labels = (method, template, str(status_code))
+        series = _series[key] = (http_requests.labels(*labels), http_request_seconds.labels(*labels),
+                                 db_queries_per_request.labels(template), db_seconds_per_request.labels(template))
+    return series
+
+
+# Pure ASGI middleware (BaseHTTPMiddleware costs a task and a memory stream per request) recording the count,
+# latency and database usage of each request, labelled by route template rather than path.
+class MetricsMiddleware:
+    # Only ever changed on the event loop thread, so it needs no lock
+    in_flight = 0
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            return await self.app(scope, receive, send)
+        # Left at 500 when the application raises before responding
+        status_code = 500
+
+        async def send_with_status(message):
+            nonlocal status_code
+            if message["type"] == "http.response.start":
+                status_code = message["status"]
+            await send(message)
+
+        stats = QueryStats()
+        token = _query_stats.set(stats)
+        MetricsMiddleware.in_flight += 1
+        start = time.perf_counter()
+        try:
+            await self.app(scope, receive, send_with_status)
+        finally:
+            elapsed = time.perf_counter() - start
+            MetricsMiddleware.in_flight -= 1
+            _query_stats.reset(token)
+            # Set by the router on the scope once a route matched
+            route = scope.get("route")
+            template = route.path if route is not None else UNMATCHED_ROUTE
+            requests, request_seconds, queries, query_seconds = _request_series(scope["method"], template, status_code)
+            requests.inc()
+            request_seconds.observe(elapsed)
+            queries.observe(stats.count)
+            query_seconds.observe(stats.seconds)
@@ -0,0 +1,14 @@
+from fastapi.responses import Response
+from pydantic_core import to_json
+
+
+# Response of a pydantic model (or a list of them) the route built and validated itself, e.g.
+# `return ModelResponse(NotificationPageResponse.model_validate(page, from_attributes=True))`.
+# Serialized to bytes by pydantic in one pass. FastAPI neither validates nor serializes a returned Response,
+# so the route's response_model only documents it. Other routes return plain data, rendered by the default
+# ORJSONResponse set in app.main.
+class ModelResponse(Response):
+    media_type = "application/json"
+
+    def render(self, content) -> bytes:
+        return to_json(content)
@@ -0,0 +1,79 @@
+from sqlalchemy import inspect
+from sqlalchemy.orm import Session, make_transient_to_detached
+from sqlalchemy.ext.asyncio import AsyncSession
+from datetime import datetime
+from app.config.settings import get_settings
+from app.models import User
+from app.utils.cache import TieredCache, get_redis_client
+from app.utils.pg_listener import pg_listener
+
+
+# Channel notified by the users_notify trigger with the id of every changed or deleted user
+NOTIFY_CHANNEL = "users"
+
+# Cache of users rows resolved by get_current_user, keyed by user id.
+# Entries hold plain column values (including the password hash, which update-password verifies against),
+# every route that modifies a user must call invalidate_user. The other processes drop the user from their
+# in-process tier on the users_notify notification.
+user_cache = TieredCache(
+    namespace="user",
+    max_size=get_settings().user_cache_max_size,
+    ttl=get_settings().user_cache_ttl,
+    shared=get_redis_client(),
+)
+
+_datetime_columns = {column.key for column in inspect(User).columns if column.type.python_type is datetime}
+
+
+def _serialize(user: User):
+    data = {attr.key: getattr(user, attr.key) for attr in inspect(User).column_attrs}
+    for key in _datetime_columns:
+        if data[key] is not None:
+            data[key] = data[key].isoformat()
+    return data
+
+
+# Rebuild a detached User from cached values, merge(load=False) then attaches it to the session without a SELECT
+def _deserialize(data: dict):
+    data = dict(data)
+    for key in _datetime_columns:
+        if data.get(key) is not None:
+            data[key] = datetime.fromisoformat(data[key])
+    user = User(**data)
+    make_transient_to_detached(user)
+    return user
+
+
+def get_user(user_id: int, db: Session):
+    if not get_settings().user_cache_enabled:
+        return db.get(User, user_id)
+    data = user_cache.get(user_id)
+    if data is not None:
+        return db.merge(_deserialize(data), load=False)
+    user = db.get(User, user_id)
+    if user:
+        user_cache.set(user_id, _serialize(user))
+    return user
+
+
+async def get_user_async(user_id: int, db: AsyncSession):
+    if not get_settings().user_cache_enabled:
+        return await db.get(User, user_id)
+    data = user_cache.get(user_id)
+    if data is not None:
+        return await db.merge(_deserialize(data), load=False)
+    user = await db.get(User, user_id)
+    if user:
+        user_cache.set(user_id, _serialize(user))
+    return user
+
+
+def invalidate_user(user_id: int):
+    user_cache.delete(user_id)
+
+
+# A logout or password change in one worker must reach the in-process tier of every other worker, or a revoked
+# token would keep being accepted there until the entry expires. Every process drops the changed user's entry
+# on the notification, and its whole in-process tier when notifications were missed.
+pg_listener.add_handler(NOTIFY_CHANNEL, lambda payload: invalidate_user(int(payload)))
+pg_listener.add_connect_handler(user_cache.local.clear)
@@ -0,0 +1,218 @@
+"""Load test of the whole auth lifecycle: register -> verify -> login -> refresh -> profile -> logout.
+
+--users virtual users each run the lifecycle once, --concurrency of them at a time. Reports, per operation,
+the p50/p95/p99 and mean latency, the throughput and the database queries run per request (from the
+db_queries_per_request series of GET /metrics), and the completed lifecycles per second overall.
+
+Starts `uvicorn app.main:app` (--workers processes) unless --url points at a running API. The started API
+sends its emails to a local stub of the provider (scripts/email_api_stub.py) through the outbox dispatcher and
+has rate limiting disabled, every virtual user connecting from the same address. Verification tokens are
+read from the database rather than from the emails so that delivery delays do not skew the verify latency.
+Uses the database configured through the DB_* environment variables (migrated to head), e.g. the Postgres
+service of docker-compose-dev.yaml; the users and their emails are deleted afterwards. Set DB_ASYNC_MODE to
+benchmark the async routers. --output writes the results as JSON, two runs can be compared with
+benchmarks.compare.
+
+Usage: python -m benchmarks.auth_lifecycle [--users 200] [--concurrency 20] [--workers 1] [--output run.json]
+"""
+import argparse
+import asyncio
+import json
+import os
+import re
+import subprocess
+import sys
+import time
+import uuid
+import httpx
+from sqlalchemy import text
+from app.config.database import engine
+from app.config.settings import get_settings
+from scripts.email_api_stub import serve as serve_email_stub
+
+
+PASSWORD = "Benchmark-password-1"
+# Operations of a lifecycle, with the route template whose database queries they are charged
+OPERATIONS = {
+    "register": "/auth/register",
+    "verify": "/auth/verify",
+    "login": "/auth/login",
+    "refresh": "/auth/refresh",
+    "profile": "/user/profile",
+    "logout": "/auth/logout",
+}
+_QUERY_SERIES = re.compile(r'^db_queries_per_request_(sum|count)\{route="([^"]*)"\} (\S+)$', re.MULTILINE)
+
+
+# Nearest rank percentile of sorted values
+def percentile(values: list, rank: float):
+    return values[min(len(values) - 1, int(len(values) * rank / 100))]
+
+
+def verification_token(email: str):
+    with engine.connect() as conn:
+        return conn.execute(text("""
+            SELECT t.token FROM user_verification_tokens t JOIN users u ON u.id = t.user_id
+            WHERE u.email = :email AND t.type = 'new_signup'
+        """), {"email": email}).scalar()
+
+
+# Sums and counts of the queries per request of every route, scraped from GET /metrics
+async def query_totals(client: httpx.AsyncClient):
+    totals = {}
+    for kind, route, value in _QUERY_SERIES.findall((await client.get("/metrics")).text):
+        totals.setdefault(route, {})[kind] = float(value)
+    return totals
+
+
+class Lifecycle:
+    def __init__(self, client: httpx.AsyncClient, latencies: dict, errors: dict):
+        self.client = client
+        self.latencies = latencies
+        self.errors = errors
+
+    # Time one request, False once it did not answer with the expected status
+    async def call(self, operation: str, expected: int, method: str, path: str, **kwargs):
+        start = time.perf_counter()
+        response = await self.client.request(method, path, **kwargs)
+        self.latencies[operation].append(time.perf_counter() - start)
+        if response.status_code != expected:
+            self.errors[operation] += 1
+            return None
+        return response
+
+    async def run(self, email: str):
+        if not await self.call("register", 201, "POST", "/auth/register", json={"email": email, "password": PASSWORD}):
+            return False
+        token = await asyncio.to_thread(verification_token, email)
+        if not await self.call("verify", 200, "GET", "/auth/verify", params={"token": token}):
+            return False
+        response = await self.call("login", 200, "POST", "/auth/login", data={"username": email, "password": PASSWORD})
+        if not response:
+            return False
+        response = await self.call("refresh", 200, "POST", "/auth/refresh",
+                                   json={"refresh_token": response.json()["refresh_token"]})
+        if not response:
+            return False
+        headers = {"Authorization": f"Bearer {response.json()['access_token']}"}
+        if not await self.call("profile", 200, "GET", "/user/profile", headers=headers):
+            return False
+        return bool(await self.call("logout", 200, "POST", "/auth/logout", headers=headers))
+
+
+async def run(args, prefix: str):
+    latencies = {operation: [] for operation in OPERATIONS}
+    errors = {operation: 0 for operation in OPERATIONS}
+    limits = httpx.Limits(max_connections=args.concurrency, max_keepalive_connections=args.concurrency)
+    async with httpx.AsyncClient(base_url=args.url, limits=limits, timeout=60) as client:
+        queries_before = await query_totals(client)
+        lifecycle = Lifecycle(client, latencies, errors)
+        semaphore = asyncio.Semaphore(args.concurrency)
+
+        async def run_one(i: int):
+            async with semaphore:
+                return await lifecycle.run(f"{prefix}-{i}@example.com")
+
+        start = time.perf_counter()
+        completed = sum(await asyncio.gather(*(run_one(i) for i in range(args.users))))
+        elapsed = time.perf_counter() - start
+        queries_after = await query_totals(client)
+
+    operations = {}
+    for operation, route in OPERATIONS.items():
+        values = sorted(latencies[operation])
+        before, after = queries_before.get(route, {}), queries_after.get(route, {})
+        requests = after.get("count", 0) - before.get("count", 0)
+        operations[operation] = {
+            "requests": len(values),
+            "errors": errors[operation],
+            "p50_ms": percentile(values, 50) * 1000 if values else None,
+            "p95_ms": percentile(values, 95) * 1000 if values else None,
+            "p99_ms": percentile(values, 99) * 1000 if values else None,
+            "mean_ms": sum(values) / len(values) * 1000 if values else None,
+            "throughput_per_second": len(values) / elapsed,
+            # With several workers only the worker answering GET /metrics is accounted for
+            "queries_per_request": (after.get("sum", 0) - before.get("sum", 0)) / requests if requests else None,
+        }
+    return {"completed": completed, "seconds": elapsed, "lifecycles_per_second": completed / elapsed,
+            "operations": operations}
+
+
+def start_api(args):
+    email_stub = serve_email_stub(port=args.email_stub_port)
+    env = dict(os.environ,
+               RATE_LIMIT_ENABLED="False",
+               EMAIL_DISPATCHER_ENABLED="True",
+               EMAIL_API_ENDPOINT=f"http://127.0.0.1:{args.email_stub_port}/api/send/1",
+               EMAIL_API_BATCH_ENDPOINT=f"http://127.0.0.1:{args.email_stub_port}/api/batch/1")
+    if args.bcrypt_rounds:
+        env["BCRYPT_ROUNDS"] = str(args.bcrypt_rounds)
+    server = subprocess.Popen([sys.executable, "-m", "uvicorn", "app.main:app", "--port", str(args.port),
+                               "--workers", str(args.workers), "--log-level", "warning"], env=env)
+    for _ in range(300):
+        try:
+            httpx.get(args.url + "/")
+            break
+        except httpx.TransportError:
+            time.sleep(0.1)
+    return server, email_stub
+
+
+def git_commit():
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True).stdout.strip()
+    except OSError:
+        return None
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--users", type=int, default=200)
+    parser.add_argument("--concurrency", type=int, default=20)
+    parser.add_argument("--url", help="Running API to benchmark instead of starting one")
+    parser.add_argument("--port", type=int, default=8092)
+    parser.add_argument("--workers", type=int, default=1)
+    parser.add_argument("--bcrypt-rounds", type=int, help="BCRYPT_ROUNDS of the started API")
+    parser.add_argument("--email-stub-port", type=int, default=8026)
+    parser.add_argument("--output", help="Write the results to this JSON file")
+    args = parser.parse_args()
+
+    server = email_stub = None
+    if args.url is None:
+        args.url = f"http://127.0.0.1:{args.port}"
+        server, email_stub = start_api(args)
+
+    prefix = f"benchmark-{uuid.uuid4().hex[:12]}"
+    try:
+        results = asyncio.run(run(args, prefix))
+    finally:
+        with engine.begin() as conn:
+            conn.execute(text("DELETE FROM users WHERE email LIKE :pattern"), {"pattern": f"{prefix}-%"})
+            conn.execute(text("DELETE FROM email_outbox WHERE recipient LIKE :pattern"), {"pattern": f"{prefix}-%"})
+        if server is not None:
+            server.terminate()
+            server.wait()
+            email_stub.shutdown()
+
+    print(f"{results['completed']}/{args.users} lifecycles in {results['seconds']:.1f}s at concurrency "
+          f"{args.concurrency}: {results['lifecycles_per_second']:.1f} lifecycles/s")
+    print(f"{'operation':10} {'requests':>8} {'errors':>6} {'p50 ms':>8} {'p95 ms':>8} {'p99 ms':>8} "
+          f"{'req/s':>8} {'queries':>8}")
+    for operation, result in results["operations"].items():
+        if not result["requests"]:
+            continue
+        queries = f"{result['queries_per_request']:8.1f}" if result["queries_per_request"] is not None else f"{'-':>8}"
+        print(f"{operation:10} {result['requests']:8} {result['errors']:6} {result['p50_ms']:8.1f} "
+              f"{result['p95_ms']:8.1f} {result['p99_ms']:8.1f} {result['throughput_per_second']:8.1f} {queries}")
+
+    if args.output:
+        settings = get_settings()
+        config = {"users": args.users, "concurrency": args.concurrency, "workers": args.workers,
+                  "async_mode": settings.db_async_mode, "pool_mode": settings.db_pool_mode,
+                  "bcrypt_rounds": args.bcrypt_rounds or settings.bcrypt_rounds, "commit": git_commit()}
+        with open(args.output, "w") as output:
+            json.dump({"benchmark": "auth_lifecycle", "config": config, "results": results}, output, indent=2)
+
+
+if __name__ == "__main__":
+    main()
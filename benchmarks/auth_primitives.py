@@ -0,0 +1,66 @@
+"""Microbenchmarks of the primitives behind the auth routes: JWT creation and verification, refresh token
+digests and bcrypt hashing / verification at the configured BCRYPT_ROUNDS.
+
+Everything runs inline in this process, without the hashing worker pool, so the numbers are the raw cost of
+each operation on one core. No database is needed. --output writes the results as JSON, two runs can be
+compared with benchmarks.compare.
+
+Usage: python -m benchmarks.auth_primitives [--iterations 20000] [--hash-iterations 20] [--output primitives.json]
+"""
+import argparse
+import json
+import time
+from app.config.settings import get_settings
+from app.utils import auth as auth_util
+from app.utils.hashing import pwd_context
+
+
+PASSWORD = "Benchmark-password-1"
+
+
+# Mean microseconds and operations per second of fn
+def measure(fn, iterations: int):
+    fn()
+    start = time.perf_counter()
+    for _ in range(iterations):
+        fn()
+    elapsed = time.perf_counter() - start
+    return {"iterations": iterations, "mean_us": elapsed / iterations * 1_000_000,
+            "ops_per_second": iterations / elapsed}
+
+
+def run(iterations: int, hash_iterations: int):
+    claims = {"user_id": "1", "role": "user", "is_verified": True, "token_version": 0}
+    access_token = auth_util.create_access_token(data=claims)
+    refresh_token, _ = auth_util.create_refresh_token(data={"user_id": "1", "token_version": 0})
+    password_hash = pwd_context.hash(PASSWORD)
+    return {
+        "create_access_token": measure(lambda: auth_util.create_access_token(data=claims), iterations),
+        "verify_access_token": measure(lambda: auth_util.verify_access_token(access_token), iterations),
+        "create_refresh_token": measure(
+            lambda: auth_util.create_refresh_token(data={"user_id": "1", "token_version": 0}), iterations),
+        "verify_refresh_token": measure(lambda: auth_util.verify_refresh_token(refresh_token), iterations),
+        "hash_refresh_token": measure(lambda: auth_util.hash_refresh_token(refresh_token), iterations),
+        "bcrypt_hash": measure(lambda: pwd_context.hash(PASSWORD), hash_iterations),
+        "bcrypt_verify": measure(lambda: pwd_context.verify_and_update(PASSWORD, password_hash), hash_iterations),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--iterations", type=int, default=20_000)
+    parser.add_argument("--hash-iterations", type=int, default=20)
+    parser.add_argument("--output", help="Write the results to this JSON file")
+    args = parser.parse_args()
+
+    results = run(args.iterations, args.hash_iterations)
+    for name, result in results.items():
+        print(f"{name:22} {result['mean_us']:12.1f} us  {result['ops_per_second']:12.0f} ops/s")
+    if args.output:
+        with open(args.output, "w") as output:
+            json.dump({"benchmark": "auth_primitives", "config": {"bcrypt_rounds": get_settings().bcrypt_rounds},
+                       "results": results}, output, indent=2)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,48 @@
+"""Compare two JSON results written by a benchmark's --output (e.g. before and after a change).
+
+Prints every numeric result found in both files side by side with the relative change. Whether a change is
+an improvement depends on the metric: lower is better for latencies (*_ms, *_us) and queries, higher for
+throughputs (*_per_second).
+
+Usage: python -m benchmarks.compare baseline.json candidate.json
+"""
+import argparse
+import json
+
+
+# Numeric leaves of nested results, keyed by their dotted path
+def flatten(results: dict, prefix: str = ""):
+    values = {}
+    for key, value in results.items():
+        path = f"{prefix}{key}"
+        if isinstance(value, dict):
+            values.update(flatten(value, path + "."))
+        elif isinstance(value, (int, float)) and not isinstance(value, bool):
+            values[path] = value
+    return values
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("baseline")
+    parser.add_argument("candidate")
+    args = parser.parse_args()
+
+    with open(args.baseline) as baseline_file, open(args.candidate) as candidate_file:
+        baseline, candidate = json.load(baseline_file), json.load(candidate_file)
+    if baseline.get("benchmark") != candidate.get("benchmark"):
+        parser.error(f"{baseline.get('benchmark')} results cannot be compared with {candidate.get('benchmark')} ones")
+    for name, config in (("baseline", baseline.get("config")), ("candidate", candidate.get("config"))):
+        print(f"{name:9} {json.dumps(config)}")
+
+    before, after = flatten(baseline["results"]), flatten(candidate["results"])
+    width = max(len(path) for path in before)
+    for path, value in before.items():
+        if path not in after:
+            continue
+        change = f"{(after[path] - value) / value * 100:+7.1f}%" if value else ""
+        print(f"{path:{width}} {value:14.2f} {after[path]:14.2f} {change}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,113 @@
+"""Measure the per-request overhead of gating a route with require_feature / require_plan.
+
+Creates a throwaway user subscribed to a throwaway plan, then times:
+- get_entitlements itself on a cache hit and on a cache miss (one query),
+- requests to three routes of a minimal in-process app: one authenticated with the claims-only principal
+  (the baseline), one gated with require_feature and one gated with require_plan. The difference with the
+  baseline is what gating a hot route costs.
+Uses the database configured through the DB_* environment variables (migrated to head); the user and plan are
+deleted afterwards.
+
+Usage: python -m benchmarks.entitlements [--requests 5000] [--calls 100000]
+"""
+import argparse
+import asyncio
+import time
+import uuid
+import httpx
+from fastapi import Depends, FastAPI
+from app.config import database
+from app.models import Plan, Subscription, User
+from app.schemas.auth import Principal
+from app.utils import auth as auth_util
+from app.utils.auth import create_access_token
+from app.utils.entitlements import get_entitlements, invalidate_entitlements, require_feature, require_plan
+from app.utils.plan_catalog import plan_catalog
+
+
+app = FastAPI()
+
+
+@app.get("/baseline")
+async def baseline(principal: Principal = Depends(auth_util.get_current_principal)):
+    return {}
+
+
+@app.get("/feature", dependencies=[Depends(require_feature("exports"))])
+async def feature():
+    return {}
+
+
+@app.get("/plan", dependencies=[Depends(require_plan("pro"))])
+async def plan():
+    return {}
+
+
+def create_fixture():
+    with database.SessionLocal() as db:
+        plan = Plan(name="pro", description="Entitlements benchmark", price="0", features={"exports": True})
+        user = User(email=f"benchmark-{uuid.uuid4().hex[:12]}@example.com", password="!", is_verified=True)
+        user.subscription = Subscription(plan=plan, status="active")
+        db.add(user)
+        db.commit()
+        return user.id, plan.id
+
+
+def delete_fixture(user_id: int, plan_id: int):
+    with database.SessionLocal() as db:
+        db.delete(db.get(User, user_id))
+        db.delete(db.get(Plan, plan_id))
+        db.commit()
+
+
+# Mean microseconds per awaited call
+async def timed(call, iterations: int):
+    start = time.perf_counter()
+    for _ in range(iterations):
+        await call()
+    return (time.perf_counter() - start) / iterations * 1_000_000
+
+
+async def run(args, user_id: int):
+    await plan_catalog.load()
+
+    hit = await timed(lambda: get_entitlements(user_id), args.calls)
+
+    async def miss():
+        invalidate_entitlements(user_id)
+        await get_entitlements(user_id)
+    miss_us = await timed(miss, max(args.calls // 100, 100))
+    print(f"get_entitlements  hit {hit:8.1f} us  miss {miss_us:8.1f} us")
+
+    token = create_access_token(data={"user_id": str(user_id), "role": "user", "is_verified": True})
+    headers = {"Authorization": f"Bearer {token}"}
+    async with httpx.AsyncClient(transport=httpx.ASGITransport(app=app), base_url="http://benchmark") as client:
+        for path in ("/baseline", "/feature", "/plan"):
+            assert (await client.get(path, headers=headers)).status_code == 200
+        # Interleaved rounds so that drift affects every route alike
+        totals = {"/baseline": 0.0, "/feature": 0.0, "/plan": 0.0}
+        rounds = 10
+        for _ in range(rounds):
+            for path in totals:
+                totals[path] += await timed(lambda: client.get(path, headers=headers), args.requests // rounds)
+    baseline_us = totals["/baseline"] / rounds
+    for path, total in totals.items():
+        print(f"GET {path:10} {total / rounds:8.1f} us/request  overhead {total / rounds - baseline_us:+7.1f} us")
+    await database.async_engine.dispose()
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--requests", type=int, default=5_000)
+    parser.add_argument("--calls", type=int, default=100_000)
+    args = parser.parse_args()
+
+    user_id, plan_id = create_fixture()
+    try:
+        asyncio.run(run(args, user_id))
+    finally:
+        delete_fixture(user_id, plan_id)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,89 @@
+"""Measure job queue throughput in jobs/second, overall and per worker process.
+
+Enqueues --jobs no-op jobs on a dedicated "benchmark" queue with a single INSERT ... SELECT, then lets
+1, 2, 4 ... worker processes (see --workers) drain it through the same claim / complete statements as
+`python -m app.tasks.jobs worker`. Process start up is excluded from the timing. Uses the database
+configured through the DB_* environment variables (migrated to head); the benchmark jobs are deleted afterwards.
+
+Usage: python -m benchmarks.job_queue_throughput [--jobs 20000] [--workers 1,2,4] [--batch-size 10]
+"""
+import argparse
+import multiprocessing
+import time
+from pydantic import BaseModel
+from sqlalchemy import text
+from app.config.database import engine
+from app.tasks.queue import Worker, job, processed_jobs
+
+
+QUEUE = "benchmark"
+
+
+class NoopPayload(BaseModel):
+    pass
+
+
+# Registered at import time, which also happens in every spawned worker process
+@job("benchmark.noop", NoopPayload, queue=QUEUE)
+def noop(payload: NoopPayload):
+    pass
+
+
+def work(batch_size: int, ready, start, results):
+    worker = Worker([QUEUE], batch_size)
+    # Open the pooled connection before the clock starts
+    with engine.connect():
+        pass
+    ready.release()
+    start.wait()
+    worker.run(exit_when_empty=True)
+    results.put(processed_jobs.value)
+
+
+def enqueue(jobs: int):
+    with engine.begin() as conn:
+        conn.execute(text("""
+            INSERT INTO jobs (queue, type, payload)
+            SELECT :queue, 'benchmark.noop', '{}'::json FROM generate_series(1, :jobs)
+        """), {"queue": QUEUE, "jobs": jobs})
+        conn.execute(text("ANALYZE jobs"))
+
+
+def run(processes: int, jobs: int, batch_size: int):
+    context = multiprocessing.get_context("spawn")
+    ready, start, results = context.Semaphore(0), context.Event(), context.Queue()
+    workers = [context.Process(target=work, args=(batch_size, ready, start, results)) for _ in range(processes)]
+    for worker in workers:
+        worker.start()
+    for _ in workers:
+        ready.acquire()
+
+    started = time.perf_counter()
+    start.set()
+    processed = [results.get() for _ in workers]
+    elapsed = time.perf_counter() - started
+    for worker in workers:
+        worker.join()
+    return sum(processed), elapsed
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--jobs", type=int, default=20_000)
+    parser.add_argument("--workers", default="1,2,4")
+    parser.add_argument("--batch-size", type=int, default=10)
+    args = parser.parse_args()
+
+    try:
+        for processes in [int(count) for count in args.workers.split(",")]:
+            enqueue(args.jobs)
+            processed, elapsed = run(processes, args.jobs, args.batch_size)
+            print(f"{processes:3} workers  {processed} jobs in {elapsed:.2f}s  "
+                  f"{processed / elapsed:,.0f} jobs/s  {processed / elapsed / processes:,.0f} jobs/s per worker")
+    finally:
+        with engine.begin() as conn:
+            conn.execute(text("DELETE FROM jobs WHERE queue = :queue"), {"queue": QUEUE})
+
+
+if __name__ == "__main__":
+    main()
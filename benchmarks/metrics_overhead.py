@@ -0,0 +1,85 @@
+"""Measure the per-request overhead of MetricsMiddleware and the cost of rendering GET /metrics.
+
+Calls two minimal in-process apps directly through ASGI, without any HTTP client or server in between so that
+the difference is not lost in their noise: one serving a trivial route as is (the baseline) and the same one
+wrapped in MetricsMiddleware. Both an async and a sync (threadpool) route are measured, the difference with the
+baseline is what the instrumentation costs each request. No database is needed.
+
+Usage: python -m benchmarks.metrics_overhead [--requests 50000]
+"""
+import argparse
+import asyncio
+import time
+from fastapi import FastAPI
+from app.utils.metrics import registry
+from app.utils.request_metrics import MetricsMiddleware
+
+
+app = FastAPI()
+
+
+@app.get("/async/{item_id}")
+async def async_route(item_id: int):
+    return {}
+
+
+@app.get("/sync/{item_id}")
+def sync_route(item_id: int):
+    return {}
+
+
+instrumented = MetricsMiddleware(app)
+
+
+def scope(path: str):
+    return {"type": "http", "asgi": {"version": "3.0"}, "http_version": "1.1", "method": "GET", "scheme": "http",
+            "path": path, "raw_path": path.encode(), "root_path": "", "query_string": b"", "headers": [],
+            "client": ("127.0.0.1", 1234), "server": ("benchmark", 80)}
+
+
+async def receive():
+    return {"type": "http.request", "body": b"", "more_body": False}
+
+
+async def send(message):
+    pass
+
+
+# Mean microseconds per request
+async def timed(target, path: str, requests: int):
+    start = time.perf_counter()
+    for _ in range(requests):
+        await target(scope(path), receive, send)
+    return (time.perf_counter() - start) / requests * 1_000_000
+
+
+async def run(args):
+    for path in ("/async/1", "/sync/1"):
+        await timed(app, path, 1000)
+        await timed(instrumented, path, 1000)
+        # Interleaved rounds so that drift affects both apps alike
+        baseline = with_metrics = 0.0
+        rounds = 10
+        for _ in range(rounds):
+            baseline += await timed(app, path, args.requests // rounds)
+            with_metrics += await timed(instrumented, path, args.requests // rounds)
+        baseline, with_metrics = baseline / rounds, with_metrics / rounds
+        print(f"GET {path:9} baseline {baseline:7.1f} us  with metrics {with_metrics:7.1f} us  "
+              f"overhead {with_metrics - baseline:+6.1f} us/request")
+
+    renders = 1000
+    start = time.perf_counter()
+    for _ in range(renders):
+        body = registry.render()
+    print(f"GET /metrics render {(time.perf_counter() - start) / renders * 1000:.2f} ms, {len(body)} bytes")
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--requests", type=int, default=50_000)
+    args = parser.parse_args()
+    asyncio.run(run(args))
+
+
+if __name__ == "__main__":
+    main()
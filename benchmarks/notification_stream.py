@@ -0,0 +1,156 @@
+"""Hold --connections idle notification streams on a single API worker and measure what they cost.
+
+Creates --users throwaway users and opens GET /user/notifications/stream --connections times, spread evenly over
+them. Reports the time to open the streams, the resident memory of the worker before and after, its CPU usage
+while the streams sit idle for --idle seconds (heartbeats only), and the fan out latency: the time from
+inserting one notification per user in a single statement until every stream received its event.
+
+Starts `uvicorn app.main:app` with one worker unless --url points at a running one (pass its --pid to report
+its memory and CPU). Uses the database configured through the DB_* environment variables (migrated to head);
+the users are deleted afterwards. Raise the open files limit (ulimit -n) above --connections first.
+
+Usage: python -m benchmarks.notification_stream [--connections 10000] [--users 1000] [--idle 30]
+"""
+import argparse
+import asyncio
+import os
+import subprocess
+import sys
+import time
+import uuid
+from urllib.parse import urlsplit
+import httpx
+from sqlalchemy import text
+from app.config.database import engine
+from app.utils.auth import create_access_token
+
+
+# Concurrent stream openings, each one checks the token against the database
+OPEN_CONCURRENCY = 100
+
+
+def create_users(users: int):
+    prefix = f"benchmark-{uuid.uuid4().hex[:12]}"
+    with engine.begin() as conn:
+        return prefix, conn.execute(text("""
+            INSERT INTO users (email, password, is_verified)
+            SELECT :prefix || '-' || i || '@example.com', '!', true FROM generate_series(1, :users) AS i
+            RETURNING id
+        """), {"prefix": prefix, "users": users}).scalars().all()
+
+
+def process_usage(pid: int):
+    with open(f"/proc/{pid}/status") as status:
+        rss_kb = next(int(line.split()[1]) for line in status if line.startswith("VmRSS:"))
+    with open(f"/proc/{pid}/stat") as stat:
+        fields = stat.read().rsplit(")", 1)[1].split()
+    cpu_seconds = (int(fields[11]) + int(fields[12])) / os.sysconf("SC_CLK_TCK")
+    return rss_kb / 1024, cpu_seconds
+
+
+class Stream:
+    def __init__(self, host: str, port: int, token: str):
+        self.host, self.port, self.token = host, port, token
+
+    # Plain sockets rather than an HTTP client keep the benchmark's own overhead low
+    async def open(self):
+        self.reader, self.writer = await asyncio.open_connection(self.host, self.port)
+        self.writer.write((f"GET /user/notifications/stream HTTP/1.1\r\nHost: {self.host}\r\n"
+                           f"Authorization: Bearer {self.token}\r\nAccept: text/event-stream\r\n\r\n").encode())
+        status = await self.reader.readline()
+        if b" 200 " not in status:
+            raise RuntimeError(f"Stream rejected: {status.decode().strip()}")
+        # The first event carries the retry interval
+        await self.reader.readuntil(b"\n\n")
+
+    async def wait_for_notification(self):
+        await self.reader.readuntil(b"event: notification")
+
+    def close(self):
+        self.writer.close()
+
+
+async def open_streams(url: str, tokens: list, connections: int):
+    address = urlsplit(url)
+    semaphore = asyncio.Semaphore(OPEN_CONCURRENCY)
+    streams = [Stream(address.hostname, address.port, tokens[i % len(tokens)]) for i in range(connections)]
+
+    async def open_one(stream):
+        async with semaphore:
+            await stream.open()
+
+    await asyncio.gather(*(open_one(stream) for stream in streams))
+    return streams
+
+
+async def run(args, user_ids: list, pid: int):
+    tokens = [create_access_token(data={"user_id": str(user_id), "role": "user", "is_verified": True})
+              for user_id in user_ids]
+    memory_before, _ = process_usage(pid) if pid else (None, None)
+
+    start = time.perf_counter()
+    streams = await open_streams(args.url, tokens, args.connections)
+    print(f"opened {len(streams)} streams in {time.perf_counter() - start:.2f}s")
+    async with httpx.AsyncClient(base_url=args.url) as client:
+        print(f"open streams reported by the worker: {(await client.get('/metrics/notifications')).json()['open']}")
+
+    if pid:
+        memory_after, cpu_before = process_usage(pid)
+        print(f"worker memory {memory_before:.0f} MiB -> {memory_after:.0f} MiB, "
+              f"{(memory_after - memory_before) * 1024 / len(streams):.1f} KiB per stream")
+    await asyncio.sleep(args.idle)
+    if pid:
+        _, cpu_after = process_usage(pid)
+        print(f"worker CPU while idle for {args.idle}s: {(cpu_after - cpu_before) / args.idle * 100:.1f}%")
+
+    waiting = [asyncio.create_task(stream.wait_for_notification()) for stream in streams]
+    await asyncio.sleep(0)
+    start = time.perf_counter()
+    with engine.begin() as conn:
+        conn.execute(text("INSERT INTO notifications (user_id, message) SELECT unnest(CAST(:user_ids AS int[])), 'Benchmark'"),
+                     {"user_ids": user_ids})
+    await asyncio.gather(*waiting)
+    print(f"fan out of {len(user_ids)} notifications to {len(streams)} streams: "
+          f"{(time.perf_counter() - start) * 1000:.0f} ms")
+
+    for stream in streams:
+        stream.close()
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--connections", type=int, default=10_000)
+    parser.add_argument("--users", type=int, default=1_000)
+    parser.add_argument("--idle", type=float, default=30)
+    parser.add_argument("--url", help="Running API to benchmark instead of starting one")
+    parser.add_argument("--pid", type=int, help="Process id of the API given by --url")
+    parser.add_argument("--port", type=int, default=8090)
+    args = parser.parse_args()
+
+    server = None
+    pid = args.pid
+    if args.url is None:
+        args.url = f"http://127.0.0.1:{args.port}"
+        server = subprocess.Popen([sys.executable, "-m", "uvicorn", "app.main:app", "--port", str(args.port),
+                                   "--workers", "1", "--log-level", "warning"])
+        pid = server.pid
+        for _ in range(100):
+            try:
+                httpx.get(args.url + "/")
+                break
+            except httpx.TransportError:
+                time.sleep(0.1)
+
+    prefix, user_ids = create_users(args.users)
+    try:
+        asyncio.run(run(args, user_ids, pid))
+    finally:
+        with engine.begin() as conn:
+            conn.execute(text("DELETE FROM users WHERE email LIKE :pattern"), {"pattern": f"{prefix}-%"})
+        if server is not None:
+            server.terminate()
+            server.wait()
+
+
+if __name__ == "__main__":
+    main()
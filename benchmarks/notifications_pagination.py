@@ -0,0 +1,90 @@
+"""Measure /user/notifications latency against the depth of the page, with --notifications rows for one user.
+
+Creates a throwaway user, inserts its notifications with a single INSERT ... SELECT (a tenth of them unread),
+then times the keyset page statements behind /user/notifications at increasing depths, next to the same pages
+fetched with OFFSET for contrast, and the unread count behind /user/notifications/unread-count next to a
+COUNT(*). Keyset pages and the counter should stay flat while OFFSET and COUNT(*) grow with the depth / rows.
+Uses the database configured through the DB_* environment variables (migrated to head); the user and its
+notifications are deleted afterwards.
+
+Usage: python -m benchmarks.notifications_pagination [--notifications 1000000] [--limit 20] [--repeat 20]
+"""
+import argparse
+import statistics
+import time
+import uuid
+from sqlalchemy import func, select, text
+from app.config.database import engine
+from app.models import Notification
+from app.utils import notifications as notifications_util
+
+
+def create_user(notifications: int):
+    with engine.begin() as conn:
+        user_id = conn.execute(text("INSERT INTO users (email, password) VALUES (:email, '!') RETURNING id"),
+                               {"email": f"benchmark-{uuid.uuid4().hex[:12]}@example.com"}).scalar()
+        conn.execute(text("""
+            INSERT INTO notifications (user_id, message, is_read, created_at)
+            SELECT :user_id, 'Notification ' || i, i % 10 <> 0, now() - i * interval '1 second'
+            FROM generate_series(1, :notifications) AS i
+        """), {"user_id": user_id, "notifications": notifications})
+    with engine.connect() as conn:
+        conn.execution_options(isolation_level="AUTOCOMMIT").execute(text("VACUUM ANALYZE notifications"))
+    return user_id
+
+
+# Median milliseconds of running the statement built by make_statement
+def timed(conn, make_statement, repeat: int):
+    durations = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        conn.execute(make_statement()).all()
+        durations.append((time.perf_counter() - start) * 1000)
+    return statistics.median(durations)
+
+
+# Cursors of the pages starting at the given depths, read from the rows in page order
+def cursors_at(conn, user_id: int, depths: list, unread_only: bool):
+    cursors = {0: None}
+    for depth in depths:
+        if depth:
+            row = conn.execute(notifications_util.page_statement(user_id, 0, unread_only=unread_only)
+                               .limit(1).offset(depth - 1)).first()
+            cursors[depth] = notifications_util.encode_cursor(row) if row else None
+    return cursors
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--notifications", type=int, default=1_000_000)
+    parser.add_argument("--limit", type=int, default=20)
+    parser.add_argument("--repeat", type=int, default=20)
+    args = parser.parse_args()
+
+    depths = [depth for depth in (0, 1_000, 10_000, 100_000, 500_000, args.notifications - args.limit)
+              if 0 <= depth <= args.notifications - args.limit]
+    user_id = create_user(args.notifications)
+    try:
+        with engine.connect() as conn:
+            for unread_only in (False, True):
+                print(f"{'unread' if unread_only else 'all'} notifications, pages of {args.limit}")
+                cursors = cursors_at(conn, user_id, depths, unread_only)
+                for depth in depths:
+                    if depth and cursors[depth] is None:
+                        continue
+                    keyset = timed(conn, lambda: notifications_util.page_statement(
+                        user_id, args.limit, cursors[depth], unread_only), args.repeat)
+                    offset = timed(conn, lambda: notifications_util.page_statement(
+                        user_id, args.limit, unread_only=unread_only).offset(depth), args.repeat)
+                    print(f"  depth {depth:>9,}  keyset {keyset:8.2f} ms  offset {offset:8.2f} ms")
+            counter = timed(conn, lambda: notifications_util.unread_count_statement(user_id), args.repeat)
+            count = timed(conn, lambda: select(func.count()).select_from(Notification).filter(
+                Notification.user_id == user_id, Notification.is_read == False), args.repeat)
+            print(f"unread count  counter {counter:8.2f} ms  COUNT(*) {count:8.2f} ms")
+    finally:
+        with engine.begin() as conn:
+            conn.execute(text("DELETE FROM users WHERE id = :user_id"), {"user_id": user_id})
+
+
+if __name__ == "__main__":
+    main()
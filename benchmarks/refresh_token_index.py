@@ -0,0 +1,88 @@
+"""Compare raw JWT refresh tokens against SHA-256 digests as the session lookup key.
+
+Fills two scratch tables with the same synthetic sessions, one keyed by a ~200 character
+JWT-like VARCHAR and one by its 32 byte BYTEA digest, builds the same unique index on both
+and reports index size and point lookup latency. Uses the database configured through the
+DB_* environment variables; the scratch tables are dropped afterwards.
+
+Usage: python -m benchmarks.refresh_token_index [--rows 10000000] [--lookups 20000]
+"""
+import argparse
+import hashlib
+import random
+import statistics
+import time
+from sqlalchemy import text
+from app.config.database import engine
+
+
+# ~200 characters, roughly the size of the HS256 refresh tokens issued by create_refresh_token
+TOKEN_SQL = "'eyJhbGciOiJIUzI1NiIsInR5cCI6IkpXVCJ9.' || repeat(md5(i::text), 4) || '.' || md5((i * 7)::text)"
+
+
+def token(i: int):
+    md5 = lambda value: hashlib.md5(str(value).encode()).hexdigest()
+    return "eyJhbGciOiJIUzI1NiIsInR5cCI6IkpXVCJ9." + md5(i) * 4 + "." + md5(i * 7)
+
+
+def setup(conn, rows: int):
+    conn.execute(text("DROP TABLE IF EXISTS bench_sessions_raw, bench_sessions_hash"))
+    conn.execute(text("CREATE UNLOGGED TABLE bench_sessions_raw (id BIGINT PRIMARY KEY, refresh_token VARCHAR(255))"))
+    conn.execute(text("CREATE UNLOGGED TABLE bench_sessions_hash (id BIGINT PRIMARY KEY, refresh_token_hash BYTEA)"))
+    conn.execute(text(f"INSERT INTO bench_sessions_raw SELECT i, {TOKEN_SQL} FROM generate_series(1, :rows) i"),
+                 {"rows": rows})
+    conn.execute(text("INSERT INTO bench_sessions_hash "
+                      "SELECT id, sha256(convert_to(refresh_token, 'UTF8')) FROM bench_sessions_raw"))
+    conn.execute(text("CREATE UNIQUE INDEX bench_sessions_raw_token ON bench_sessions_raw (refresh_token)"))
+    conn.execute(text("CREATE UNIQUE INDEX bench_sessions_hash_token ON bench_sessions_hash (refresh_token_hash)"))
+    conn.execute(text("ANALYZE bench_sessions_raw"))
+    conn.execute(text("ANALYZE bench_sessions_hash"))
+
+
+def measure(conn, sql: str, keys: list):
+    cursor = conn.connection.cursor()
+    timings = []
+    for key in keys:
+        start = time.perf_counter()
+        cursor.execute(sql, (key,))
+        cursor.fetchone()
+        timings.append(time.perf_counter() - start)
+    timings.sort()
+    return {
+        "mean_us": statistics.fmean(timings) * 1e6,
+        "p50_us": timings[len(timings) // 2] * 1e6,
+        "p99_us": timings[int(len(timings) * 0.99)] * 1e6,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--rows", type=int, default=10_000_000)
+    parser.add_argument("--lookups", type=int, default=20_000)
+    args = parser.parse_args()
+
+    with engine.connect() as conn:
+        conn = conn.execution_options(isolation_level="AUTOCOMMIT")
+        try:
+            print(f"Loading {args.rows} sessions ...")
+            setup(conn, args.rows)
+            ids = [random.randint(1, args.rows) for _ in range(args.lookups)]
+            raw_keys = [token(i) for i in ids]
+            hash_keys = [hashlib.sha256(key.encode()).digest() for key in raw_keys]
+            results = {
+                "raw VARCHAR": ("bench_sessions_raw_token",
+                                measure(conn, "SELECT id FROM bench_sessions_raw WHERE refresh_token = %s", raw_keys)),
+                "sha256 BYTEA": ("bench_sessions_hash_token",
+                                 measure(conn, "SELECT id FROM bench_sessions_hash WHERE refresh_token_hash = %s",
+                                         hash_keys)),
+            }
+            for name, (index, timings) in results.items():
+                size = conn.execute(text("SELECT pg_size_pretty(pg_relation_size(:index))"), {"index": index}).scalar()
+                print(f"{name:13} index {size:>10}  lookup mean {timings['mean_us']:.1f}us "
+                      f"p50 {timings['p50_us']:.1f}us p99 {timings['p99_us']:.1f}us")
+        finally:
+            conn.execute(text("DROP TABLE IF EXISTS bench_sessions_raw, bench_sessions_hash"))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,155 @@
+"""Measure the cost of turning route results into JSON responses, per endpoint and per serialization path.
+
+Each endpoint returns prebuilt ORM objects (no database) from three in-process apps called directly through
+ASGI, so that only FastAPI and the serialization differ:
+
+- json: what the route returns as plain data (dicts, ORM objects), validated against its response_model (or
+  run through jsonable_encoder without one) and rendered by FastAPI's default response class
+- orjson: the same data rendered by app.utils.responses.ORJSONResponse, the default class of the application
+- model: the response model built by the route and returned in a ModelResponse, as the routes do
+
+Endpoints: GET /user/profile (subscription and --notifications notifications), GET /user/notifications
+(a page of 100), GET /user/notifications/unread-count, POST /user/profile (an ORM profile) and POST /auth/login
+(a Token). No database is needed. --output writes the results as JSON, two runs can be compared with
+benchmarks.compare.
+
+Usage: python -m benchmarks.serialization [--requests 20000] [--notifications 20] [--output serialization.json]
+"""
+import argparse
+import asyncio
+import json
+import time
+from datetime import datetime, timezone
+from fastapi import FastAPI
+from app.models import Notification, Plan, Subscription, User, UserProfile
+from app.schemas.auth import Token
+from app.schemas.user import (NotificationPageResponse, ProfileResponse, UnreadCountResponse,
+                              UserProfileResponse)
+from app.utils.responses import ModelResponse, ORJSONResponse
+
+
+VARIANTS = ("json", "orjson", "model")
+
+
+def fixtures(notifications: int):
+    now = datetime.now(timezone.utc)
+    plan = Plan(id=1, name="pro", description="Pro plan", price="9.99", features={"seats": 5, "api": True},
+                is_active=True)
+    user = User(id=1, email="benchmark@example.com", is_verified=True, created_at=now, updated_at=now)
+    user.profile = UserProfile(id=1, user_id=1, full_name="Bench Mark", country="Nowhere", created_at=now)
+    user.subscription = Subscription(id=1, plan=plan, status="active", start_date=now)
+    # Standalone, a refreshed profile has no relationship loaded
+    created = UserProfile(id=2, user_id=1, full_name="Bench Mark", country="Nowhere", created_at=now)
+    page = [Notification(id=i, user_id=1, message=f"Notification {i}", is_read=i % 2 == 0, is_sent=True,
+                         created_at=now) for i in range(100)]
+    return user, created, page[:notifications], page
+
+
+# Same results as the routes: plain data for the json and orjson variants, response models for model
+def build_app(variant: str, user: User, created: UserProfile, notifications: list, page: list):
+    app = FastAPI() if variant == "json" else FastAPI(default_response_class=ORJSONResponse)
+    as_model = variant == "model"
+
+    @app.get("/user/profile", response_model=UserProfileResponse)
+    async def get_user():
+        profile = user.profile
+        data = {"id": user.id, "email": user.email, "is_verified": user.is_verified, "full_name": profile.full_name,
+                "country": profile.country, "created_at": user.created_at, "updated_at": user.updated_at,
+                "subscription": user.subscription, "notifications": notifications,
+                "notifications_next_cursor": "cursor"}
+        return ModelResponse(UserProfileResponse.model_validate(data, from_attributes=True)) if as_model else data
+
+    @app.get("/user/notifications", response_model=NotificationPageResponse)
+    async def get_notifications():
+        data = {"items": page, "next_cursor": "cursor"}
+        return ModelResponse(NotificationPageResponse.model_validate(data, from_attributes=True)) if as_model else data
+
+    @app.get("/user/notifications/unread-count", response_model=UnreadCountResponse)
+    async def get_unread_count():
+        return ModelResponse(UnreadCountResponse(unread_count=42)) if as_model else {"unread_count": 42}
+
+    if as_model:
+        @app.post("/user/profile", response_model=ProfileResponse)
+        async def create_user_profile():
+            return ModelResponse(ProfileResponse.model_validate(created))
+    else:
+        # Without response model, as the route was declared before
+        @app.post("/user/profile")
+        async def create_user_profile():
+            return created
+
+    @app.post("/auth/login", response_model=Token)
+    async def login():
+        token = Token(access_token="a" * 200, refresh_token="r" * 200, token_type="bearer")
+        return ModelResponse(token) if as_model else token
+
+    return app
+
+
+def scope(method: str, path: str):
+    return {"type": "http", "asgi": {"version": "3.0"}, "http_version": "1.1", "method": method, "scheme": "http",
+            "path": path, "raw_path": path.encode(), "root_path": "", "query_string": b"", "headers": [],
+            "client": ("127.0.0.1", 1234), "server": ("benchmark", 80)}
+
+
+async def receive():
+    return {"type": "http.request", "body": b"", "more_body": False}
+
+
+# Mean microseconds per request, and the body of the last one
+async def timed(app, method: str, path: str, requests: int):
+    body = []
+
+    async def send(message):
+        if message["type"] == "http.response.body":
+            body.append(message["body"])
+
+    start = time.perf_counter()
+    for _ in range(requests):
+        body.clear()
+        await app(scope(method, path), receive, send)
+    return (time.perf_counter() - start) / requests * 1_000_000, b"".join(body)
+
+
+async def run(args):
+    user, created, notifications, page = fixtures(args.notifications)
+    apps = {variant: build_app(variant, user, created, notifications, page) for variant in VARIANTS}
+    results = {}
+    for method, path in (("GET", "/user/profile"), ("GET", "/user/notifications"),
+                         ("GET", "/user/notifications/unread-count"), ("POST", "/user/profile"),
+                         ("POST", "/auth/login")):
+        for app in apps.values():
+            _, body = await timed(app, method, path, 200)
+        # Interleaved rounds so that drift affects every variant alike
+        means = dict.fromkeys(VARIANTS, 0.0)
+        rounds = 10
+        for _ in range(rounds):
+            for variant, app in apps.items():
+                means[variant] += (await timed(app, method, path, args.requests // rounds))[0] / rounds
+        results[f"{method} {path}"] = {f"{variant}_us": mean for variant, mean in means.items()}
+        results[f"{method} {path}"]["bytes"] = len(body)
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--requests", type=int, default=20_000)
+    parser.add_argument("--notifications", type=int, default=20)
+    parser.add_argument("--output", help="Write the results to this JSON file")
+    args = parser.parse_args()
+
+    results = asyncio.run(run(args))
+    print(f"{'endpoint':38} {'bytes':>6} {'json us':>9} {'orjson us':>10} {'model us':>9} {'saved':>7}")
+    for endpoint, result in results.items():
+        saved = 1 - result["model_us"] / result["json_us"]
+        print(f"{endpoint:38} {result['bytes']:6} {result['json_us']:9.1f} {result['orjson_us']:10.1f} "
+              f"{result['model_us']:9.1f} {saved:7.0%}")
+    if args.output:
+        with open(args.output, "w") as output:
+            json.dump({"benchmark": "serialization",
+                       "config": {"requests": args.requests, "notifications": args.notifications},
+                       "results": results}, output, indent=2)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,105 @@
+"""Measure the cold start of the API: importing app.main, then its startup (lifespan) and first request.
+
+Every run is a fresh interpreter, as when a new instance or worker is scaled out. Reports the p50/min/max of
+the import of app.main, of the startup up to the answer of GET /health/live (through TestClient, the plans
+are loaded from the database), and of the whole process. One more run under `-X importtime` breaks the import
+down into the slowest app modules (cumulative, their imports included) and counts the .env files parsed.
+Uses the database configured through the DB_* environment variables, --import-only skips the startup and
+needs none. --output writes the results as JSON, two runs can be compared with benchmarks.compare.
+
+Usage: python -m benchmarks.startup [--runs 10] [--import-only] [--output startup.json]
+"""
+import argparse
+import json
+import re
+import subprocess
+import sys
+import time
+
+
+# Run in each fresh interpreter, prints the import and startup seconds as JSON
+CHILD = """
+import json, sys, time
+import dotenv.main
+env_files = 0
+_init = dotenv.main.DotEnv.__init__
+def counting_init(self, *args, **kwargs):
+    global env_files
+    env_files += 1
+    _init(self, *args, **kwargs)
+dotenv.main.DotEnv.__init__ = counting_init
+start = time.perf_counter()
+import app.main
+imported = time.perf_counter()
+startup = None
+if sys.argv[1] == "startup":
+    from fastapi.testclient import TestClient
+    with TestClient(app.main.app) as client:
+        client.get("/health/live").raise_for_status()
+        startup = time.perf_counter() - imported
+print(json.dumps({"import": imported - start, "startup": startup, "env_files": env_files}))
+"""
+_IMPORT_TIME = re.compile(r"^import time:\s+(\d+) \|\s+(\d+) \|(\s+)(\S+)$", re.MULTILINE)
+
+
+def run_child(mode: str, *options: str):
+    start = time.perf_counter()
+    child = subprocess.run([sys.executable, *options, "-c", CHILD, mode], capture_output=True, text=True)
+    elapsed = time.perf_counter() - start
+    if child.returncode:
+        sys.exit(child.stderr)
+    return json.loads(child.stdout.splitlines()[-1]), elapsed, child.stderr
+
+
+def summary(values: list):
+    values = sorted(values)
+    return {"p50_ms": values[len(values) // 2] * 1000, "min_ms": values[0] * 1000, "max_ms": values[-1] * 1000}
+
+
+# Slowest app modules by cumulative import time, from the -X importtime report
+def slowest_modules(report: str, count: int = 10):
+    modules = [(module, int(cumulative)) for _, cumulative, _, module in _IMPORT_TIME.findall(report)
+               if module.startswith("app.")]
+    return {module: cumulative / 1000 for module, cumulative in sorted(modules, key=lambda m: -m[1])[:count]}
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--runs", type=int, default=10)
+    parser.add_argument("--import-only", action="store_true", help="Skip the startup, no database needed")
+    parser.add_argument("--output", help="Write the results to this JSON file")
+    args = parser.parse_args()
+
+    mode = "import" if args.import_only else "startup"
+    # Warms the OS page cache and the bytecode caches, which a deployed image has as well
+    run_child(mode)
+    imports, startups, processes = [], [], []
+    for _ in range(args.runs):
+        result, elapsed, _ = run_child(mode)
+        imports.append(result["import"])
+        processes.append(elapsed)
+        if result["startup"] is not None:
+            startups.append(result["startup"])
+    result, _, report = run_child("import", "-X", "importtime")
+
+    results = {"import": summary(imports), "process": summary(processes), "env_files_parsed": result["env_files"],
+               "slowest_modules_ms": slowest_modules(report)}
+    if startups:
+        results["startup"] = summary(startups)
+    for name in ("import", "startup", "process"):
+        if name in results:
+            print(f"{name:8} p50 {results[name]['p50_ms']:8.1f} ms  min {results[name]['min_ms']:8.1f} ms  "
+                  f"max {results[name]['max_ms']:8.1f} ms")
+    print(f".env files parsed: {results['env_files_parsed']}")
+    print("Slowest app modules (cumulative import):")
+    for module, milliseconds in results["slowest_modules_ms"].items():
+        print(f"  {module:40} {milliseconds:8.1f} ms")
+
+    if args.output:
+        with open(args.output, "w") as output:
+            json.dump({"benchmark": "startup", "config": {"runs": args.runs, "import_only": args.import_only},
+                       "results": results}, output, indent=2)
+
+
+if __name__ == "__main__":
+    main()
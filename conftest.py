@@ -0,0 +1,75 @@
+"""Fixtures for tests of the application, see app.utils.query_inspector and app.config.settings.
+
+    def test_profile(client, query_budget):
+        with query_budget("GET", "/user/profile"):
+            client.get("/user/profile", headers=headers)
+
+Tests using the database (client and query_budget included) run against the one configured through the usual DB_*
+environment variables, migrated to head, and are skipped when none is reachable.
+
+    def test_unverified_login(client, settings):
+        settings(force_email_verification=True)
+        ...
+"""
+from contextlib import ExitStack, contextmanager
+import pytest
+
+
+# Overrides settings until the end of the test, settings(**values) can be called several times
+@pytest.fixture
+def settings():
+    from app.config.settings import override_settings
+
+    with ExitStack() as stack:
+        yield lambda **values: stack.enter_context(override_settings(**values))
+
+
+# The application's database module, the tests using it are skipped when no database is configured or reachable
+@pytest.fixture(scope="session")
+def database():
+    try:
+        from app.config import database
+
+        with database.engine.connect():
+            pass
+    except Exception as e:
+        pytest.skip(f"No database available: {e}")
+    return database
+
+
+# Test client of the application, started (lifespan included) for the duration of the test
+@pytest.fixture
+def client(database):
+    from fastapi.testclient import TestClient
+    import app.main
+
+    with TestClient(app.main.app) as client:
+        yield client
+
+
+# Fails the test when the requests of the block run more statements than the route's declared budget
+# (@query_budget), or than max_queries, and with exact=True when they run fewer too, so that a budget left loose
+# after an optimization gets tightened. The failure lists the statements with suspected N+1s. Every statement
+# of the process is counted: the started client's plans are reloaded once its LISTEN connection is open, which
+# is awaited before counting so that reload never lands in the block.
+@pytest.fixture
+def query_budget(client):
+    from app.utils.plan_catalog import plan_catalog
+    from app.utils.query_inspector import capture_queries, declared_query_budget
+    import app.main
+
+    client.portal.call(plan_catalog.wait_listening)
+
+    @contextmanager
+    def check(method: str = None, path: str = None, max_queries: int = None, exact: bool = False):
+        if max_queries is None:
+            max_queries = declared_query_budget(app.main.app, method, path)
+            if max_queries is None:
+                pytest.fail(f"{method} {path} declares no query budget")
+        with capture_queries() as log:
+            yield log
+        if log.count > max_queries:
+            pytest.fail(f"Query budget of {max_queries} exceeded, {log.report()}", pytrace=False)
+        if exact and log.count < max_queries:
+            pytest.fail(f"Query budget of {max_queries} not reached, lower it: {log.report()}", pytrace=False)
+    return check
@@ -0,0 +1,44 @@
+# Gunicorn configuration of the production server, loaded from the working directory by `gunicorn app.main:app`.
+# Settings come from the SERVER_* environment variables, see app/config/settings.py.
+from app.config.settings import get_settings, reload_settings
+from app.server import worker_count
+from app.utils import metrics
+import os
+import tempfile
+
+
+workers = worker_count()
+# Settings sized after the server workers (hashing pools, the rate limit warning) count the ones started here.
+# Loaded again before the application is imported, and inherited by the workers.
+os.environ["WEB_CONCURRENCY"] = str(workers)
+# GET /metrics is served by any worker, each one shares its metrics through this directory (see app.utils.metrics)
+os.environ.setdefault("METRICS_DIR", get_settings().metrics_dir or tempfile.mkdtemp(prefix="metrics-"))
+reload_settings()
+bind = get_settings().server_bind
+worker_class = "app.server.Worker"
+# The application is imported once in the master and forked, its modules are then shared copy-on-write
+preload_app = True
+max_requests = get_settings().server_max_requests
+max_requests_jitter = get_settings().server_max_requests_jitter
+graceful_timeout = get_settings().server_graceful_timeout
+timeout = get_settings().server_timeout
+keepalive = get_settings().server_keepalive
+accesslog = "-"
+
+
+# Connections are never opened in the master, but pools must not be shared across processes should one be:
+# each worker starts with empty pools, leaving whatever the master holds to the master
+def post_fork(server, worker):
+    from app.config import database
+    database.engine.dispose(close=False)
+    database.async_engine.sync_engine.dispose(close=False)
+
+
+# Metrics left by a previous run would be summed with those of this one
+def on_starting(server):
+    metrics.clear_snapshots(get_settings().metrics_dir)
+
+
+# The counters of a worker that exited are kept, its gauges dropped
+def child_exit(server, worker):
+    metrics.mark_process_dead(get_settings().metrics_dir, worker.pid)
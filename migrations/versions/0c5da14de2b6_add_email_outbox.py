@@ -0,0 +1,51 @@
+"""add_email_outbox
+
+Revision ID: 0c5da14de2b6
+Revises: f1a7c3d9b204
+Create Date: 2026-10-18 16:24:36.731863
+
+Transactional email outbox drained by app.tasks.email_dispatcher. Undeliverable emails are
+recorded as dead letters in jobs / failed_jobs, which gain a queue name and a payload.
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = '0c5da14de2b6'
+down_revision: Union[str, Sequence[str], None] = 'f1a7c3d9b204'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    op.create_table('email_outbox',
+    sa.Column('id', sa.INTEGER(), nullable=False),
+    sa.Column('recipient', sa.VARCHAR(length=255), nullable=False),
+    sa.Column('subject', sa.VARCHAR(length=255), nullable=False),
+    sa.Column('body', sa.TEXT(), nullable=False),
+    sa.Column('status', sa.Enum('pending', 'sent', 'failed', name='email_outbox_status_enum'), server_default='pending', nullable=False),
+    sa.Column('attempts', sa.INTEGER(), server_default='0', nullable=False),
+    sa.Column('next_attempt_at', sa.TIMESTAMP(timezone=True), server_default=sa.text('now()'), nullable=False),
+    sa.Column('last_error', sa.TEXT(), nullable=True),
+    sa.Column('created_at', sa.TIMESTAMP(timezone=True), server_default=sa.text('now()'), nullable=False),
+    sa.Column('sent_at', sa.TIMESTAMP(timezone=True), nullable=True),
+    sa.PrimaryKeyConstraint('id')
+    )
+    op.create_index('ix_email_outbox_pending_next_attempt_at', 'email_outbox', ['next_attempt_at'], unique=False,
+                    postgresql_where=sa.text("status = 'pending'"))
+    op.add_column('jobs', sa.Column('queue', sa.VARCHAR(length=50), server_default='default', nullable=False))
+    op.add_column('jobs', sa.Column('payload', sa.JSON(), nullable=True))
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.drop_column('jobs', 'payload')
+    op.drop_column('jobs', 'queue')
+    op.drop_index('ix_email_outbox_pending_next_attempt_at', table_name='email_outbox')
+    op.drop_table('email_outbox')
+    sa.Enum(name='email_outbox_status_enum').drop(op.get_bind(), checkfirst=True)
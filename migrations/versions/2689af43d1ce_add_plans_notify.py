@@ -0,0 +1,44 @@
+"""add_plans_notify
+
+Revision ID: 2689af43d1ce
+Revises: abf6bff4ce29
+Create Date: 2026-10-18 16:48:21.353821
+
+Notifies the plans channel on every change of the plans table, every API process reloads its
+plans catalog (GET /plans) on it.
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+
+
+# revision identifiers, used by Alembic.
+revision: str = '2689af43d1ce'
+down_revision: Union[str, Sequence[str], None] = 'abf6bff4ce29'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    op.execute("""
+        CREATE FUNCTION plans_notify() RETURNS trigger AS $$
+        BEGIN
+            PERFORM pg_notify('plans', '');
+            RETURN NULL;
+        END;
+        $$ LANGUAGE plpgsql
+    """)
+    op.execute("""
+        CREATE TRIGGER plans_notify
+        AFTER INSERT OR UPDATE OR DELETE OR TRUNCATE ON plans
+        FOR EACH STATEMENT
+        EXECUTE FUNCTION plans_notify()
+    """)
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.execute("DROP TRIGGER plans_notify ON plans")
+    op.execute("DROP FUNCTION plans_notify()")
@@ -0,0 +1,111 @@
+"""add_notification_pagination
+
+Revision ID: 2bf4cc5e2cc4
+Revises: 2d9e6f1b7c43
+Create Date: 2026-10-18 16:36:20.176876
+
+Keyset pagination indexes on notifications, and a per user unread counter maintained by
+statement level triggers so the unread count never scans the notifications.
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = '2bf4cc5e2cc4'
+down_revision: Union[str, Sequence[str], None] = '2d9e6f1b7c43'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    op.create_table('notification_counters',
+    sa.Column('user_id', sa.INTEGER(), nullable=False),
+    sa.Column('unread_count', sa.INTEGER(), server_default='0', nullable=False),
+    sa.ForeignKeyConstraint(['user_id'], ['users.id'], ondelete='CASCADE'),
+    sa.PrimaryKeyConstraint('user_id')
+    )
+
+    # One upsert per statement and user rather than per row, so marking thousands of notifications as read
+    # touches each counter once. Transition tables are only available to statement level triggers.
+    op.execute("""
+        CREATE FUNCTION notification_counters_update() RETURNS trigger AS $$
+        BEGIN
+            IF TG_OP = 'INSERT' THEN
+                INSERT INTO notification_counters (user_id, unread_count)
+                SELECT user_id, count(*) FROM new_rows WHERE NOT is_read GROUP BY user_id
+                ON CONFLICT (user_id) DO UPDATE
+                SET unread_count = notification_counters.unread_count + EXCLUDED.unread_count;
+            ELSIF TG_OP = 'UPDATE' THEN
+                INSERT INTO notification_counters (user_id, unread_count)
+                SELECT user_id, delta FROM (
+                    SELECT user_id, sum(delta)::int AS delta
+                    FROM (SELECT user_id, 1 AS delta FROM new_rows WHERE NOT is_read
+                          UNION ALL
+                          SELECT user_id, -1 FROM old_rows WHERE NOT is_read) AS changes
+                    GROUP BY user_id
+                ) AS deltas
+                WHERE delta <> 0
+                ON CONFLICT (user_id) DO UPDATE
+                SET unread_count = notification_counters.unread_count + EXCLUDED.unread_count;
+            ELSE
+                UPDATE notification_counters SET unread_count = notification_counters.unread_count - deltas.unread
+                FROM (SELECT user_id, count(*)::int AS unread FROM old_rows WHERE NOT is_read GROUP BY user_id) AS deltas
+                WHERE notification_counters.user_id = deltas.user_id;
+            END IF;
+            RETURN NULL;
+        END;
+        $$ LANGUAGE plpgsql
+    """)
+    op.execute("""
+        CREATE TRIGGER notification_counters_insert
+        AFTER INSERT ON notifications
+        REFERENCING NEW TABLE AS new_rows
+        FOR EACH STATEMENT
+        EXECUTE FUNCTION notification_counters_update()
+    """)
+    op.execute("""
+        CREATE TRIGGER notification_counters_update
+        AFTER UPDATE ON notifications
+        REFERENCING OLD TABLE AS old_rows NEW TABLE AS new_rows
+        FOR EACH STATEMENT
+        EXECUTE FUNCTION notification_counters_update()
+    """)
+    op.execute("""
+        CREATE TRIGGER notification_counters_delete
+        AFTER DELETE ON notifications
+        REFERENCING OLD TABLE AS old_rows
+        FOR EACH STATEMENT
+        EXECUTE FUNCTION notification_counters_update()
+    """)
+    op.execute("""
+        INSERT INTO notification_counters (user_id, unread_count)
+        SELECT user_id, count(*) FROM notifications WHERE NOT is_read GROUP BY user_id
+    """)
+
+    with op.get_context().autocommit_block():
+        op.create_index('ix_notifications_user_id_created_at', 'notifications', ['user_id', 'created_at', 'id'],
+                        unique=False, postgresql_concurrently=True)
+        op.create_index('ix_notifications_user_id_is_read_created_at', 'notifications',
+                        ['user_id', 'is_read', 'created_at', 'id'], unique=False, postgresql_concurrently=True)
+        # Covered by the leading column of the new indexes
+        op.drop_index(op.f('ix_notifications_user_id'), table_name='notifications', postgresql_concurrently=True)
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    with op.get_context().autocommit_block():
+        op.create_index(op.f('ix_notifications_user_id'), 'notifications', ['user_id'], unique=False,
+                        postgresql_concurrently=True)
+        op.drop_index('ix_notifications_user_id_is_read_created_at', table_name='notifications',
+                      postgresql_concurrently=True)
+        op.drop_index('ix_notifications_user_id_created_at', table_name='notifications', postgresql_concurrently=True)
+    op.execute("DROP TRIGGER notification_counters_delete ON notifications")
+    op.execute("DROP TRIGGER notification_counters_update ON notifications")
+    op.execute("DROP TRIGGER notification_counters_insert ON notifications")
+    op.execute("DROP FUNCTION notification_counters_update()")
+    op.drop_table('notification_counters')
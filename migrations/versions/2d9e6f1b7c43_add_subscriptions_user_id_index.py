@@ -0,0 +1,32 @@
+"""add_subscriptions_user_id_index
+
+Revision ID: 2d9e6f1b7c43
+Revises: 6577b037e5cd
+Create Date: 2026-10-18 20:05:52.640381
+
+Index behind the subscription join of the eager loaded /user/profile query.
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+
+
+# revision identifiers, used by Alembic.
+revision: str = '2d9e6f1b7c43'
+down_revision: Union[str, Sequence[str], None] = '6577b037e5cd'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    with op.get_context().autocommit_block():
+        op.create_index(op.f('ix_subscriptions_user_id'), 'subscriptions', ['user_id'], unique=False,
+                        postgresql_concurrently=True)
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    with op.get_context().autocommit_block():
+        op.drop_index(op.f('ix_subscriptions_user_id'), table_name='subscriptions', postgresql_concurrently=True)
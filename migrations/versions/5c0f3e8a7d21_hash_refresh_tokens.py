@@ -0,0 +1,88 @@
+"""hash_refresh_tokens
+
+Revision ID: 5c0f3e8a7d21
+Revises: b7e2d4a91c3f
+Create Date: 2026-10-18 17:05:41.671203
+
+Expand step of storing refresh tokens as SHA-256 digests. Adds user_sessions.refresh_token_hash,
+keeps it in sync with refresh_token through a trigger for instances still running the previous
+release, backfills existing sessions in small batches and indexes the digests concurrently.
+The raw column is dropped by the following revision once no instance writes it anymore.
+
+The index is not unique yet: the previous release issues identical tokens for two logins of the same
+user within one second, a unique index would fail the second login. The following revision removes
+those duplicates and makes the index unique.
+
+Both revisions are in one linear chain, so `alembic upgrade head` must not be run in one go on a live
+deployment (instances of the previous release would fail on the dropped column). Roll out in two phases:
+
+    alembic upgrade 5c0f3e8a7d21    # expand, the previous release keeps working
+    (deploy the release reading refresh_token_hash on every instance)
+    alembic upgrade head            # contract
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = '5c0f3e8a7d21'
+down_revision: Union[str, Sequence[str], None] = 'b7e2d4a91c3f'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+BACKFILL_BATCH_SIZE = 10000
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    op.add_column('user_sessions', sa.Column('refresh_token_hash', sa.LargeBinary(length=32), nullable=True))
+    op.execute("""
+        CREATE FUNCTION user_sessions_sync_refresh_token_hash() RETURNS trigger AS $$
+        BEGIN
+            -- Sessions written by the new release only set refresh_token_hash and are left untouched
+            IF NEW.refresh_token IS NOT NULL THEN
+                NEW.refresh_token_hash := sha256(convert_to(NEW.refresh_token, 'UTF8'));
+            ELSIF TG_OP = 'UPDATE' AND OLD.refresh_token IS NOT NULL THEN
+                NEW.refresh_token_hash := NULL;
+            END IF;
+            RETURN NEW;
+        END;
+        $$ LANGUAGE plpgsql
+    """)
+    op.execute("""
+        CREATE TRIGGER user_sessions_sync_refresh_token_hash
+        BEFORE INSERT OR UPDATE OF refresh_token ON user_sessions
+        FOR EACH ROW
+        EXECUTE FUNCTION user_sessions_sync_refresh_token_hash()
+    """)
+
+    # Each batch commits on its own so that row locks are held only briefly
+    with op.get_context().autocommit_block():
+        connection = op.get_bind()
+        while True:
+            result = connection.execute(sa.text("""
+                UPDATE user_sessions SET refresh_token_hash = sha256(convert_to(refresh_token, 'UTF8'))
+                WHERE id IN (
+                    SELECT id FROM user_sessions
+                    WHERE refresh_token IS NOT NULL AND refresh_token_hash IS NULL
+                    LIMIT :batch_size
+                    FOR UPDATE SKIP LOCKED
+                )
+            """), {"batch_size": BACKFILL_BATCH_SIZE})
+            if result.rowcount == 0:
+                break
+
+        op.create_index('ix_user_sessions_refresh_token_hash', 'user_sessions', ['refresh_token_hash'], unique=False,
+                        postgresql_where=sa.text('refresh_token_hash IS NOT NULL'), postgresql_concurrently=True)
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    with op.get_context().autocommit_block():
+        op.drop_index('ix_user_sessions_refresh_token_hash', table_name='user_sessions', postgresql_concurrently=True)
+    op.execute("DROP TRIGGER user_sessions_sync_refresh_token_hash ON user_sessions")
+    op.execute("DROP FUNCTION user_sessions_sync_refresh_token_hash()")
+    op.drop_column('user_sessions', 'refresh_token_hash')
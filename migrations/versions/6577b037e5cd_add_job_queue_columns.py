@@ -0,0 +1,79 @@
+"""add_job_queue_columns
+
+Revision ID: 6577b037e5cd
+Revises: 0c5da14de2b6
+Create Date: 2026-10-18 19:12:40.118532
+
+Turns jobs into a queue consumed by app.tasks.queue workers: job type, state, scheduling and
+claim columns, the claim / coalescing indexes, and a trigger waking idle workers up through NOTIFY.
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = '6577b037e5cd'
+down_revision: Union[str, Sequence[str], None] = '0c5da14de2b6'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+job_status_enum = sa.Enum('queued', 'running', 'failed', name='job_status_enum')
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    job_status_enum.create(op.get_bind(), checkfirst=True)
+    op.add_column('jobs', sa.Column('type', sa.VARCHAR(length=100), nullable=True))
+    op.add_column('jobs', sa.Column('status', job_status_enum, server_default='queued', nullable=False))
+    op.add_column('jobs', sa.Column('unique_key', sa.VARCHAR(length=255), nullable=True))
+    op.add_column('jobs', sa.Column('attempts', sa.INTEGER(), server_default='0', nullable=False))
+    op.add_column('jobs', sa.Column('run_at', sa.TIMESTAMP(timezone=True), server_default=sa.text('now()'),
+                                    nullable=False))
+    op.add_column('jobs', sa.Column('locked_by', sa.VARCHAR(length=100), nullable=True))
+    op.add_column('jobs', sa.Column('updated_at', sa.TIMESTAMP(timezone=True), nullable=True))
+    # Nothing consumed jobs so far, the existing rows are the email outbox dead letters
+    op.execute("""
+        UPDATE jobs SET type = CASE WHEN queue = 'email' THEN 'email.send' ELSE 'legacy' END,
+                        status = 'failed', attempts = retries
+    """)
+    op.alter_column('jobs', 'type', nullable=False)
+    op.create_index('ix_jobs_claim', 'jobs', ['queue', sa.literal_column('priority DESC'), 'run_at'], unique=False,
+                    postgresql_where=sa.text("status IN ('queued', 'running')"))
+    op.create_index('ix_jobs_unique_key', 'jobs', ['unique_key'], unique=True,
+                    postgresql_where=sa.text("status = 'queued' AND retries = 0"))
+
+    # Notifications are delivered on commit and identical ones are merged, so a bulk enqueue wakes the workers once
+    op.execute("""
+        CREATE FUNCTION jobs_notify() RETURNS trigger AS $$
+        BEGIN
+            PERFORM pg_notify('jobs', NEW.queue);
+            RETURN NULL;
+        END;
+        $$ LANGUAGE plpgsql
+    """)
+    op.execute("""
+        CREATE TRIGGER jobs_notify
+        AFTER INSERT ON jobs
+        FOR EACH ROW
+        WHEN (NEW.status = 'queued')
+        EXECUTE FUNCTION jobs_notify()
+    """)
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.execute("DROP TRIGGER jobs_notify ON jobs")
+    op.execute("DROP FUNCTION jobs_notify()")
+    op.drop_index('ix_jobs_unique_key', table_name='jobs')
+    op.drop_index('ix_jobs_claim', table_name='jobs')
+    op.drop_column('jobs', 'updated_at')
+    op.drop_column('jobs', 'locked_by')
+    op.drop_column('jobs', 'run_at')
+    op.drop_column('jobs', 'attempts')
+    op.drop_column('jobs', 'unique_key')
+    op.drop_column('jobs', 'status')
+    op.drop_column('jobs', 'type')
+    job_status_enum.drop(op.get_bind(), checkfirst=True)
@@ -0,0 +1,78 @@
+"""drop_raw_refresh_tokens
+
+Revision ID: 9a4d6b2e8f17
+Revises: 5c0f3e8a7d21
+Create Date: 2026-10-18 17:06:03.918442
+
+Contract step of storing refresh tokens as SHA-256 digests. Run once every instance looks sessions
+up by refresh_token_hash, i.e. `alembic upgrade 5c0f3e8a7d21` first, deploy, and only then
+`alembic upgrade head` (see 5c0f3e8a7d21). Sessions sharing a token issued by the previous release
+are deduplicated and the digest index is rebuilt unique. Raw tokens cannot be recovered from their
+digest, so downgrading leaves refresh_token empty and users have to log in again.
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = '9a4d6b2e8f17'
+down_revision: Union[str, Sequence[str], None] = '5c0f3e8a7d21'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    op.execute("DROP TRIGGER user_sessions_sync_refresh_token_hash ON user_sessions")
+    op.execute("DROP FUNCTION user_sessions_sync_refresh_token_hash()")
+    with op.get_context().autocommit_block():
+        # Tokens issued within the same second used to be identical, only the newest session keeps such a token
+        op.execute("""
+            UPDATE user_sessions SET refresh_token = NULL, refresh_token_hash = NULL, refresh_token_expiry = NULL
+            WHERE refresh_token_hash IS NOT NULL AND EXISTS (
+                SELECT 1 FROM user_sessions newer
+                WHERE newer.refresh_token_hash = user_sessions.refresh_token_hash AND newer.id > user_sessions.id
+            )
+        """)
+        op.create_index('ix_user_sessions_refresh_token_hash_unique', 'user_sessions', ['refresh_token_hash'],
+                        unique=True, postgresql_where=sa.text('refresh_token_hash IS NOT NULL'),
+                        postgresql_concurrently=True)
+        op.drop_index('ix_user_sessions_refresh_token_hash', table_name='user_sessions', postgresql_concurrently=True)
+        op.execute("ALTER INDEX ix_user_sessions_refresh_token_hash_unique RENAME TO ix_user_sessions_refresh_token_hash")
+        op.drop_index('ix_user_sessions_refresh_token', table_name='user_sessions', postgresql_concurrently=True)
+    op.drop_column('user_sessions', 'refresh_token')
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.add_column('user_sessions', sa.Column('refresh_token', sa.VARCHAR(length=255), nullable=True))
+    op.execute("""
+        CREATE FUNCTION user_sessions_sync_refresh_token_hash() RETURNS trigger AS $$
+        BEGIN
+            -- Sessions written by the new release only set refresh_token_hash and are left untouched
+            IF NEW.refresh_token IS NOT NULL THEN
+                NEW.refresh_token_hash := sha256(convert_to(NEW.refresh_token, 'UTF8'));
+            ELSIF TG_OP = 'UPDATE' AND OLD.refresh_token IS NOT NULL THEN
+                NEW.refresh_token_hash := NULL;
+            END IF;
+            RETURN NEW;
+        END;
+        $$ LANGUAGE plpgsql
+    """)
+    op.execute("""
+        CREATE TRIGGER user_sessions_sync_refresh_token_hash
+        BEFORE INSERT OR UPDATE OF refresh_token ON user_sessions
+        FOR EACH ROW
+        EXECUTE FUNCTION user_sessions_sync_refresh_token_hash()
+    """)
+    with op.get_context().autocommit_block():
+        op.create_index('ix_user_sessions_refresh_token', 'user_sessions', ['refresh_token'], unique=False,
+                        postgresql_where=sa.text('refresh_token IS NOT NULL'), postgresql_concurrently=True)
+        op.create_index('ix_user_sessions_refresh_token_hash_expand', 'user_sessions', ['refresh_token_hash'],
+                        unique=False, postgresql_where=sa.text('refresh_token_hash IS NOT NULL'),
+                        postgresql_concurrently=True)
+        op.drop_index('ix_user_sessions_refresh_token_hash', table_name='user_sessions', postgresql_concurrently=True)
+        op.execute("ALTER INDEX ix_user_sessions_refresh_token_hash_expand RENAME TO ix_user_sessions_refresh_token_hash")
@@ -0,0 +1,35 @@
+"""add_used_verification_token_index
+
+Revision ID: a6c2e8d4f157
+Revises: d8f3a1c6b592
+Create Date: 2026-10-19 10:03:51.287164
+
+Used verification tokens now keep their token, /auth/verify looks them up to answer a link opened again
+as already verified. The existing index only covers unused tokens, this one covers the used ones.
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'a6c2e8d4f157'
+down_revision: Union[str, Sequence[str], None] = 'd8f3a1c6b592'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    with op.get_context().autocommit_block():
+        op.create_index('ix_user_verification_tokens_used_token', 'user_verification_tokens', ['token'], unique=False,
+                        postgresql_where=sa.text('is_used = true'), postgresql_concurrently=True)
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    with op.get_context().autocommit_block():
+        op.drop_index('ix_user_verification_tokens_used_token', table_name='user_verification_tokens',
+                      postgresql_concurrently=True)
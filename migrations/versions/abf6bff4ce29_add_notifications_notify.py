@@ -0,0 +1,59 @@
+"""add_notifications_notify
+
+Revision ID: abf6bff4ce29
+Revises: 2bf4cc5e2cc4
+Create Date: 2026-10-18 16:42:57.342524
+
+Publishes new notifications on the notifications channel, consumed by the shared LISTEN connection
+behind GET /user/notifications/stream.
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'abf6bff4ce29'
+down_revision: Union[str, Sequence[str], None] = '2bf4cc5e2cc4'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+# Rows per user embedded in a NOTIFY payload. A notification serializes to at most ~1.2kB (message is
+# VARCHAR(255)), so the payload stays below the 8000 bytes limit; larger inserts only send the user id.
+MAX_NOTIFIED_ROWS = 5
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    # One NOTIFY per statement and user carrying the rows themselves, so the fan out needs no query.
+    # Notifications are delivered on commit and dropped when nobody listens.
+    op.execute(f"""
+        CREATE FUNCTION notifications_notify() RETURNS trigger AS $$
+        BEGIN
+            PERFORM pg_notify('notifications', json_build_object(
+                'user_id', user_id,
+                'notifications', CASE WHEN count(*) <= {MAX_NOTIFIED_ROWS} THEN json_agg(json_build_object(
+                    'id', id, 'message', message, 'is_read', is_read, 'is_sent', is_sent, 'created_at', created_at
+                ) ORDER BY id) END
+            )::text)
+            FROM new_rows
+            GROUP BY user_id;
+            RETURN NULL;
+        END;
+        $$ LANGUAGE plpgsql
+    """)
+    op.execute("""
+        CREATE TRIGGER notifications_notify
+        AFTER INSERT ON notifications
+        REFERENCING NEW TABLE AS new_rows
+        FOR EACH STATEMENT
+        EXECUTE FUNCTION notifications_notify()
+    """)
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.execute("DROP TRIGGER notifications_notify ON notifications")
+    op.execute("DROP FUNCTION notifications_notify()")
@@ -0,0 +1,43 @@
+"""add_hot_lookup_indexes
+
+Revision ID: b7e2d4a91c3f
+Revises: 3aa680125605
+Create Date: 2026-10-18 16:40:12.104528
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'b7e2d4a91c3f'
+down_revision: Union[str, Sequence[str], None] = '3aa680125605'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    # Indexes are built CONCURRENTLY so that existing tables stay writable,
+    # which cannot happen inside the migration transaction.
+    with op.get_context().autocommit_block():
+        op.create_index('ix_user_sessions_refresh_token', 'user_sessions', ['refresh_token'], unique=False,
+                        postgresql_where=sa.text('refresh_token IS NOT NULL'), postgresql_concurrently=True)
+        op.create_index(op.f('ix_user_sessions_user_id'), 'user_sessions', ['user_id'], unique=False,
+                        postgresql_concurrently=True)
+        op.create_index('ix_user_verification_tokens_token', 'user_verification_tokens', ['token'], unique=False,
+                        postgresql_where=sa.text('is_used = false'), postgresql_concurrently=True)
+        op.create_index(op.f('ix_notifications_user_id'), 'notifications', ['user_id'], unique=False,
+                        postgresql_concurrently=True)
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    with op.get_context().autocommit_block():
+        op.drop_index(op.f('ix_notifications_user_id'), table_name='notifications', postgresql_concurrently=True)
+        op.drop_index('ix_user_verification_tokens_token', table_name='user_verification_tokens',
+                      postgresql_concurrently=True)
+        op.drop_index(op.f('ix_user_sessions_user_id'), table_name='user_sessions', postgresql_concurrently=True)
+        op.drop_index('ix_user_sessions_refresh_token', table_name='user_sessions', postgresql_concurrently=True)
@@ -0,0 +1,41 @@
+"""add_session_rotation_columns
+
+Revision ID: c4e9a2f7b318
+Revises: f311e361e253
+Create Date: 2026-10-18 21:14:52.318406
+
+Columns behind atomic refresh token rotation: the digest a rotated session was consumed with, to detect the
+reuse of a rotated token, and the family (the login session) a session descends from, revoked as a whole on
+reuse. Both are nullable without default, adding them does not rewrite the table. Existing sessions need no
+backfill, a session without family_id is the root of its own family.
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'c4e9a2f7b318'
+down_revision: Union[str, Sequence[str], None] = 'f311e361e253'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    op.add_column('user_sessions', sa.Column('rotated_token_hash', sa.LargeBinary(length=32), nullable=True))
+    op.add_column('user_sessions', sa.Column('family_id', sa.INTEGER(), nullable=True))
+
+    with op.get_context().autocommit_block():
+        op.create_index('ix_user_sessions_rotated_token_hash', 'user_sessions', ['rotated_token_hash'], unique=True,
+                        postgresql_where=sa.text('rotated_token_hash IS NOT NULL'), postgresql_concurrently=True)
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    with op.get_context().autocommit_block():
+        op.drop_index('ix_user_sessions_rotated_token_hash', table_name='user_sessions', postgresql_concurrently=True)
+    op.drop_column('user_sessions', 'family_id')
+    op.drop_column('user_sessions', 'rotated_token_hash')
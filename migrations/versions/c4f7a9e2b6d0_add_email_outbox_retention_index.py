@@ -0,0 +1,34 @@
+"""add_email_outbox_retention_index
+
+Revision ID: c4f7a9e2b6d0
+Revises: e5b9d2f4a813
+Create Date: 2026-10-20 09:14:52.306118
+
+Index used by the reaper to purge sent and dead lettered emails past EMAIL_OUTBOX_RETENTION_HOURS.
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'c4f7a9e2b6d0'
+down_revision: Union[str, Sequence[str], None] = 'e5b9d2f4a813'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    with op.get_context().autocommit_block():
+        op.create_index('ix_email_outbox_finished_next_attempt_at', 'email_outbox', ['next_attempt_at'],
+                        unique=False, postgresql_where=sa.text("status <> 'pending'"), postgresql_concurrently=True)
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    with op.get_context().autocommit_block():
+        op.drop_index('ix_email_outbox_finished_next_attempt_at', table_name='email_outbox',
+                      postgresql_concurrently=True)
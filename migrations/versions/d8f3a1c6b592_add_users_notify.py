@@ -0,0 +1,64 @@
+"""add_users_notify
+
+Revision ID: d8f3a1c6b592
+Revises: c4e9a2f7b318
+Create Date: 2026-10-19 09:12:37.604518
+
+Notifies the users channel with the id of every deleted user, and of every updated user whose cached
+authentication state changed (email, password, role, verification or token version), every API process
+drops that user from its in-process user cache on it. Updates of last_login_at alone, on every login,
+notify nothing.
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'd8f3a1c6b592'
+down_revision: Union[str, Sequence[str], None] = 'c4e9a2f7b318'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    # Statement level like subscriptions_notify, one trigger per event for their transition tables
+    op.execute("""
+        CREATE FUNCTION users_notify() RETURNS trigger AS $$
+        BEGIN
+            IF TG_OP = 'UPDATE' THEN
+                PERFORM pg_notify('users', new_rows.id::text)
+                FROM new_rows JOIN old_rows ON old_rows.id = new_rows.id
+                WHERE (new_rows.email, new_rows.password, new_rows.role, new_rows.is_verified, new_rows.token_version)
+                    IS DISTINCT FROM
+                    (old_rows.email, old_rows.password, old_rows.role, old_rows.is_verified, old_rows.token_version);
+            ELSE
+                PERFORM pg_notify('users', id::text) FROM old_rows;
+            END IF;
+            RETURN NULL;
+        END;
+        $$ LANGUAGE plpgsql
+    """)
+    op.execute("""
+        CREATE TRIGGER users_notify_update
+        AFTER UPDATE ON users
+        REFERENCING OLD TABLE AS old_rows NEW TABLE AS new_rows
+        FOR EACH STATEMENT
+        EXECUTE FUNCTION users_notify()
+    """)
+    op.execute("""
+        CREATE TRIGGER users_notify_delete
+        AFTER DELETE ON users
+        REFERENCING OLD TABLE AS old_rows
+        FOR EACH STATEMENT
+        EXECUTE FUNCTION users_notify()
+    """)
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.execute("DROP TRIGGER users_notify_delete ON users")
+    op.execute("DROP TRIGGER users_notify_update ON users")
+    op.execute("DROP FUNCTION users_notify()")
@@ -0,0 +1,59 @@
+"""add_retention_indexes
+
+Revision ID: e3b8c1f04a56
+Revises: 9a4d6b2e8f17
+Create Date: 2026-10-18 17:31:27.550913
+
+Indexes used by the session / verification token reaper. Also fixes the created_at defaults,
+which were created as the literal 'now()' and therefore frozen at table creation time.
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'e3b8c1f04a56'
+down_revision: Union[str, Sequence[str], None] = '9a4d6b2e8f17'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+TIMESTAMP_COLUMNS = [
+    ('users', 'created_at'),
+    ('user_sessions', 'created_at'),
+    ('user_profiles', 'created_at'),
+    ('user_verification_tokens', 'created_at'),
+    ('subscriptions', 'created_at'),
+    ('payments', 'created_at'),
+    ('notifications', 'created_at'),
+    ('jobs', 'created_at'),
+    ('failed_jobs', 'failed_at'),
+]
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    for table, column in TIMESTAMP_COLUMNS:
+        op.alter_column(table, column, server_default=sa.text('now()'))
+
+    with op.get_context().autocommit_block():
+        op.create_index('ix_user_sessions_refresh_token_expiry', 'user_sessions', ['refresh_token_expiry'],
+                        unique=False, postgresql_concurrently=True)
+        op.create_index('ix_user_sessions_invalidated_created_at', 'user_sessions', ['created_at'], unique=False,
+                        postgresql_where=sa.text('refresh_token_hash IS NULL'), postgresql_concurrently=True)
+        op.create_index('ix_user_verification_tokens_token_expiry', 'user_verification_tokens', ['token_expiry'],
+                        unique=False, postgresql_concurrently=True)
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    with op.get_context().autocommit_block():
+        op.drop_index('ix_user_verification_tokens_token_expiry', table_name='user_verification_tokens',
+                      postgresql_concurrently=True)
+        op.drop_index('ix_user_sessions_invalidated_created_at', table_name='user_sessions',
+                      postgresql_concurrently=True)
+        op.drop_index('ix_user_sessions_refresh_token_expiry', table_name='user_sessions',
+                      postgresql_concurrently=True)
+    # The previous defaults were constants evaluated when the tables were created, there is nothing to restore
@@ -0,0 +1,32 @@
+"""add_session_rotated_at
+
+Revision ID: e5b9d2f4a813
+Revises: a6c2e8d4f157
+Create Date: 2026-10-19 11:26:08.731942
+
+When a session was rotated: the reuse of its token within REFRESH_TOKEN_REUSE_GRACE_SECONDS is refused
+without revoking the family (concurrent refreshes of one client). Nullable without default, adding it does
+not rewrite the table; sessions rotated before have none and are treated as past the grace.
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'e5b9d2f4a813'
+down_revision: Union[str, Sequence[str], None] = 'a6c2e8d4f157'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    op.add_column('user_sessions', sa.Column('rotated_at', sa.TIMESTAMP(timezone=True), nullable=True))
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.drop_column('user_sessions', 'rotated_at')
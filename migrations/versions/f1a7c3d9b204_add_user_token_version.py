@@ -0,0 +1,31 @@
+"""add_user_token_version
+
+Revision ID: f1a7c3d9b204
+Revises: e3b8c1f04a56
+Create Date: 2026-10-18 18:02:11.204117
+
+Per-user counter embedded in access and refresh tokens, bumped on logout to revoke them all at once.
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'f1a7c3d9b204'
+down_revision: Union[str, Sequence[str], None] = 'e3b8c1f04a56'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    # A constant server default is a metadata-only change, the table is not rewritten
+    op.add_column('users', sa.Column('token_version', sa.INTEGER(), server_default='0', nullable=False))
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.drop_column('users', 'token_version')
@@ -0,0 +1,71 @@
+"""add_subscriptions_notify
+
+Revision ID: f311e361e253
+Revises: 2689af43d1ce
+Create Date: 2026-10-18 16:50:20.845966
+
+Notifies the subscriptions channel with the user id of every inserted, updated or deleted
+subscription, every API process drops that user's cached entitlements on it.
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'f311e361e253'
+down_revision: Union[str, Sequence[str], None] = '2689af43d1ce'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    # Statement level, with one NOTIFY per distinct user however many rows the statement changed.
+    # Transition tables cannot be shared by triggers on several events, hence one trigger per event.
+    op.execute("""
+        CREATE FUNCTION subscriptions_notify() RETURNS trigger AS $$
+        BEGIN
+            IF TG_OP = 'INSERT' THEN
+                PERFORM pg_notify('subscriptions', user_id::text) FROM (SELECT DISTINCT user_id FROM new_rows) AS users;
+            ELSIF TG_OP = 'UPDATE' THEN
+                PERFORM pg_notify('subscriptions', user_id::text) FROM (
+                    SELECT user_id FROM new_rows UNION SELECT user_id FROM old_rows
+                ) AS users;
+            ELSE
+                PERFORM pg_notify('subscriptions', user_id::text) FROM (SELECT DISTINCT user_id FROM old_rows) AS users;
+            END IF;
+            RETURN NULL;
+        END;
+        $$ LANGUAGE plpgsql
+    """)
+    op.execute("""
+        CREATE TRIGGER subscriptions_notify_insert
+        AFTER INSERT ON subscriptions
+        REFERENCING NEW TABLE AS new_rows
+        FOR EACH STATEMENT
+        EXECUTE FUNCTION subscriptions_notify()
+    """)
+    op.execute("""
+        CREATE TRIGGER subscriptions_notify_update
+        AFTER UPDATE ON subscriptions
+        REFERENCING OLD TABLE AS old_rows NEW TABLE AS new_rows
+        FOR EACH STATEMENT
+        EXECUTE FUNCTION subscriptions_notify()
+    """)
+    op.execute("""
+        CREATE TRIGGER subscriptions_notify_delete
+        AFTER DELETE ON subscriptions
+        REFERENCING OLD TABLE AS old_rows
+        FOR EACH STATEMENT
+        EXECUTE FUNCTION subscriptions_notify()
+    """)
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.execute("DROP TRIGGER subscriptions_notify_delete ON subscriptions")
+    op.execute("DROP TRIGGER subscriptions_notify_update ON subscriptions")
+    op.execute("DROP TRIGGER subscriptions_notify_insert ON subscriptions")
+    op.execute("DROP FUNCTION subscriptions_notify()")
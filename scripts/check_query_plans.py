@@ -0,0 +1,80 @@
+"""Fail when a hot endpoint query cannot use an index.
+
+Runs EXPLAIN for the lookups behind /auth/refresh, /auth/verify, /auth/reset-password, the
+User.sessions / User.notifications relationships, the /user/notifications pages / stream replay,
+the entitlements lookup and the outbox / job queue claims against the database configured through
+the usual DB_* environment variables (migrated to head). Sequential scans are disabled for the
+session, so a "Seq Scan" node left in a plan means no usable index exists for that query.
+
+Usage: python -m scripts.check_query_plans
+"""
+import json
+import sys
+from datetime import datetime, timezone
+from sqlalchemy import func, select, text
+from app.config.database import engine
+from app.models import EmailOutbox, Jobs, Notification, UserSession
+from app.schemas.auth import TokenData
+from app.utils.auth import (hash_refresh_token, reset_password_statement, rotate_refresh_token_statement,
+                            usable_verification_token_statement, verified_email_statement,
+                            verify_email_statement)
+from app.utils import notifications as notifications_util
+from app.utils.entitlements import active_subscription_statement
+
+
+HOT_QUERIES = {
+    "/auth/refresh rotation and reused token family revocation": rotate_refresh_token_statement(
+        TokenData(user_id="1", token_version=0), hash_refresh_token("token"), hash_refresh_token("new token"),
+        datetime.now(timezone.utc)),
+    "/auth/verify": verify_email_statement("token"),
+    "/auth/verify used link": verified_email_statement("token"),
+    "/auth/reset-password token check": usable_verification_token_statement("token", "password_reset"),
+    "/auth/reset-password": reset_password_statement("token", "password hash"),
+    "User.sessions": select(UserSession).filter(UserSession.user_id == 1),
+    "User.notifications": select(Notification).filter(Notification.user_id == 1),
+    "/user/notifications page": notifications_util.page_statement(1, 20, notifications_util.encode_cursor(
+        Notification(id=1, created_at=datetime.now(timezone.utc)))),
+    "/user/notifications/stream replay": notifications_util.since_statement(1, notifications_util.encode_cursor(
+        Notification(id=1, created_at=datetime.now(timezone.utc))), 100),
+    "/user/notifications unread page": notifications_util.page_statement(1, 20, unread_only=True),
+    "/user/notifications/read": notifications_util.mark_read_statement(1, [1, 2, 3]),
+    "/user/notifications/unread-count": notifications_util.unread_count_statement(1),
+    "require_feature / require_plan subscription": active_subscription_statement(1),
+    "email dispatcher claim": select(EmailOutbox.id).filter(
+        EmailOutbox.status == 'pending', EmailOutbox.next_attempt_at <= func.now()).order_by(
+        EmailOutbox.next_attempt_at).limit(100),
+    "job queue claim": select(Jobs.id).filter(
+        Jobs.queue == 'default', Jobs.status.in_(('queued', 'running')), Jobs.run_at <= func.now()).order_by(
+        Jobs.priority.desc(), Jobs.run_at).limit(10),
+}
+
+
+def _seq_scans(plan: dict):
+    nodes = [plan]
+    while nodes:
+        node = nodes.pop()
+        if node.get("Node Type") == "Seq Scan":
+            yield node.get("Relation Name")
+        nodes.extend(node.get("Plans", []))
+
+
+def main():
+    failures = []
+    with engine.connect() as conn:
+        conn.execute(text("SET enable_seqscan = off"))
+        for name, query in HOT_QUERIES.items():
+            compiled = query.compile(engine, compile_kwargs={"render_postcompile": True})
+            plan = conn.exec_driver_sql(f"EXPLAIN (FORMAT JSON) {compiled}", compiled.params).scalar()
+            if isinstance(plan, str):
+                plan = json.loads(plan)
+            tables = list(_seq_scans(plan[0]["Plan"]))
+            print(f"{'SEQ SCAN' if tables else 'ok':8} {name}")
+            if tables:
+                failures.append((name, tables))
+    for name, tables in failures:
+        print(f"{name} falls back to a sequential scan on {', '.join(tables)}", file=sys.stderr)
+    return 1 if failures else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
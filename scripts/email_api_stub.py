@@ -0,0 +1,92 @@
+"""Local stand-in for the email provider's send and batch endpoints.
+
+Accepts the same JSON payloads as the provider and answers with its response format, so the outbox
+dispatcher can be exercised without sending real emails. Point the API at it with
+EMAIL_API_ENDPOINT=http://127.0.0.1:8025/api/send/1 and EMAIL_API_BATCH_ENDPOINT=http://127.0.0.1:8025/api/batch/1.
+--fail-rate rejects that fraction of the emails, --status makes every request fail with the given HTTP status
+and --delay simulates a slow provider.
+
+Usage: python -m scripts.email_api_stub [--port 8025] [--fail-rate 0.1] [--status 503] [--delay 0.5]
+"""
+import argparse
+import json
+import random
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+
+received = []
+received_lock = threading.Lock()
+
+
+def make_handler(fail_rate: float, status: int, delay: float):
+    class Handler(BaseHTTPRequestHandler):
+        def _reply(self, code: int, body: dict):
+            data = json.dumps(body).encode()
+            self.send_response(code)
+            self.send_header("Content-Type", "application/json")
+            self.send_header("Content-Length", str(len(data)))
+            self.end_headers()
+            self.wfile.write(data)
+
+        def _accept(self, message: dict):
+            if random.random() < fail_rate:
+                return {"success": False, "errors": ["Rejected by email_api_stub"]}
+            with received_lock:
+                received.append(message)
+            return {"success": True, "message_ids": [f"stub-{len(received)}"]}
+
+        def do_POST(self):
+            payload = json.loads(self.rfile.read(int(self.headers.get("Content-Length", 0))) or b"{}")
+            if delay:
+                time.sleep(delay)
+            if status:
+                return self._reply(status, {"success": False, "errors": [f"Forced HTTP {status}"]})
+            if self.path.startswith("/api/batch"):
+                base = payload.get("base", {})
+                responses = [self._accept({**base, **request}) for request in payload.get("requests", [])]
+                return self._reply(200, {"success": True, "responses": responses})
+            if self.path.startswith("/api/send"):
+                result = self._accept(payload)
+                return self._reply(200 if result["success"] else 400, result)
+            self._reply(404, {"success": False, "errors": ["Not found"]})
+
+        def do_GET(self):
+            # Emails accepted so far, handy to assert on from a test
+            with received_lock:
+                self._reply(200, {"count": len(received), "emails": received})
+
+        def log_message(self, format, *args):
+            pass
+
+    return Handler
+
+
+def serve(host: str = "127.0.0.1", port: int = 8025, fail_rate: float = 0.0, status: int = 0, delay: float = 0.0):
+    server = ThreadingHTTPServer((host, port), make_handler(fail_rate, status, delay))
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    return server
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Serve a local stub of the email API.")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8025)
+    parser.add_argument("--fail-rate", type=float, default=0.0)
+    parser.add_argument("--status", type=int, default=0)
+    parser.add_argument("--delay", type=float, default=0.0)
+    args = parser.parse_args()
+
+    server = serve(args.host, args.port, args.fail_rate, args.status, args.delay)
+    print(f"Email API stub listening on http://{args.host}:{server.server_port}")
+    try:
+        while True:
+            time.sleep(3600)
+    except KeyboardInterrupt:
+        server.shutdown()
+
+
+if __name__ == "__main__":
+    main()
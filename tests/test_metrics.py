@@ -0,0 +1,39 @@
+"""Metrics of several server workers merged through a shared directory, see app.utils.metrics."""
+from app.utils.metrics import Counter, Family, Gauge, Histogram, Registry, clear_snapshots, mark_process_dead
+import json
+import os
+
+
+def worker_registry(requests: int, in_flight: int):
+    registry = Registry()
+    registry.register(Family("requests_total", "Requests.", Counter, ("route",))).labels("/a").inc(requests)
+    latency = registry.register(Family("request_seconds", "Latency.", Histogram, ("route",), buckets=(0.1, 1)))
+    for _ in range(requests):
+        latency.labels("/a").observe(0.5)
+    registry.register(Family("in_flight", "In flight.", Gauge, callback=lambda: in_flight))
+    return registry
+
+
+# Snapshot of another worker, written as it would be by that worker
+def write_worker(directory, pid: int, registry: Registry):
+    (directory / f"{pid}.json").write_text(json.dumps({"pid": pid, "live": True, "families": registry.collect()}))
+
+
+def test_single_process():
+    output = worker_registry(2, 1).render()
+    assert 'requests_total{route="/a"} 2' in output
+    assert "in_flight 1" in output
+
+
+# Counters and histograms are summed across the workers, dead ones included, gauges reported per live worker
+def test_workers_merged(tmp_path):
+    clear_snapshots(str(tmp_path))
+    write_worker(tmp_path, 1, worker_registry(3, 5))
+    write_worker(tmp_path, 2, worker_registry(4, 6))
+    mark_process_dead(str(tmp_path), 2)
+    output = worker_registry(2, 1).render(str(tmp_path))
+    assert 'requests_total{route="/a"} 9' in output
+    assert 'request_seconds_bucket{route="/a",le="1"} 9' in output
+    assert 'in_flight{worker="1"} 5' in output
+    assert 'worker="2"' not in output
+    assert {path.name for path in tmp_path.glob("*.json")} == {"1.json", f"{os.getpid()}.json", "dead.json"}
@@ -0,0 +1,131 @@
+"""Statements run by the endpoints against the budgets their routes declare with @query_budget."""
+import uuid
+import pytest
+
+
+# Authenticated read endpoints, checked for a user with a profile, a subscription to a plan and a few notifications
+USER_ENDPOINTS = [
+    "/user/profile",
+    "/user/notifications",
+    "/user/notifications/unread-count",
+    "/user/entitlements",
+]
+
+
+# Headers of a throwaway verified user and its data, deleted afterwards
+@pytest.fixture
+def user_headers(database):
+    from app.models import Notification, Plan, Subscription, User, UserProfile
+    from app.utils.auth import create_access_token
+
+    with database.SessionLocal() as db:
+        plan = Plan(name="pro", description="Query budget test", price="0", features={"seats": 1})
+        user = User(email=f"query-budget-{uuid.uuid4().hex[:12]}@example.com", password="!", is_verified=True)
+        user.profile = UserProfile(full_name="Query Budget", country="Nowhere")
+        user.subscription = Subscription(plan=plan, status="active")
+        user.notifications = [Notification(message=f"Notification {i}") for i in range(5)]
+        db.add(user)
+        db.commit()
+        token = create_access_token(data={"user_id": str(user.id), "role": user.role, "is_verified": True,
+                                          "token_version": user.token_version})
+        try:
+            yield user.id, {"Authorization": f"Bearer {token}"}
+        finally:
+            db.delete(user)
+            db.delete(plan)
+            db.commit()
+
+
+# Email and password of a user registered by the test, deleted afterwards with its tokens and emails
+@pytest.fixture
+def registration(database):
+    from sqlalchemy import delete, select
+    from app.models import EmailOutbox, User, UserVerificationToken
+
+    email = f"query-budget-{uuid.uuid4().hex[:12]}@example.com"
+    yield email, uuid.uuid4().hex
+    with database.SessionLocal() as db:
+        user_id = db.scalar(select(User.id).where(User.email == email))
+        if user_id is not None:
+            db.execute(delete(UserVerificationToken).where(UserVerificationToken.user_id == user_id))
+            db.execute(delete(User).where(User.id == user_id))
+        db.execute(delete(EmailOutbox).where(EmailOutbox.recipient == email))
+        db.commit()
+
+
+# Latest unused verification token of the given type sent to the user
+def verification_token(database, email: str, type: str):
+    from sqlalchemy import select
+    from app.models import User, UserVerificationToken
+
+    with database.SessionLocal() as db:
+        return db.scalar(
+            select(UserVerificationToken.token)
+            .join(User, User.id == UserVerificationToken.user_id)
+            .where(User.email == email, UserVerificationToken.type == type, UserVerificationToken.is_used == False)
+            .order_by(UserVerificationToken.id.desc())
+            .limit(1)
+        )
+
+
+def test_plans(client, query_budget):
+    # The catalog is served from memory once loaded at startup
+    with query_budget("GET", "/plans", exact=True):
+        response = client.get("/plans")
+    assert response.status_code == 200
+
+
+# The user is created before the client starts, so that the catalog loaded at startup already has its plan, and
+# the user and entitlement caches are emptied first, so that budgets include their lookups
+@pytest.mark.parametrize("path", USER_ENDPOINTS)
+def test_user_endpoints(user_headers, client, query_budget, path):
+    from app.utils.entitlements import invalidate_entitlements
+    from app.utils.user_cache import invalidate_user
+
+    user_id, headers = user_headers
+    invalidate_user(user_id)
+    invalidate_entitlements(user_id)
+    with query_budget("GET", path, exact=True):
+        response = client.get(path, headers=headers)
+    assert response.status_code == 200
+
+
+# The write endpoints in order for a new user, exact wherever the path taken is the one the budget is set for
+def test_auth_flow(database, client, query_budget, registration):
+    email, password = registration
+    with query_budget("POST", "/auth/register", exact=True):
+        response = client.post("/auth/register", json={"email": email, "password": password})
+    assert response.status_code == 201
+
+    # A first opening of the link takes 1 statement, the budget is set by the same link opened again
+    token = verification_token(database, email, "new_signup")
+    with query_budget("GET", "/auth/verify"):
+        response = client.get("/auth/verify", params={"token": token})
+    assert response.status_code == 200
+    with query_budget("GET", "/auth/verify", exact=True):
+        response = client.get("/auth/verify", params={"token": token})
+    assert response.status_code == 200
+
+    with query_budget("POST", "/auth/login", exact=True):
+        response = client.post("/auth/login", data={"username": email, "password": password})
+    assert response.status_code == 200
+
+    with query_budget("POST", "/auth/refresh", exact=True):
+        response = client.post("/auth/refresh", json={"refresh_token": response.json()["refresh_token"]})
+    assert response.status_code == 200
+
+    with query_budget("POST", "/auth/forget-password", exact=True):
+        response = client.post("/auth/forget-password", json={"email": email})
+    assert response.status_code == 200
+
+    token = verification_token(database, email, "password_reset")
+    with query_budget("POST", "/auth/reset-password", exact=True):
+        response = client.post("/auth/reset-password", json={"token": token, "new_password": password})
+    assert response.status_code == 200
+
+
+# A link without its token is refused before any statement, it would otherwise match the tokens already used
+def test_verify_without_token(client, query_budget):
+    with query_budget(max_queries=0):
+        response = client.get("/auth/verify")
+    assert response.status_code == 400
@@ -0,0 +1,43 @@
+"""Rows purged by the reaper once past their retention window."""
+import uuid
+from datetime import timedelta
+import pytest
+
+
+# Recipient of the emails of a test, deleted afterwards with whatever the reaper left
+@pytest.fixture
+def recipient(database):
+    from sqlalchemy import delete
+    from app.models import EmailOutbox
+
+    recipient = f"reaper-{uuid.uuid4().hex[:12]}@example.com"
+    yield recipient
+    with database.SessionLocal() as db:
+        db.execute(delete(EmailOutbox).where(EmailOutbox.recipient == recipient))
+        db.commit()
+
+
+# Sent and dead lettered emails go once past the retention, pending ones are kept whatever their age
+def test_finished_emails_purged(database, recipient):
+    from sqlalchemy import func, select
+    from app.config.settings import get_settings
+    from app.models import EmailOutbox
+    from app.tasks.reaper import run_reaper
+
+    past_retention = func.now() - timedelta(hours=get_settings().email_outbox_retention_hours + 1)
+    emails = {
+        "old sent": ("sent", past_retention),
+        "old failed": ("failed", past_retention),
+        "old pending": ("pending", past_retention),
+        "recent sent": ("sent", func.now()),
+    }
+    with database.SessionLocal() as db:
+        db.add_all(EmailOutbox(recipient=recipient, subject=subject, body="Link", status=status,
+                               next_attempt_at=next_attempt_at)
+                   for subject, (status, next_attempt_at) in emails.items())
+        db.commit()
+
+    run_reaper()
+    with database.SessionLocal() as db:
+        kept = db.scalars(select(EmailOutbox.subject).where(EmailOutbox.recipient == recipient)).all()
+    assert sorted(kept) == ["old pending", "recent sent"]
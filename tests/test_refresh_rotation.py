@@ -0,0 +1,175 @@
+"""Refresh tokens are rotated exactly once, and reusing a rotated token revokes its login once past the grace."""
+import threading
+import uuid
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
+from datetime import timedelta
+import pytest
+
+
+# Beyond the connections of the pool (15 by default) and the AnyIO threadpool (40), the calls wait for their turn
+# and still race for the token once they get one, all well within the pool timeout
+CONCURRENCY = 100
+
+
+# Refresh tokens of two logins of a throwaway user, deleted afterwards with its sessions
+@pytest.fixture
+def logins(database):
+    from app.models import User, UserSession
+    from app.utils.auth import create_refresh_token, hash_refresh_token
+
+    with database.SessionLocal() as db:
+        user = User(email=f"refresh-rotation-{uuid.uuid4().hex[:12]}@example.com", password="!", is_verified=True)
+        db.add(user)
+        db.flush()
+        tokens = []
+        for _ in range(2):
+            token, expiry = create_refresh_token(data={"user_id": str(user.id), "token_version": user.token_version})
+            db.add(UserSession(user_id=user.id, refresh_token_hash=hash_refresh_token(token),
+                               refresh_token_expiry=expiry))
+            tokens.append(token)
+        db.commit()
+        try:
+            yield user.id, tokens
+        finally:
+            db.delete(user)
+            db.commit()
+
+
+def refresh(client, token: str):
+    return client.post("/auth/refresh", json={"refresh_token": token})
+
+
+# Sends the same refresh from CONCURRENCY threads released together
+def refresh_concurrently(client, token: str):
+    barrier = threading.Barrier(CONCURRENCY)
+
+    def call(_):
+        barrier.wait()
+        return refresh(client, token)
+
+    with ThreadPoolExecutor(max_workers=CONCURRENCY) as executor:
+        return list(executor.map(call, range(CONCURRENCY)))
+
+
+# Records the peak number of statements executing at once on the engine during the block
+@contextmanager
+def overlapping_statements(database):
+    from sqlalchemy import event
+
+    lock = threading.Lock()
+    counts = {"running": 0, "peak": 0}
+
+    def before(*args):
+        with lock:
+            counts["running"] += 1
+            counts["peak"] = max(counts["peak"], counts["running"])
+
+    def after(*args):
+        with lock:
+            counts["running"] -= 1
+
+    event.listen(database.engine, "before_cursor_execute", before)
+    event.listen(database.engine, "after_cursor_execute", after)
+    try:
+        yield counts
+    finally:
+        event.remove(database.engine, "before_cursor_execute", before)
+        event.remove(database.engine, "after_cursor_execute", after)
+
+
+# Moves the rotations (and with created_at, the creation) of the user's sessions back by the given delay
+def age_sessions(database, user_id: int, delay: timedelta, created_at: bool = False):
+    from sqlalchemy import update
+    from app.models import UserSession
+
+    values = {"rotated_at": UserSession.rotated_at - delay}
+    if created_at:
+        values["created_at"] = UserSession.created_at - delay
+    with database.SessionLocal() as db:
+        db.execute(update(UserSession).where(UserSession.user_id == user_id).values(**values))
+        db.commit()
+
+
+def count_sessions(database, *where):
+    from sqlalchemy import func, select
+    from app.models import UserSession
+
+    with database.SessionLocal() as db:
+        return db.scalar(select(func.count()).select_from(UserSession).where(*where))
+
+
+def active_sessions(database, user_id: int):
+    from app.models import UserSession
+
+    return count_sessions(database, UserSession.user_id == user_id, UserSession.refresh_token_hash.is_not(None))
+
+
+def past_grace():
+    from app.config.settings import get_settings
+
+    return timedelta(seconds=get_settings().refresh_token_reuse_grace_seconds + 1)
+
+
+def test_rotation(logins, client, query_budget):
+    _, (token, _) = logins
+    with query_budget("POST", "/auth/refresh", exact=True):
+        response = refresh(client, token)
+    assert response.status_code == 200
+    assert response.json()["refresh_token"] != token
+
+
+# Exactly one of the concurrent refreshes succeeds and stores a single successor session
+def test_concurrent_rotations(database, logins, client):
+    from app.models import UserSession
+    from app.utils.auth import hash_refresh_token
+
+    user_id, (token, _) = logins
+    rotated = refresh(client, token).json()["refresh_token"]
+    with overlapping_statements(database) as statements:
+        responses = refresh_concurrently(client, rotated)
+    # The rotations raced in the database, rather than running one after the other
+    assert statements["peak"] > 1
+    assert Counter(response.status_code for response in responses) == {200: 1, 401: CONCURRENCY - 1}
+    assert count_sessions(database, UserSession.rotated_token_hash == hash_refresh_token(rotated)) == 1
+    assert count_sessions(database, UserSession.user_id == user_id, UserSession.family_id.is_not(None)) == 2
+
+
+# Within the grace, the losers of a race are refused without logging the winner out
+def test_reuse_within_grace(settings, logins, client):
+    settings(refresh_token_reuse_grace_seconds=30)
+    _, (token, _) = logins
+    rotated = refresh(client, token).json()["refresh_token"]
+    latest = refresh(client, rotated).json()["refresh_token"]
+    assert refresh(client, rotated).status_code == 401
+    assert refresh(client, latest).status_code == 200
+
+
+# Past the grace, the replay revokes every session of its login (the successors included) but not the other login
+def test_reuse_revokes_family(database, logins, client, query_budget):
+    user_id, (token, other_token) = logins
+    rotated = refresh(client, token).json()["refresh_token"]
+    latest = refresh(client, rotated).json()["refresh_token"]
+    age_sessions(database, user_id, past_grace())
+    with query_budget("POST", "/auth/refresh", exact=True):
+        response = refresh(client, rotated)
+    assert response.status_code == 401
+    assert refresh(client, latest).status_code == 401
+    assert active_sessions(database, user_id) == 1
+    assert refresh(client, other_token).status_code == 200
+
+
+# Rotated sessions are kept by the reaper for as long as their token is valid, so a late replay is still caught
+def test_reuse_after_retention(database, logins, client):
+    from app.config.settings import get_settings
+    from app.tasks.reaper import run_reaper
+
+    user_id, tokens = logins
+    rotated = [refresh(client, token).json()["refresh_token"] for token in tokens]
+    age_sessions(database, user_id, past_grace() + timedelta(hours=get_settings().session_retention_hours),
+                 created_at=True)
+    run_reaper()
+    assert refresh(client, tokens[0]).status_code == 401
+    assert active_sessions(database, user_id) == 1
+    assert refresh(client, rotated[1]).status_code == 200